@@ -0,0 +1,111 @@
+"""
+Tilt and trunk width vs. speed of mask_analysis.analyze_mask at several
+analysis resolutions, against the same analysis at full resolution, on
+segmented cutouts. With --unity the tree masks keyed out of the Unity
+renders are used instead and the tilt error against their known tilt is
+reported too; they are only about 500 px on the long side.
+
+Run from the repo root: python Benchmarks/bench_analysis_resolution.py "Segmented photos"
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import batch_runner
+import mask_analysis
+from downsample import get_analysis_scale
+from unity_dataset import load_unity_dataset, load_unity_mask, tilt_error
+
+
+def load_masks(source, unity):
+    """[(name, 0/255 mask, true tilt or None), ...] of the cutouts in source, or of the Unity renders."""
+    if unity:
+        return [(Path(path).name, load_unity_mask(path), true_tilt) for path, _, true_tilt in load_unity_dataset()]
+    paths = [path for path in batch_runner.collect_images(source) if batch_runner.resolve_mask(path) == path]
+    return [(Path(path).name, mask_analysis.load_cutout(path)[0], None) for path in paths]
+
+
+def analyze(mask, analysis_long_side):
+    """
+    ((tilt, median trunk width in original pixels, trunk_start, trunk_end),
+    seconds), with None instead of the tuple when no trunk is found.
+    """
+    start = time.perf_counter()
+    try:
+        result = mask_analysis.analyze_mask(mask, analysis_long_side=analysis_long_side)
+    except ValueError:
+        return None, time.perf_counter() - start
+    seconds = time.perf_counter() - start
+    # The band's half widths are at the analysis resolution
+    scale = get_analysis_scale(mask.shape[0], mask.shape[1], analysis_long_side)
+    half_widths = result["width"]["half_widths"]
+    width = 2 * float(np.median(half_widths[half_widths > 0])) / scale if (half_widths > 0).any() else 0.0
+    return (result["tilt"], width, result["trunk_start"], result["trunk_end"]), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", nargs="?", default=str(base_dir / "Segmented photos"),
+                        help="Directory or glob pattern of cutouts (*_crop_out.png)")
+    parser.add_argument("--unity", action="store_true", help="Use the Unity renders' tree masks instead")
+    parser.add_argument("--long-sides", type=int, nargs="+", default=[1024, 768, 512, 384, 256],
+                        help="Analysis resolutions to compare against full resolution")
+    args = parser.parse_args()
+
+    masks = load_masks(args.source, args.unity)
+    if not masks:
+        print(f"No cutouts found in {args.source}")
+        return 1
+    long_sides = [max(mask.shape) for _, mask, _ in masks]
+    print(f"{len(masks)} {'Unity masks' if args.unity else 'cutouts'}, "
+          f"{min(long_sides)}-{max(long_sides)} px on the long side\n")
+
+    full = [analyze(mask, None) for _, mask, _ in masks]
+    full_ms = np.mean([seconds for _, seconds in full]) * 1000
+
+    results = {None: full}
+    print(f"{'long side':>10s} {'tilt diff max':>13s} {'mean':>6s} {'width diff max':>14s} {'mean':>6s} "
+          f"{'band rows':>9s} {'MAE deg':>8s} {'ms/img':>7s} {'speedup':>8s} {'failed':>7s}")
+    for long_side in [None] + args.long_sides:
+        rows = full if long_side is None else [analyze(mask, long_side) for _, mask, _ in masks]
+        results[long_side] = rows
+        tilt_diffs, width_diffs, band_diffs, errors = [], [], [], []
+        failures = 0
+        for (_, _, true_tilt), (reference, _), (result, _) in zip(masks, full, rows):
+            if result is None:
+                failures += 1
+                continue
+            if true_tilt is not None:
+                errors.append(tilt_error(result[0], true_tilt))
+            if reference is None:
+                continue
+            tilt_diffs.append(abs(result[0] - reference[0]))
+            if reference[1] > 0:
+                width_diffs.append(abs(result[1] - reference[1]) / reference[1] * 100)
+            band_diffs.append(max(abs(result[2] - reference[2]), abs(result[3] - reference[3])))
+        ms = np.mean([seconds for _, seconds in rows]) * 1000
+        name = "full" if long_side is None else str(long_side)
+        mae = f"{np.mean(errors):8.2f}" if errors else f"{'-':>8s}"
+        print(f"{name:>10s} {max(tilt_diffs, default=0):12.2f}° {np.mean(tilt_diffs or [0]):5.2f}° "
+              f"{max(width_diffs, default=0):13.1f}% {np.mean(width_diffs or [0]):5.1f}% "
+              f"{max(band_diffs, default=0):9d} {mae} {ms:7.1f} {full_ms / ms:7.2f}x {failures:7d}")
+    print("\nDifferences are against full resolution: tilt in degrees, median trunk width in percent, "
+          "band rows as the largest move of the trunk band's start or end (original pixels)")
+
+    print(f"\nTilt per {'mask' if args.unity else 'cutout'}:")
+    print(f"{'':28s}" + "".join(f"{'full' if side is None else side:>8}" for side in results))
+    for i, (name, _, _) in enumerate(masks):
+        tilts = [rows[i][0] for rows in results.values()]
+        print(f"{name[:28]:28s}" + "".join(f"{'-':>8s}" if result is None else f"{result[0]:8.2f}"
+                                           for result in tilts))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
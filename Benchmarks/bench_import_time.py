@@ -0,0 +1,103 @@
+"""
+Import time of each pipeline entry point in a fresh interpreter, against a
+budget, and which heavy dependencies importing it pulls in. Analyzing
+already segmented masks shouldn't pay for torch, matplotlib, scipy or
+sklearn; SAM2 loads torch only when a model is needed.
+
+Exits with 1 when an entry point is over its budget.
+
+Run from the repo root: python Benchmarks/bench_import_time.py
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+base_dir = Path(__file__).resolve().parent.parent
+pipelines_dir = base_dir / "Pipelines"
+
+# Seconds to import each entry point, on top of starting the interpreter
+BUDGETS = {
+    "mask_analysis": 0.5,
+    "batch_runner": 0.5,
+    "tree_session": 0.5,
+    "tree_history": 0.5,
+    "tilt_detection2": 0.5,
+    "sam2_segmentation": 0.5,
+    "sam2_service": 0.5,
+}
+
+HEAVY_MODULES = ("torch", "matplotlib", "scipy", "sklearn", "skimage")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeats):
+    """Median import seconds over fresh interpreters, and the heavy modules loaded."""
+    runs = []
+    heavy = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=pipelines_dir, capture_output=True, text=True,
+        )
+        if output.returncode != 0:
+            return None, output.stderr.strip().splitlines()[-1]
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        runs.append(result["seconds"])
+        heavy = result["heavy"]
+    return statistics.median(runs), heavy
+
+
+def slowest_imports(module, top):
+    """The top slowest imports (cumulative) under module, from python -X importtime."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=pipelines_dir, capture_output=True, text=True,
+    )
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time: self [us] | cumulative | imported package
+        _, cumulative_us, name = line.split("|")
+        rows.append((int(cumulative_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget of each pipeline entry point.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per entry point")
+    parser.add_argument("--detail", default=None, help="Also list the slowest imports of this entry point")
+    args = parser.parse_args(argv)
+
+    print(f"{'entry point':20s} {'import s':>9s} {'budget':>7s}  heavy dependencies")
+    over = 0
+    for module, budget in BUDGETS.items():
+        seconds, heavy = measure(module, args.repeats)
+        if seconds is None:
+            print(f"{module:20s} {'-':>9s} {budget:7.2f}  import failed: {heavy}")
+            over += 1
+            continue
+        status = "" if seconds <= budget else "  OVER BUDGET"
+        over += seconds > budget
+        print(f"{module:20s} {seconds:9.3f} {budget:7.2f}  {', '.join(heavy) or '-'}{status}")
+
+    if args.detail:
+        print(f"\nSlowest imports under {args.detail}:")
+        for cumulative_us, name in slowest_imports(args.detail, 10):
+            print(f"{cumulative_us / 1000:9.1f} ms  {name}")
+
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
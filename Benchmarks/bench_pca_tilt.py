@@ -0,0 +1,116 @@
+"""
+Principal-axis tilt from image moments (tilt_detection2.principal_axis) vs
+the sklearn PCA fit over every foreground pixel it replaced, on segmented
+cutouts (or with --unity the tree masks keyed out of the Unity renders).
+Reports how far each sampling step moves the angle, time and peak memory
+per image.
+
+Run from the repo root: python Benchmarks/bench_pca_tilt.py "Segmented photos"
+"""
+import argparse
+import math
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import batch_runner
+import mask_analysis
+import tilt_detection2
+from unity_dataset import load_unity_dataset, load_unity_mask
+
+
+def angle_from_vertical(pc1):
+    return math.degrees(math.acos(np.clip(np.dot(pc1, [0, -1]), -1.0, 1.0)))
+
+
+def sklearn_axis(binary_mask):
+    from sklearn.decomposition import PCA
+
+    ys, xs = np.where(binary_mask == 1)
+    pca = PCA(n_components=2)
+    pca.fit(np.column_stack((xs, ys)))
+    pc1 = pca.components_[0]
+    return pc1 / np.linalg.norm(pc1)
+
+
+def moments_axis(sample_step):
+    return lambda binary_mask: tilt_detection2.principal_axis(binary_mask, sample_step)[1]
+
+
+def measure(axis_fn, binary_mask):
+    """Returns (angle, seconds, peak_bytes)."""
+    start = time.perf_counter()
+    angle = angle_from_vertical(axis_fn(binary_mask))
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    axis_fn(binary_mask)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return angle, seconds, peak
+
+
+def load_masks(source, unity):
+    """[(name, boolean mask), ...] of the cutouts in source, or of the Unity renders."""
+    if unity:
+        return [(Path(path).name, load_unity_mask(path) > 0) for path, _, _ in load_unity_dataset()]
+    paths = [path for path in batch_runner.collect_images(source) if batch_runner.resolve_mask(path) == path]
+    return [(Path(path).name, mask_analysis.load_cutout(path)[0] > 0) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", nargs="?", default=str(base_dir / "Segmented photos"),
+                        help="Directory or glob pattern of cutouts (*_crop_out.png)")
+    parser.add_argument("--unity", action="store_true", help="Use the Unity renders' tree masks instead")
+    parser.add_argument("--steps", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Sampling steps to compare")
+    args = parser.parse_args()
+
+    methods = {}
+    try:
+        import sklearn  # noqa: F401
+        methods["sklearn PCA"] = sklearn_axis
+    except ImportError:
+        print("sklearn not installed, comparing moment steps against step 1 only\n")
+    for step in args.steps:
+        methods[f"moments step {step}"] = moments_axis(step)
+    reference = next(iter(methods))
+
+    masks = load_masks(args.source, args.unity)
+    if not masks:
+        print(f"No cutouts found in {args.source}")
+        return 1
+    print(f"{len(masks)} {'Unity masks' if args.unity else 'cutouts'}, reference: {reference}\n")
+
+    stats = {name: {"diff": [], "seconds": [], "peak": []} for name in methods}
+    for _, binary_mask in masks:
+        binary_mask = binary_mask.astype(np.uint8)
+        reference_angle = None
+        for name, axis_fn in methods.items():
+            angle, seconds, peak = measure(axis_fn, binary_mask)
+            if reference_angle is None:
+                reference_angle = angle
+            # 179 and 1 degree are the same axis
+            difference = abs(angle - reference_angle)
+            stats[name]["diff"].append(min(difference, 180 - difference))
+            stats[name]["seconds"].append(seconds)
+            stats[name]["peak"].append(peak)
+
+    reference_ms = np.mean(stats[reference]["seconds"]) * 1000
+    print(f"{'method':18s} {'max diff deg':>12s} {'mean diff':>10s} {'ms/img':>7s} {'speedup':>8s} {'peak MB':>8s}")
+    for name, s in stats.items():
+        ms = np.mean(s["seconds"]) * 1000
+        print(f"{name:18s} {max(s['diff']):12.4f} {np.mean(s['diff']):10.4f} {ms:7.2f} {reference_ms / ms:7.1f}x "
+              f"{max(s['peak']) / 2**20:8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Serial batch runs (batch_runner.run_batch with one worker) at several
+prefetch depths. Depth 0 decodes every cutout when it is needed; deeper
+settings decode the next ones on a background thread while the current one
+is analyzed. Reports images per second and how much of the decode time was
+hidden behind the analysis. Needs at least two cores to show a speedup.
+
+Run from the repo root: python Benchmarks/bench_prefetch.py "Segmented photos"
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import batch_runner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch throughput at several prefetch depths.")
+    parser.add_argument("source", help="Directory or glob pattern of cutouts (*_crop_out.png)")
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=3, help="Best of this many runs per depth")
+    args = parser.parse_args(argv)
+
+    images = batch_runner.collect_images(args.source)
+    if not images:
+        print(f"No images found in {args.source}")
+        return 1
+
+    print(f"{len(images)} images, {os.cpu_count()} cores")
+    print(f"{'depth':>5s} {'images/s':>9s} {'decode s':>9s} {'analysis s':>11s} {'wait s':>7s} {'overlap':>8s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "results.jsonl")
+        for depth in args.depths:
+            best = None
+            for _ in range(args.repeats):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    summary = batch_runner.run_batch(images, output_path, workers=1, prefetch_depth=depth)
+                if best is None or summary["images_per_sec"] > best["images_per_sec"]:
+                    best = summary
+            stats = best["prefetch"]
+            print(f"{depth:5d} {best['images_per_sec']:9.2f} {stats['load_seconds']:9.2f} "
+                  f"{stats['compute_seconds']:11.2f} {stats['wait_seconds']:7.2f} {stats['overlap']:8.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Vectorized risk scoring (risk_score.score_risk) vs calling give_risk_score
+and get_risk_category once per record, as rescoring an archive did before.
+Reports records per second for both and checks they agree on every score
+and category.
+
+Run from the repo root: python Benchmarks/bench_risk_scoring.py
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import risk_score
+
+
+def make_records(count, seed=0):
+    """Tilts of 0-45° either way and 0-60 trunk lines, a tenth with no line count."""
+    rng = np.random.default_rng(seed)
+    tilts = rng.uniform(-45, 45, count)
+    lines = rng.integers(0, 60, count).astype(float)
+    lines[rng.random(count) < 0.1] = np.nan
+    return tilts, lines
+
+
+def scalar_path(tilts, lines):
+    scores, categories = [], []
+    for tilt, line_count in zip(tilts.tolist(), lines.tolist()):
+        score = risk_score.give_risk_score(tilt, None if line_count != line_count else int(line_count))
+        scores.append(score)
+        categories.append(risk_score.get_risk_category(score)[0])
+    return np.array(scores), np.array(categories)
+
+
+def vector_path(tilts, lines):
+    scores, categories, _ = risk_score.score_risk(tilts, lines)
+    return scores, categories
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scalar vs vectorized risk scoring.")
+    parser.add_argument("-n", "--records", type=int, default=300_000)
+    parser.add_argument("--repeats", type=int, default=3, help="Best of this many runs per path")
+    args = parser.parse_args(argv)
+
+    tilts, lines = make_records(args.records)
+    results = {}
+    print(f"{args.records} records")
+    print(f"{'path':8s} {'seconds':>9s} {'records/s':>12s}")
+    for name, path in (("scalar", scalar_path), ("vector", vector_path)):
+        best = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            results[name] = path(tilts, lines)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:8s} {best:9.3f} {args.records / best:12,.0f}")
+
+    score_mismatches = int((results["scalar"][0] != results["vector"][0]).sum())
+    category_mismatches = int((results["scalar"][1] != results["vector"][1]).sum())
+    print(f"\nMismatches: {score_mismatches} scores, {category_mismatches} categories")
+    return 1 if score_mismatches or category_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Encode time and mask agreement of the SAM2 encoder profiles on CPU.
+
+Every profile (and its int8-quantized encoder with --quantize) segments the
+same photos with the same prompts. Masks are compared with the large model's
+by IoU, so the latency/accuracy tradeoff of each profile can be read off one
+table. Profiles whose checkpoint isn't downloaded are skipped.
+
+Photos use their <photo>.prompts.json/.csv sidecar when there is one, and a
+single point in the middle of the photo otherwise.
+
+Run from the repo root:
+    python Benchmarks/bench_sam2_profiles.py "2025-26_Data_Images/11-1-2025/*.jpg" --quantize --threads 4
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import torch
+import sam2_segmentation
+
+REFERENCE_PROFILE = "large"
+
+
+def load_prompts(image_path, image_np):
+    prompt_path = sam2_segmentation.find_prompt_sidecar(image_path)
+    if prompt_path is not None:
+        return sam2_segmentation.load_prompt_sets(prompt_path)
+    h, w = image_np.shape[:2]
+    return [{"points": [[w / 2, h / 2]], "labels": [1]}]
+
+
+def iou(mask_a, mask_b):
+    union = np.logical_or(mask_a, mask_b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(mask_a, mask_b).sum() / union)
+
+
+def run_profile(profile, quantize, images):
+    """Returns (load_seconds, [encode_seconds], [[mask per prompt set] per image])."""
+    start = time.perf_counter()
+    predictor = sam2_segmentation.build_predictor(profile, quantize)
+    load_seconds = time.perf_counter() - start
+
+    encode_seconds = []
+    masks = []
+    for image_np, prompt_sets in images:
+        encode_seconds.append(sam2_segmentation.encode_image(predictor, image_np))
+        results = sam2_segmentation.predict_prompt_sets(predictor, prompt_sets)
+        masks.append([result["mask"] for result in results])
+    return load_seconds, encode_seconds, masks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Photos or glob patterns")
+    parser.add_argument("--profiles", nargs="+", choices=list(sam2_segmentation.ENCODER_PROFILES),
+                        default=list(sam2_segmentation.ENCODER_PROFILES))
+    parser.add_argument("--quantize", action="store_true", help="Also run every profile with an int8 encoder")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    paths = sorted({path for pattern in args.images for path in glob.glob(pattern)})
+    if not paths:
+        print("No images found")
+        return 1
+    images = []
+    for path in paths:
+        image_np = np.array(Image.open(path).convert("RGB"))
+        images.append((image_np, load_prompts(path, image_np)))
+    print(f"{len(images)} photos, {torch.get_num_threads()} torch threads\n")
+
+    variants = [(profile, False) for profile in args.profiles]
+    if args.quantize:
+        variants += [(profile, True) for profile in args.profiles]
+    # The reference masks are needed before anything can be compared
+    if (REFERENCE_PROFILE, False) in variants:
+        variants.remove((REFERENCE_PROFILE, False))
+    variants.insert(0, (REFERENCE_PROFILE, False))
+
+    reference_masks = None
+    rows = []
+    for profile, quantize in variants:
+        checkpoint_path, _ = sam2_segmentation.get_profile_paths(profile)
+        if not os.path.exists(checkpoint_path):
+            print(f"SKIP {profile}: {checkpoint_path} not downloaded")
+            continue
+
+        name = profile + (" int8" if quantize else "")
+        print(f"Running {name}...")
+        load_seconds, encode_seconds, masks = run_profile(profile, quantize, images)
+        if reference_masks is None and profile == REFERENCE_PROFILE and not quantize:
+            reference_masks = masks
+
+        ious = None
+        if reference_masks is not None:
+            ious = [iou(mask, reference)
+                    for image_masks, image_reference in zip(masks, reference_masks)
+                    for mask, reference in zip(image_masks, image_reference)]
+        rows.append((name, load_seconds, np.mean(encode_seconds), ious))
+
+    if not rows:
+        return 1
+
+    print(f"\n{'profile':16s} {'load s':>7s} {'encode s':>9s} {'speedup':>8s} {'mean IoU':>9s} {'min IoU':>8s}")
+    slowest = rows[0][2]
+    for name, load_seconds, encode_mean, ious in rows:
+        mean_iou = f"{np.mean(ious):9.3f}" if ious else f"{'-':>9s}"
+        min_iou = f"{np.min(ious):8.3f}" if ious else f"{'-':>8s}"
+        print(f"{name:16s} {load_seconds:7.2f} {encode_mean:9.2f} {slowest / encode_mean:7.2f}x {mean_iou} {min_iou}")
+    if reference_masks is None:
+        print(f"\n{REFERENCE_PROFILE} checkpoint missing, IoU not computed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Microbenchmark: per-line Python loop vs. the vectorized filter_trunk_lines
+used by tilt_detection.detect_tree_tilt, on the Segmented photos masks.
+
+Run from the repo root: python Benchmarks/bench_tilt_filter.py
+"""
+import argparse
+import glob
+import math
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import tilt_detection
+
+
+def filter_lines_loop(lines, height, width):
+    """The original per-line implementation, kept as the reference."""
+    bottom_y = height - 1
+    center_x = width / 2
+    intersections = []
+    for x1, y1, x2, y2 in lines.reshape(-1, 4):
+        dx = x2 - x1
+        dy = y2 - y1
+        if dx == 0:
+            angle_from_horizontal = 90
+        else:
+            angle_from_horizontal = abs(math.degrees(math.atan2(dy, dx)))
+        if angle_from_horizontal > 30 and dy != 0:
+            x_at_bottom = x1 + dx / dy * (bottom_y - y1)
+            intersections.append((x_at_bottom, x_at_bottom - center_x, math.sqrt(dx**2 + dy**2)))
+    total_weight = sum(i[2] for i in intersections)
+    return sum(i[0] * i[2] for i in intersections) / total_weight, len(intersections)
+
+
+def filter_lines_vectorized(lines, height, width):
+    trunk_lines, x_at_bottom, line_lengths = tilt_detection.filter_trunk_lines(lines, height)
+    return float(np.dot(x_at_bottom, line_lengths) / line_lengths.sum()), len(trunk_lines)
+
+
+def hough_lines(mask_path):
+    """Same binarization and Hough parameters as detect_tree_tilt."""
+    img = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
+    binary = (img[:, :, 3] > 127).astype(np.uint8) * 255
+    height, width = binary.shape
+    binary[:int(height * 0.5), :] = 0
+    lines = cv2.HoughLinesP(binary, 1, np.pi/180, threshold=30,
+                            minLineLength=max(30, int(height * 0.15)), maxLineGap=20)
+    return lines, height, width
+
+
+def time_call(fn, args, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn(*args)
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pattern", default=str(base_dir / "Segmented photos" / "*_crop_out.png"))
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'mask':40s} {'lines':>6s} {'loop ms':>9s} {'numpy ms':>9s} {'speedup':>8s}")
+    total_loop = total_vec = 0.0
+    for mask_path in sorted(glob.glob(args.pattern)):
+        lines, height, width = hough_lines(mask_path)
+        if lines is None:
+            continue
+
+        loop_s, (loop_x, loop_n) = time_call(filter_lines_loop, (lines, height, width), args.repeats)
+        vec_s, (vec_x, vec_n) = time_call(filter_lines_vectorized, (lines, height, width), args.repeats)
+        assert loop_n == vec_n and abs(loop_x - vec_x) < 1e-6, f"Mismatch on {mask_path}"
+
+        total_loop += loop_s
+        total_vec += vec_s
+        name = Path(mask_path).name
+        print(f"{name:40s} {len(lines.reshape(-1, 4)):6d} {loop_s * 1000:9.3f} {vec_s * 1000:9.3f} "
+              f"{loop_s / vec_s:7.1f}x")
+
+    if total_vec:
+        print(f"\nOverall speedup: {total_loop / total_vec:.1f}x (results identical)")
+
+
+if __name__ == "__main__":
+    main()
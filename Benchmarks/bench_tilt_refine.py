@@ -0,0 +1,94 @@
+"""
+Single-pass tilt detection (tilt_from_lines at full resolution) vs the
+coarse-to-fine refinement (tilt_detection.refine_tilt) on segmented
+cutouts. Reports the mean latency of both, the resolution every cutout
+stopped at, its fit score and how far its tilt is from the full-resolution
+one, and exits with 1 when any refined tilt is more than --tolerance
+degrees from it.
+
+Run from the repo root: python Benchmarks/bench_tilt_refine.py "Segmented photos"
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import batch_runner
+import mask_analysis
+import tilt_detection
+
+# Degrees a refined tilt may differ from the full-resolution one
+TOLERANCE = 0.5
+
+
+def best_time(func, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full-resolution vs coarse-to-fine tilt detection.")
+    parser.add_argument("source", help="Directory or glob pattern of cutouts (*_crop_out.png)")
+    parser.add_argument("--min-fit", type=float, default=tilt_detection.MIN_TILT_FIT)
+    parser.add_argument("--repeats", type=int, default=3, help="Best of this many runs per cutout")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Degrees a refined tilt may differ from the full-resolution one")
+    args = parser.parse_args(argv)
+
+    masks = [path for path in batch_runner.collect_images(args.source) if batch_runner.resolve_mask(path) == path]
+    if not masks:
+        print(f"No cutouts found in {args.source}")
+        return 1
+
+    print(f"{'cutout':28s} {'full ms':>8s} {'refine ms':>9s} {'level':>6s} {'fit':>5s} "
+          f"{'full tilt':>9s} {'refined':>8s} {'diff':>6s}")
+    total_full = total_refined = 0.0
+    differences = []
+    mismatched = []
+    for mask_path in masks:
+        mask, _ = mask_analysis.load_cutout(mask_path)
+        height, width = mask.shape
+        full, full_seconds = best_time(
+            lambda: tilt_detection.tilt_from_lines(mask, 1.0, height, width), args.repeats)
+        refined, refined_seconds = best_time(
+            lambda: tilt_detection.refine_tilt(mask, min_fit=args.min_fit), args.repeats)
+        total_full += full_seconds
+        total_refined += refined_seconds
+
+        name = Path(mask_path).name[:28]
+        if full is None or refined is None:
+            print(f"{name:28s} {full_seconds * 1000:8.1f} {refined_seconds * 1000:9.1f}  no trunk lines")
+            if (full is None) != (refined is None):
+                mismatched.append(name)
+            continue
+        result, fit, scale = refined
+        level = round(max(height, width) * scale)
+        difference = abs(result[0] - full[0])
+        differences.append(difference)
+        if difference > args.tolerance:
+            mismatched.append(name)
+        fit_text = "-" if fit is None else f"{fit:.2f}"
+        print(f"{name:28s} {full_seconds * 1000:8.1f} {refined_seconds * 1000:9.1f} {level:6d} {fit_text:>5s} "
+              f"{full[0]:9.2f} {result[0]:8.2f} {difference:6.2f}")
+
+    print(f"\nMean latency: {total_full / len(masks) * 1000:.1f} ms full resolution, "
+          f"{total_refined / len(masks) * 1000:.1f} ms coarse-to-fine")
+    if differences:
+        print(f"Refined vs full-resolution tilt: max {max(differences):.2f}°, mean {sum(differences) / len(differences):.2f}°")
+    if mismatched:
+        print(f"FAIL: {len(mismatched)} refined tilts differ from full resolution by more than "
+              f"{args.tolerance}°: {', '.join(mismatched)}")
+        return 1
+    print(f"OK: every refined tilt is within {args.tolerance}° of full resolution")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
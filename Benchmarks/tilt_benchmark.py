@@ -0,0 +1,195 @@
+"""
+Tilt accuracy and throughput benchmark over the Unity ground-truth renders.
+
+Runs tilt_detection.detect_tree_tilt (Hough) and tilt_detection2.analyze_tree
+(PCA) on the tree mask of every image and records per-image latency, peak
+memory and angle error. The renders are opaque, so the masks are keyed out
+of their background first (unity_dataset.load_unity_mask) and the time
+that takes is not counted. Results are saved as JSON; with --baseline the run fails (exit code 1)
+when latency or error regress past the given thresholds.
+
+Run from the repo root:
+    python Benchmarks/tilt_benchmark.py -o bench.json
+    python Benchmarks/tilt_benchmark.py -o new.json --baseline bench.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+base_dir = Path(__file__).resolve().parent.parent
+sys.path.append(str(base_dir / "Pipelines"))
+
+import tilt_detection
+import tilt_detection2
+from unity_dataset import load_unity_dataset, load_unity_mask, tilt_error
+
+
+def hough_tilt(mask, analysis_long_side):
+    result = tilt_detection.detect_tree_tilt(mask, quiet=True, analysis_long_side=analysis_long_side,
+                                             visualize=False)
+    return None if result is None else float(result[0])
+
+
+def pca_tilt(mask, analysis_long_side):
+    # analyze_tree measures the axis from straight up without fixing the axis
+    # direction, so 175 degrees and 5 degrees are the same lean
+    angle = tilt_detection2.analyze_tree(mask, analysis_long_side=analysis_long_side)
+    return float(min(angle, 180 - angle))
+
+
+ALGORITHMS = {
+    "hough": hough_tilt,
+    "pca": pca_tilt,
+}
+
+
+def measure(algorithm, mask, analysis_long_side, track_memory):
+    """Returns (estimated_tilt or None, seconds, peak_bytes or None)."""
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            estimated = algorithm(mask, analysis_long_side)
+    except Exception:
+        estimated = None
+    seconds = time.perf_counter() - start
+    peak = None
+    if track_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return estimated, seconds, peak
+
+
+def run_algorithm(name, samples, masks, analysis_long_side, track_memory):
+    algorithm = ALGORITHMS[name]
+    images = []
+    for (path, tree, true_tilt), mask in zip(samples, masks):
+        # Latency is timed without tracemalloc, which slows allocation down
+        estimated, seconds, _ = measure(algorithm, mask, analysis_long_side, track_memory=False)
+        peak = None
+        if track_memory:
+            _, _, peak = measure(algorithm, mask, analysis_long_side, track_memory=True)
+
+        images.append({
+            "image": os.path.relpath(path, base_dir),
+            "tree": tree,
+            "true_tilt": true_tilt,
+            "estimated_tilt": estimated,
+            "error": None if estimated is None else tilt_error(estimated, true_tilt),
+            "ms": seconds * 1000,
+            "peak_kb": None if peak is None else peak / 1024,
+        })
+    return {"images": images, "summary": summarize(images)}
+
+
+def summarize(images):
+    latencies = np.array([image["ms"] for image in images])
+    errors = np.array([image["error"] for image in images if image["error"] is not None])
+    peaks = [image["peak_kb"] for image in images if image["peak_kb"] is not None]
+    return {
+        "images": len(images),
+        "failures": int(sum(image["estimated_tilt"] is None for image in images)),
+        "mae": float(errors.mean()) if len(errors) else None,
+        "max_error": float(errors.max()) if len(errors) else None,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "images_per_sec": float(1000 / latencies.mean()),
+        "max_peak_kb": float(max(peaks)) if peaks else None,
+    }
+
+
+def check_regressions(results, baseline, max_latency_regression, max_error_regression):
+    """Compare summaries with a previous run. Returns a list of failure messages."""
+    failures = []
+    for name, current in results["algorithms"].items():
+        previous = baseline.get("algorithms", {}).get(name)
+        if previous is None:
+            continue
+        now, before = current["summary"], previous["summary"]
+
+        latency_limit = before["mean_ms"] * (1 + max_latency_regression)
+        if now["mean_ms"] > latency_limit:
+            failures.append(f"{name}: mean latency {now['mean_ms']:.1f}ms exceeds "
+                            f"{latency_limit:.1f}ms (baseline {before['mean_ms']:.1f}ms)")
+
+        if now["mae"] is not None and before["mae"] is not None:
+            error_limit = before["mae"] + max_error_regression
+            if now["mae"] > error_limit:
+                failures.append(f"{name}: MAE {now['mae']:.2f}° exceeds {error_limit:.2f}° "
+                                f"(baseline {before['mae']:.2f}°)")
+
+        if now["failures"] > before["failures"]:
+            failures.append(f"{name}: {now['failures']} failed images (baseline {before['failures']})")
+    return failures
+
+
+def print_summary(results):
+    print(f"{'algorithm':10s} {'images':>6s} {'failed':>6s} {'MAE deg':>8s} {'mean ms':>8s} "
+          f"{'p95 ms':>7s} {'img/s':>7s} {'peak MB':>8s}")
+    for name, result in results["algorithms"].items():
+        s = result["summary"]
+        mae = f"{s['mae']:8.2f}" if s["mae"] is not None else f"{'-':>8s}"
+        peak = f"{s['max_peak_kb'] / 1024:8.1f}" if s["max_peak_kb"] is not None else f"{'-':>8s}"
+        print(f"{name:10s} {s['images']:6d} {s['failures']:6d} {mae} {s['mean_ms']:8.1f} "
+              f"{s['p95_ms']:7.1f} {s['images_per_sec']:7.1f} {peak}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default="tilt_benchmark.json", help="Where to save the JSON results")
+    parser.add_argument("--algorithms", nargs="+", choices=sorted(ALGORITHMS), default=sorted(ALGORITHMS))
+    parser.add_argument("--analysis-long-side", type=int, default=None)
+    parser.add_argument("--skip-memory", action="store_true", help="Don't run the tracemalloc pass")
+    parser.add_argument("--baseline", default=None, help="Previous results JSON to compare against")
+    parser.add_argument("--max-latency-regression", type=float, default=0.25,
+                        help="Allowed mean latency increase as a fraction of the baseline (default 0.25)")
+    parser.add_argument("--max-error-regression", type=float, default=0.5,
+                        help="Allowed MAE increase in degrees (default 0.5)")
+    args = parser.parse_args(argv)
+
+    samples = load_unity_dataset()
+    print(f"Keying out the tree masks of {len(samples)} Unity images...")
+    masks = [load_unity_mask(path) for path, _, _ in samples]
+    print(f"Benchmarking {', '.join(args.algorithms)} on {len(samples)} Unity images")
+
+    results = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "analysis_long_side": args.analysis_long_side,
+        "algorithms": {},
+    }
+
+    for name in args.algorithms:
+        results["algorithms"][name] = run_algorithm(
+            name, samples, masks, args.analysis_long_side, track_memory=not args.skip_memory)
+
+    print_summary(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {os.path.abspath(args.output)}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = check_regressions(results, baseline, args.max_latency_regression, args.max_error_regression)
+        if failures:
+            print("\nREGRESSION CHECK FAILED")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+        print("\nRegression check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import re
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+UNITY_DIR = (Path(__file__).resolve().parent.parent / "2025-26_Data_Links" / "Unity Dataset"
+             / "Trees Collection Asset PBR")
+
+# Tree_3.png is upright, Tree_3_-15_tilt.png is tilted -15 degrees
+TILT_PATTERN = re.compile(r"^Tree_(\d+)(?:_(-?\d+)_tilt)?$")
+
+# The renders are opaque: the tree is on Unity's default sky/ground
+# background, whose color changes from row to row but only slowly along a
+# row. Pixels more than BACKGROUND_TOLERANCE (any channel) from their row's
+# background are tree
+BACKGROUND_TOLERANCE = 12
+
+# Background seeds are the most common color of a row among the pixels that
+# could be sky or ground: at least this bright and not green like the leaves
+MIN_BACKGROUND_VALUE = 50
+
+# Rows with fewer seed pixels than this fraction of the width (mostly tree)
+# take their background from the rows above and below
+MIN_SEED_FRACTION = 0.05
+
+# Parts of the mask smaller than this fraction of the largest are dropped
+MIN_PART_FRACTION = 0.02
+
+
+def load_unity_dataset(root=UNITY_DIR):
+    """
+    List the Unity renders with the ground-truth tilt from their filenames.
+    Returns [(path, tree_number, true_tilt_degrees), ...] sorted by tree and angle.
+    """
+    samples = []
+    for path in Path(root).rglob("*.png"):
+        match = TILT_PATTERN.match(path.stem)
+        if match is None:
+            continue
+        tree = int(match.group(1))
+        true_tilt = float(match.group(2) or 0)
+        samples.append((str(path), tree, true_tilt))
+    return sorted(samples, key=lambda sample: (sample[1], sample[2]))
+
+
+def fit_row_background(bgr, weights):
+    """
+    Background color of every pixel as a straight line along its row, fitted
+    (least squares, per channel) to the pixels with weight 1.
+    """
+    height, width = weights.shape
+    x = np.arange(width, dtype=np.float64)
+    rows = np.arange(height)
+    n = weights.sum(axis=1)
+    sx = weights @ x
+    sxx = weights @ (x * x)
+    det = n * sxx - sx * sx
+    usable = n >= max(2, width * MIN_SEED_FRACTION)
+
+    background = np.empty(bgr.shape, dtype=np.float64)
+    for channel in range(3):
+        values = bgr[..., channel]
+        sy = (weights * values).sum(axis=1)
+        sxy = (weights * values * x).sum(axis=1)
+        slope = np.divide(n * sxy - sx * sy, det, out=np.zeros(height), where=det > 1e-9)
+        intercept = np.divide(sy - slope * sx, n, out=np.zeros(height), where=n > 0)
+        if usable.any() and not usable.all():
+            slope = np.interp(rows, rows[usable], slope[usable])
+            intercept = np.interp(rows, rows[usable], intercept[usable])
+        background[..., channel] = intercept[:, None] + slope[:, None] * x[None, :]
+    return background
+
+
+def load_unity_mask(path):
+    """
+    0/255 tree mask of a Unity render, keyed out of its sky/ground
+    background (the renders have no transparency to use).
+    """
+    img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image from {path}")
+    bgr = img.astype(np.float64)
+    blue, green, red = bgr[..., 0], bgr[..., 1], bgr[..., 2]
+    could_be_background = (bgr.max(axis=2) >= MIN_BACKGROUND_VALUE) & ~((green > red) & (green > blue))
+
+    quantized = img.astype(np.int32) // 4
+    codes = (quantized[..., 0] << 12) | (quantized[..., 1] << 6) | quantized[..., 2]
+    seeds = np.zeros(codes.shape, dtype=bool)
+    for row in range(codes.shape[0]):
+        candidates = codes[row][could_be_background[row]]
+        if len(candidates):
+            values, counts = np.unique(candidates, return_counts=True)
+            seeds[row] = codes[row] == values[np.argmax(counts)]
+
+    # Fit to the seeds, then again to every pixel that matched that fit
+    background = fit_row_background(bgr, seeds.astype(np.float64))
+    distance = np.abs(bgr - background).max(axis=2)
+    background = fit_row_background(bgr, (distance <= BACKGROUND_TOLERANCE).astype(np.float64))
+
+    # The horizon blends over a few rows, so matching the background of a
+    # row nearby is enough
+    distance = np.full(distance.shape, np.inf)
+    for shift in range(-2, 3):
+        distance = np.minimum(distance, np.abs(bgr - np.roll(background, shift, axis=0)).max(axis=2))
+    mask = (distance > BACKGROUND_TOLERANCE).astype(np.uint8)
+
+    # Drop the editor grid lines, then close seams left across the tree
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count > 1:
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        keep = np.concatenate([[False], areas >= areas.max() * MIN_PART_FRACTION])
+        mask = keep[labels].astype(np.uint8)
+    return mask * 255
+
+
+def tilt_error(estimated, true_tilt):
+    """
+    Error in tilt magnitude, which is what the risk score uses. The renders
+    don't share a left/right sign convention with the detectors.
+    """
+    return abs(abs(estimated) - abs(true_tilt))
@@ -1,17 +1,31 @@
+import sys
+
 import cv2
-import numpy as np
 
 
-image_path = r"C:\Users\timishg\Documents\Github\VitalArbor\2025-26 Data Links\10-21-2025\Norway Spruce photos\Norway Spruce.jfif"
-image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-# Apply the Laplacian operator
-laplacian = cv2.Laplacian(image, cv2.CV_64F)  # Use 64-bit float for precision
+def get_Laplacian(image):
+    """Laplacian of a grayscale image, in 64-bit float for precision."""
+    return cv2.Laplacian(image, cv2.CV_64F)
+
+
+def get_Sharpness(image):
+    """Variance of the Laplacian of a grayscale image; low values mean a blurry photo."""
+    _, std = cv2.meanStdDev(get_Laplacian(image))
+    return float(std[0, 0] ** 2)
+
+
+if __name__ == "__main__":
+    image_path = sys.argv[1] if len(sys.argv) > 1 else r"C:\Users\timishg\Documents\Github\VitalArbor\2025-26 Data Links\10-21-2025\Norway Spruce photos\Norway Spruce.jfif"
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    # Apply the Laplacian operator
+    laplacian = get_Laplacian(image)
+    print(f"Sharpness: {get_Sharpness(image):.1f}")
 
-# Convert back to 8-bit (optional, for visualization)
-laplacian = cv2.convertScaleAbs(laplacian)
+    # Convert back to 8-bit (optional, for visualization)
+    laplacian = cv2.convertScaleAbs(laplacian)
 
-# Display the result
-cv2.imshow('Original Image', image)
-cv2.imshow('Laplacian', laplacian)
-cv2.waitKey(0)
-cv2.destroyAllWindows()
+    # Display the result
+    cv2.imshow('Original Image', image)
+    cv2.imshow('Laplacian', laplacian)
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
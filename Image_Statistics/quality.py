@@ -0,0 +1,151 @@
+import argparse
+import glob
+import math
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Metrics are measured on a copy with this long side, so sharpness means the
+# same for every camera. None measures the photo as it is.
+QUALITY_LONG_SIDE = 1024
+
+# Photos outside these limits are rejected by quality_problems. Sharpness is
+# the Laplacian variance at QUALITY_LONG_SIDE; the sharpest photos in the
+# 2025-26 survey score 4000-6000, the softest close-ups about 45.
+QUALITY_THRESHOLDS = {
+    "min_brightness": 40,
+    "max_brightness": 220,
+    "max_clipped_fraction": 0.25,
+    "min_sharpness": 25,
+}
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".jfif")
+
+
+class PhotoQualityError(ValueError):
+    """Raised for photos too blurry, dark or over-exposed to segment."""
+
+
+def load_image(image):
+    """A BGR photo from a path, or the BGR array itself."""
+    if isinstance(image, np.ndarray):
+        return image
+    img = cv2.imread(image, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Image not found at path: {image}")
+    return img
+
+
+def measure_quality(image, long_side=QUALITY_LONG_SIDE, content_box=None):
+    """
+    Brightness, contrast, entropy and sharpness of a photo, decoded once.
+
+    image: path or BGR array
+    long_side: measure on a copy downscaled to this long side (None: as is)
+    content_box: optional function gray -> (top, bottom, left, right), e.g.
+        auto_prompt.find_content_box, to leave letterboxing out
+
+    Returns a dict:
+        brightness_v     mean HSV value (max of B, G, R)
+        brightness_gray  mean grayscale
+        brightness       mean of the two, as brightness.get_Brightness
+        contrast         grayscale standard deviation
+        entropy          Shannon entropy of the grayscale histogram (bits)
+        sharpness        variance of the grayscale Laplacian
+        clipped_fraction / dark_fraction  pixels >= 250 / <= 5
+        width, height    size the metrics were measured at
+    """
+    img = load_image(image)
+    height, width = img.shape[:2]
+    if long_side and max(height, width) > long_side:
+        scale = long_side / max(height, width)
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if content_box is not None:
+        top, bottom, left, right = content_box(gray)
+        gray = gray[top:bottom, left:right]
+        img = img[top:bottom, left:right]
+
+    # Every grayscale statistic comes from one histogram
+    counts = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = counts.sum()
+    levels = np.arange(256)
+    mean_gray = float(levels @ counts / total)
+    contrast = math.sqrt(float((levels - mean_gray) ** 2 @ counts / total))
+    p = counts[counts > 0] / total
+    entropy = float(-(p * np.log2(p)).sum())
+
+    # HSV value of an 8-bit image is the largest of its channels
+    value = cv2.max(cv2.max(img[:, :, 0], img[:, :, 1]), img[:, :, 2])
+    brightness_v = float(cv2.mean(value)[0])
+
+    _, laplacian_std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_64F))
+
+    return {
+        "brightness_v": brightness_v,
+        "brightness_gray": mean_gray,
+        "brightness": (brightness_v + mean_gray) / 2,
+        "contrast": contrast,
+        "entropy": entropy,
+        "sharpness": float(laplacian_std[0, 0] ** 2),
+        "clipped_fraction": float(counts[250:].sum() / total),
+        "dark_fraction": float(counts[:6].sum() / total),
+        "width": gray.shape[1],
+        "height": gray.shape[0],
+    }
+
+
+def quality_problems(metrics, thresholds=QUALITY_THRESHOLDS):
+    """Why a photo fails the thresholds, e.g. ["blurry (sharpness 12.3 < 25)"]; empty if it passes."""
+    problems = []
+    if metrics["sharpness"] < thresholds["min_sharpness"]:
+        problems.append(f"blurry (sharpness {metrics['sharpness']:.1f} < {thresholds['min_sharpness']})")
+    if metrics["brightness"] < thresholds["min_brightness"]:
+        problems.append(f"dark (brightness {metrics['brightness']:.1f} < {thresholds['min_brightness']})")
+    if metrics["brightness"] > thresholds["max_brightness"]:
+        problems.append(f"over-exposed (brightness {metrics['brightness']:.1f} > {thresholds['max_brightness']})")
+    elif metrics["clipped_fraction"] > thresholds["max_clipped_fraction"]:
+        problems.append(f"over-exposed ({metrics['clipped_fraction']:.0%} of pixels clipped)")
+    return problems
+
+
+def check_quality(image, long_side=QUALITY_LONG_SIDE, content_box=None, thresholds=QUALITY_THRESHOLDS):
+    """measure_quality, raising PhotoQualityError when the photo fails the thresholds. Returns the metrics."""
+    metrics = measure_quality(image, long_side, content_box)
+    problems = quality_problems(metrics, thresholds)
+    if problems:
+        raise PhotoQualityError(", ".join(problems))
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Brightness, contrast, entropy and sharpness of photos.")
+    parser.add_argument("source", help="A photo, a directory (searched recursively) or a glob pattern")
+    parser.add_argument("--long-side", type=int, default=QUALITY_LONG_SIDE,
+                        help="Measure on a copy with this long side (0: full size)")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.source):
+        paths = glob.glob(os.path.join(args.source, "**", "*"), recursive=True)
+    else:
+        paths = glob.glob(args.source, recursive=True)
+    paths = sorted(path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS))
+    if not paths:
+        print(f"No images found in {args.source}")
+        return 1
+
+    print(f"{'photo':40s} {'bright':>6s} {'contr':>6s} {'entropy':>7s} {'sharp':>8s}  verdict")
+    for path in paths:
+        metrics = measure_quality(path, args.long_side or None)
+        problems = quality_problems(metrics)
+        print(f"{os.path.basename(path)[:40]:40s} {metrics['brightness']:6.1f} {metrics['contrast']:6.1f} "
+              f"{metrics['entropy']:7.2f} {metrics['sharpness']:8.1f}  {', '.join(problems) or 'ok'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,19 @@
-import cv2
-import scikit
-img = cv2.imread(image_filename)
-img = img.astype('uint8')
-#convert to grayscale
-img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-#calculate properties
-brightness = (np.mean(img)) / 255
-contrast = img.std()
-entropy = skimage.measure.shannon_entropy(img)
-laplacian = cv2.Laplacian(img, cv2.CV_64F).var()
\ No newline at end of file
+import sys
+
+from quality import measure_quality
+
+
+def get_Statistics(image_filename):
+    """Brightness (0-1), contrast, entropy and Laplacian variance of the grayscale image."""
+    #calculate properties from one decode
+    metrics = measure_quality(image_filename, long_side=None)
+    brightness = metrics["brightness_gray"] / 255
+    contrast = metrics["contrast"]
+    entropy = metrics["entropy"]
+    laplacian = metrics["sharpness"]
+    return brightness, contrast, entropy, laplacian
+
+
+if __name__ == "__main__":
+    brightness, contrast, entropy, laplacian = get_Statistics(sys.argv[1])
+    print(f"brightness {brightness:.3f}, contrast {contrast:.1f}, entropy {entropy:.2f}, laplacian {laplacian:.1f}")
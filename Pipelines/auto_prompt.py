@@ -0,0 +1,123 @@
+import cv2
+import numpy as np
+
+# Prompts are searched for on a copy with this long side
+SEARCH_LONG_SIDE = 512
+
+# Rows (as a fraction of the photo content height) searched for the trunk,
+# the lower half like the Hough stage, without the ground right at the bottom
+TRUNK_ROWS = (0.5, 0.9)
+
+# Positive points are placed on the trunk center at these heights
+POINT_ROWS = (0.6, 0.75)
+
+
+def find_content_box(gray, min_std=8.0):
+    """
+    (top, bottom, left, right) of the photo inside a screenshot: the longest
+    run of rows/columns that aren't flat letterbox bars or status bars.
+    """
+    def longest_run(varied):
+        best = (0, len(varied))
+        best_length = 0
+        start = None
+        for i, value in enumerate(np.append(varied, False)):
+            if value and start is None:
+                start = i
+            elif not value and start is not None:
+                if i - start > best_length:
+                    best, best_length = (start, i), i - start
+                start = None
+        return best
+
+    top, bottom = longest_run(gray.std(axis=1) > min_std)
+    left, right = longest_run(gray[top:bottom].std(axis=0) > min_std)
+    return top, bottom, left, right
+
+
+def vertical_edges(gray):
+    """Strength of edges that run close to vertical (|d/dx| > 2 |d/dy|)."""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    gx = np.abs(cv2.Sobel(blurred, cv2.CV_32F, 1, 0, ksize=3))
+    gy = np.abs(cv2.Sobel(blurred, cv2.CV_32F, 0, 1, ksize=3))
+    return np.where(gx > 2 * gy, gx, 0)
+
+
+def find_trunk(image_np):
+    """
+    Locate the trunk from the density of vertical edges in the lower half of
+    the photo, favouring the middle where people frame the tree.
+
+    image_np: HxWx3 RGB photo
+    Returns {"center_x", "left", "right", "top", "bottom", "content"} in
+    original pixels, where left/right are the strongest edges either side of
+    the center and top/bottom the searched rows.
+    """
+    h, w = image_np.shape[:2]
+    scale = min(1.0, SEARCH_LONG_SIDE / max(h, w))
+    small = cv2.resize(image_np, (max(1, round(w * scale)), max(1, round(h * scale))),
+                       interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+    # ------------------------------------------------------
+    # 1) Photo area without letterboxing
+    # ------------------------------------------------------
+    top, bottom, left, right = find_content_box(gray)
+    content_h = bottom - top
+    content_w = right - left
+
+    # ------------------------------------------------------
+    # 2) Vertical edge density per column in the trunk rows
+    # ------------------------------------------------------
+    row_start = top + int(content_h * TRUNK_ROWS[0])
+    row_end = top + int(content_h * TRUNK_ROWS[1])
+    edges = vertical_edges(gray)[row_start:row_end, left:right]
+    strong = edges > np.percentile(edges, 90)
+    density = strong.mean(axis=0)
+
+    # A wide window merges the two sides of a trunk into one bump
+    wide = max(3, content_w // 12)
+    bump = np.convolve(density, np.ones(wide) / wide, mode="same")
+    columns = np.arange(content_w)
+    center_prior = np.exp(-0.5 * ((columns - content_w / 2) / (content_w / 4)) ** 2)
+    center = int(np.argmax(bump * center_prior))
+
+    # ------------------------------------------------------
+    # 3) Trunk sides: strongest edge columns either side
+    # ------------------------------------------------------
+    narrow = np.convolve(density, np.ones(3) / 3, mode="same")
+    reach = max(2, content_w // 8)
+    lo = max(0, center - reach)
+    left_side = narrow[lo:center]
+    right_side = narrow[center + 1:center + 1 + reach]
+    trunk_left = lo + int(np.argmax(left_side)) if len(left_side) else center
+    trunk_right = center + 1 + int(np.argmax(right_side)) if len(right_side) else center
+
+    # Re-center between the sides, which are better located than the bump
+    center = (trunk_left + trunk_right) // 2
+
+    # Rounding back to original pixels must not leave the photo
+    return {
+        "center_x": min((left + center) / scale, w - 1),
+        "left": min((left + trunk_left) / scale, w - 1),
+        "right": min((left + trunk_right) / scale, w - 1),
+        "top": row_start / scale,
+        "bottom": row_end / scale,
+        "content": tuple(v / scale for v in (top, bottom, left, right)),
+    }
+
+
+def propose_prompts(image_np):
+    """
+    Prompt sets for sam2_segmentation.predict_prompt_sets from find_trunk:
+    positive points along the trunk center, alone and with a box around the
+    trunk. Coordinates are in original pixels.
+    """
+    trunk = find_trunk(image_np)
+    top, bottom, _, _ = trunk["content"]
+    points = [[trunk["center_x"], top + (bottom - top) * row] for row in POINT_ROWS]
+    box = [trunk["left"], trunk["top"], trunk["right"], trunk["bottom"]]
+    return [
+        {"points": points, "labels": [1] * len(points)},
+        {"points": points, "labels": [1] * len(points), "box": box},
+    ]
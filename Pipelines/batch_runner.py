@@ -0,0 +1,452 @@
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import cutout_paths
+import mask_analysis
+import prefetch
+import result_store
+import profiling
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".jfif")
+
+# Compact masks written by mask_format.py convert; a *_crop_out.vmask is
+# used like its *_crop_out.png
+MASK_EXTENSIONS = cutout_paths.CUTOUT_EXTENSIONS[1:]
+
+# Files written by the pipelines themselves; never treat them as inputs
+DERIVED_SUFFIXES = ("_trunk_part", "_vis_trunk", "_contrast", "_width_plot")
+
+RECORD_FIELDS = [
+    "image",
+    "mask",
+    "trunk_path",
+    "tilt",
+    "trunk_lines_count",
+    "trunk_start",
+    "trunk_end",
+    "sweep",
+    "sweep_bend",
+    "risk_score",
+    "category",
+    "seconds",
+    "recomputed",
+    "error",
+]
+
+
+def collect_images(source):
+    """
+    Expand a directory (searched recursively) or a glob pattern into a sorted
+    list of image paths, skipping visualizations written by the pipelines.
+    A .vmask next to a PNG cutout of the same name is the same mask, so only
+    the PNG is kept, as resolve_mask prefers it.
+    """
+    if os.path.isdir(source):
+        candidates = glob.glob(os.path.join(source, "**", "*"), recursive=True)
+    else:
+        candidates = glob.glob(source, recursive=True)
+
+    images = []
+    for path in candidates:
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if ext.lower() not in IMAGE_EXTENSIONS + MASK_EXTENSIONS or not os.path.isfile(path):
+            continue
+        if stem.endswith(DERIVED_SUFFIXES):
+            continue
+        images.append(path)
+
+    # One mask per cutout: skip the .vmask written by mask_format.py convert
+    # when its PNG is there too
+    pngs = {os.path.splitext(path)[0] for path in images if path.lower().endswith(".png")}
+    images = [path for path in images
+              if not (os.path.splitext(path)[1].lower() in MASK_EXTENSIONS and os.path.splitext(path)[0] in pngs)]
+    return sorted(images)
+
+
+def resolve_mask(image_path):
+    """
+    Find the segmented cutout for an image (see cutout_paths.find_cutout).
+    A *_crop_out.png (or .vmask) is its own mask; raises
+    cutout_paths.AmbiguousCutoutError when an old cutout saved under the
+    photo's base name could belong to another photo with the same name.
+    """
+    return cutout_paths.find_cutout(image_path)
+
+
+def save_debug_images(mask_path, width):
+    """
+    Save the trunk crop and the width visualization next to the cutout in
+    "Segmented photos" (see cutout_paths.cutout_dir). Returns the path of
+    the crop.
+    """
+    target_dir = cutout_paths.cutout_dir(mask_path)
+    os.makedirs(target_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(mask_path))[0]
+
+    crop_save_path = os.path.join(target_dir, f"{base_name}_trunk_part.png")
+    Image.fromarray(width["trunk_mask"]).save(crop_save_path)
+    if width["visualization"] is not None:
+        Image.fromarray(width["visualization"]).save(os.path.join(target_dir, f"{base_name}_vis_trunk.png"))
+    return crop_save_path
+
+
+def auto_segment(image_path, save_cutout=False, image_np=None):
+    """
+    Segment a photo with SAM2 and automatic trunk prompts. Returns the cutout
+    as (mask, rgb) like mask_analysis.load_cutout, and the saved cutout path
+    when save_cutout is set. image_np is the photo as RGB if already decoded.
+    """
+    # Only imported when needed, it loads torch and the SAM2 model
+    import sam2_segmentation
+
+    if image_np is None:
+        image_np = np.array(Image.open(image_path).convert("RGB"))
+    best, _ = sam2_segmentation.segment_auto(image_np)
+    rgba = sam2_segmentation.make_cutout(image_np, best["mask"])
+    if rgba is None:
+        raise ValueError("SAM2 returned an empty mask")
+
+    cutout_path = None
+    if save_cutout:
+        cutout_path = sam2_segmentation.get_cutout_path(image_path)
+        Image.fromarray(rgba, mode="RGBA").save(cutout_path)
+    return (rgba[:, :, 3] > 127).astype(np.uint8) * 255, rgba[:, :, :3], cutout_path
+
+
+def check_photo_quality(image):
+    """
+    Measure a photo (path or BGR array) with Image_Statistics/quality.py,
+    inside its letterbox, and raise quality.PhotoQualityError if it is too
+    blurry, dark or over-exposed to be worth segmenting and analyzing.
+    """
+    # Image_Statistics isn't a package; appended, so its statistics.py never
+    # shadows the standard library
+    stats_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Image_Statistics")
+    if stats_dir not in sys.path:
+        sys.path.append(stats_dir)
+    import quality
+    import auto_prompt
+
+    with profiling.span("quality"):
+        return quality.check_quality(image, content_box=auto_prompt.find_content_box)
+
+
+def load_inputs(image_path, auto=False, quality_gate=False):
+    """
+    Decode everything process_image will read for one image, so it can be
+    done ahead of time (see prefetch.Prefetcher). Returns a dict with the
+    "mask_path", the "cutout" as (mask, rgb) when there is one, and the
+    "photo" as RGB when the quality gate or auto segmentation needs it. The
+    photo is decoded with PIL like sam2_segmentation does, which unlike
+    cv2.imread doesn't apply the EXIF orientation, so SAM2 sees the same
+    pixels (and embedding cache entries) as from its own command line.
+    """
+    mask_path = resolve_mask(image_path)
+    inputs = {"mask_path": mask_path, "cutout": None, "photo": None}
+    if mask_path is not None:
+        inputs["cutout"] = mask_analysis.load_cutout(mask_path)
+    if mask_path != image_path and (quality_gate or (auto and mask_path is None)):
+        inputs["photo"] = np.array(Image.open(image_path).convert("RGB"))
+    return inputs
+
+
+# One store connection per process, opened on first use
+_stores = {}
+
+
+def get_store(store_path):
+    if store_path not in _stores:
+        _stores[store_path] = result_store.ResultStore(store_path)
+    return _stores[store_path]
+
+
+def analyze_with_store(store, image_path, mask_path, use_cutout, analysis_long_side, auto, quiet,
+                       refine_tilt=False):
+    """
+    Run the analysis through the result store. The mask is keyed by the
+    cutout's content, or by the SAM2 settings for auto-segmented photos, so a
+    stored auto-segmented mask never runs SAM2 again.
+    """
+    image_hash = result_store.hash_file(image_path)
+    if mask_path is not None:
+        mask_params = {"cutout": result_store.hash_file(mask_path)}
+        load_mask = lambda: mask_analysis.load_cutout(mask_path)[0]
+    elif auto:
+        import sam2_segmentation
+        mask_params = {"sam2": "auto", **sam2_segmentation.get_encoder_config()}
+        load_mask = lambda: auto_segment(image_path)[0]
+    else:
+        raise FileNotFoundError("No segmented mask found, run sam2_segmentation first")
+
+    return mask_analysis.analyze_stored(
+        store, image_hash, mask_params, load_mask,
+        use_cutout=use_cutout, analysis_long_side=analysis_long_side, quiet=quiet, refine_tilt=refine_tilt,
+    )
+
+
+def process_image(image_path, use_cutout=False, verbose=False, analysis_long_side=None, save_debug=False,
+                  auto=False, capture_output=True, store_path=None, quality_gate=False, refine_tilt=False,
+                  inputs=None):
+    """
+    Run mask loading -> trunk width -> tilt -> risk score for one image.
+    The mask is decoded once and every stage works on the in-memory arrays.
+    analysis_long_side downsamples the mask for the width and tilt stages.
+    save_debug also writes the trunk crop and width visualization to disk.
+    auto segments photos that have no cutout yet with SAM2 and automatic
+    prompts (saving the cutout only with save_debug).
+    store_path keeps every stage's output in a result_store database and
+    only recomputes what changed (save_debug is ignored then).
+    quality_gate rejects blurry, dark or over-exposed photos (see
+    check_photo_quality) before any segmentation or analysis; cutouts and
+    masks given directly are never checked.
+    refine_tilt finds the tilt coarse-to-fine (tilt_detection.refine_tilt).
+    inputs is the result of load_inputs when the image was decoded ahead of
+    time; it isn't used with store_path.
+    capture_output swallows what the stages print when not verbose; it
+    swaps sys.stdout, so threads sharing a process must turn it off.
+
+    Returns a flat record (see RECORD_FIELDS). Failures are reported in the
+    "error" field instead of raised, so one bad photo never stops a batch.
+    """
+    record = dict.fromkeys(RECORD_FIELDS)
+    record["image"] = image_path
+    start = time.perf_counter()
+
+    # The stages report progress with print; keep worker output readable
+    if verbose or not capture_output:
+        log = contextlib.nullcontext()
+    else:
+        log = contextlib.redirect_stdout(io.StringIO())
+
+    try:
+        with log, profiling.span("image", image=os.path.basename(image_path)):
+            if inputs is None and store_path is None:
+                inputs = load_inputs(image_path, auto, quality_gate)
+            mask_path = inputs["mask_path"] if inputs is not None else resolve_mask(image_path)
+            record["mask"] = mask_path
+            if quality_gate and mask_path != image_path:
+                check_photo_quality(cv2.cvtColor(inputs["photo"], cv2.COLOR_RGB2BGR) if inputs is not None
+                                    else image_path)
+
+            if store_path is not None:
+                result = analyze_with_store(get_store(store_path), image_path, mask_path,
+                                            use_cutout, analysis_long_side, auto, quiet=not verbose,
+                                            refine_tilt=refine_tilt)
+                record["recomputed"] = ",".join(result["recomputed"])
+            else:
+                if mask_path is not None:
+                    mask, rgb = inputs["cutout"]
+                elif auto:
+                    mask, rgb, mask_path = auto_segment(image_path, save_cutout=save_debug, image_np=inputs["photo"])
+                    record["mask"] = mask_path
+                else:
+                    raise FileNotFoundError("No segmented mask found, run sam2_segmentation first")
+
+                result = mask_analysis.analyze_mask(
+                    mask, rgb,
+                    use_cutout=use_cutout,
+                    analysis_long_side=analysis_long_side,
+                    visualize=save_debug,
+                    quiet=not verbose,
+                    refine_tilt=refine_tilt,
+                )
+
+                if save_debug:
+                    record["trunk_path"] = save_debug_images(mask_path or image_path, result["width"])
+
+        record["tilt"] = round(result["tilt"], 3)
+        for field in ("trunk_lines_count", "trunk_start", "trunk_end", "risk_score", "category"):
+            record[field] = result[field]
+        record["sweep"] = result["sweep"]["sweep"]
+        record["sweep_bend"] = result["sweep"]["bend"]
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def _init_worker(profile=False):
+    # One OpenCV thread per process, otherwise the pool oversubscribes cores
+    import cv2
+    cv2.setNumThreads(1)
+    if profile:
+        profiling.enable()
+
+
+def _process_job(job, inputs=None):
+    # Spans recorded in a worker travel back with its record
+    record = process_image(*job, inputs=inputs)
+    return record, profiling.take_events()
+
+
+class RecordWriter:
+    """Streams records to a .jsonl or .csv file as soon as they arrive."""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.is_csv = output_path.lower().endswith(".csv")
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        os.makedirs(output_dir, exist_ok=True)
+        self.file = open(output_path, "w", newline="", encoding="utf-8")
+        if self.is_csv:
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=RECORD_FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, record):
+        if self.is_csv:
+            self.csv_writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run_batch(images, output_path, workers=None, use_cutout=False, verbose=False, analysis_long_side=None,
+              save_debug=False, auto=False, store_path=None, profile_path=None, quality_gate=False,
+              prefetch_depth=prefetch.PREFETCH_DEPTH, refine_tilt=False):
+    """
+    Process images across a process pool and stream one record per image to
+    output_path. Returns a summary dict with the throughput of the run.
+    profile_path records profiling spans in every worker and writes them
+    there as one Chrome trace. quality_gate skips photos that fail the
+    quality check and refine_tilt finds tilts coarse-to-fine (see
+    process_image).
+    With one worker, the next prefetch_depth images are decoded on a
+    background thread while the current one is analyzed (0 decodes each
+    one when it is needed), and the summary has the decode and analysis
+    times under "prefetch". The result store loads lazily, so store_path
+    never prefetches.
+    """
+    profile = profile_path is not None or profiling.is_enabled()
+    if profile:
+        profiling.enable()
+    workers = workers or os.cpu_count() or 1
+    jobs = [(path, use_cutout, verbose, analysis_long_side, save_debug, auto, True, store_path, quality_gate,
+             refine_tilt) for path in images]
+
+    writer = RecordWriter(output_path)
+    loader = None
+    done = 0
+    failed = 0
+    start = time.perf_counter()
+
+    try:
+        if workers == 1:
+            _init_worker(profile)
+            if store_path is None:
+                loader = prefetch.Prefetcher(jobs, lambda job: load_inputs(job[0], auto, quality_gate),
+                                             prefetch_depth)
+                # A job whose decode failed runs without inputs, so
+                # process_image reports the error like any other
+                results = (_process_job(job, inputs) for job, inputs, _ in loader)
+            else:
+                results = map(_process_job, jobs)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(profile,))
+            results = pool.imap_unordered(_process_job, jobs, chunksize=1)
+
+        for record, events in results:
+            profiling.add_events(events)
+            writer.write(record)
+            done += 1
+            if record["error"]:
+                failed += 1
+                status = record["error"]
+            else:
+                status = f"tilt {record['tilt']:.2f}°, risk {record['risk_score']}"
+            print(f"[{done}/{len(jobs)}] {os.path.basename(record['image'])}: {status}")
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    if profile_path is not None:
+        profiling.export_chrome_trace(profile_path)
+    summary = {
+        "images": done,
+        "failed": failed,
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(done / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+    if loader is not None:
+        summary["prefetch"] = loader.stats()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the VitalArbor analysis pipelines over a whole folder without prompts."
+    )
+    parser.add_argument("source", help="Directory (searched recursively) or glob pattern of photos / *_crop_out.png masks")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="Result file, .jsonl or .csv")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--use-cutout", action="store_true", help="Detect tilt on the trunk crop instead of the full mask")
+    parser.add_argument("--analysis-long-side", type=int, default=None,
+                        help="Downsample masks to this long side (pixels) before the width and tilt stages")
+    parser.add_argument("--auto-segment", action="store_true",
+                        help="Segment photos without a cutout with SAM2 and automatic prompts "
+                             "(every worker loads its own model, so keep -j low)")
+    parser.add_argument("--save-debug", action="store_true",
+                        help="Also save the trunk crop and width visualization (and auto-segmented cutouts) "
+                             "to \"Segmented photos\"")
+    parser.add_argument("--store", default=None,
+                        help="SQLite result store; reruns only recompute stages whose inputs or parameters changed")
+    parser.add_argument("--profile", default=None, metavar="TRACE_JSON",
+                        help="Time every stage and write a Chrome trace (chrome://tracing) to this file")
+    parser.add_argument("--quality-gate", action="store_true",
+                        help="Skip blurry, dark or over-exposed photos before segmenting or analyzing them")
+    parser.add_argument("--refine-tilt", action="store_true",
+                        help="Find the tilt coarse-to-fine, stopping at a low resolution when it fits the trunk")
+    parser.add_argument("--prefetch", type=int, default=prefetch.PREFETCH_DEPTH, metavar="N",
+                        help="With -j 1, decode the next N images while the current one is analyzed "
+                             f"(default {prefetch.PREFETCH_DEPTH}, 0 turns it off)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the output of every stage")
+    args = parser.parse_args(argv)
+    if args.store and args.save_debug:
+        parser.error("--save-debug can't be combined with --store, stored stages aren't re-rendered")
+
+    images = collect_images(args.source)
+    if not images:
+        print(f"No images found in {args.source}")
+        return 1
+
+    print(f"Processing {len(images)} images with {args.workers or os.cpu_count()} workers")
+    summary = run_batch(images, args.output, args.workers, args.use_cutout, args.verbose,
+                        args.analysis_long_side, args.save_debug, args.auto_segment, args.store, args.profile,
+                        args.quality_gate, args.prefetch, args.refine_tilt)
+
+    print(f"\n=== BATCH SUMMARY ===")
+    print(f"Images: {summary['images']} ({summary['failed']} failed)")
+    print(f"Time: {summary['seconds']:.2f}s with {summary['workers']} workers")
+    print(f"Throughput: {summary['images_per_sec']:.2f} images/sec")
+    if "prefetch" in summary:
+        prefetch.print_stats(summary["prefetch"])
+    print(f"Results written to: {os.path.abspath(args.output)}")
+    if args.profile:
+        profiling.print_summary()
+        print(f"Profile trace written to: {os.path.abspath(args.profile)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
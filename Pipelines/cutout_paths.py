@@ -0,0 +1,121 @@
+import functools
+import hashlib
+import os
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VITALARBOR_DIR = os.path.dirname(SCRIPT_DIR)
+SEGMENTED_DIR = os.path.join(VITALARBOR_DIR, "Segmented photos")
+
+# Cutouts mirror the photo's folder under SEGMENTED_DIR, so
+# 11-9-2025/Crabapple_Evening_Images/Crabapple_Tree.png and
+# 11-9-2025/Crabapple_Afternoon_Images/Crabapple_Tree.png never share one.
+# Photos outside the repo go under EXTERNAL_DIR, in a folder named after
+# theirs plus a hash of its full path.
+EXTERNAL_DIR = "external"
+
+CUTOUT_SUFFIX = "_crop_out"
+
+# A *_crop_out.vmask (mask_format.py convert) is used like its .png
+CUTOUT_EXTENSIONS = (".png", ".vmask")
+
+PHOTO_EXTENSIONS = (".png", ".jpg", ".jpeg", ".jfif")
+
+
+class AmbiguousCutoutError(ValueError):
+    """Raised when an old cutout found by base name alone could belong to several photos."""
+
+
+def cutout_dir(image_path):
+    """
+    The folder under "Segmented photos" for the cutouts of a photo. Files
+    already inside "Segmented photos" keep their own folder.
+    """
+    folder = os.path.dirname(os.path.abspath(image_path))
+    if _is_inside(folder, SEGMENTED_DIR):
+        return folder
+    if _is_inside(folder, VITALARBOR_DIR):
+        return os.path.normpath(os.path.join(SEGMENTED_DIR, os.path.relpath(folder, VITALARBOR_DIR)))
+    digest = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(SEGMENTED_DIR, EXTERNAL_DIR, f"{os.path.basename(folder)}_{digest}")
+
+
+def cutout_path(image_path, suffix="", ext=".png"):
+    """Where the cutout of a photo is saved, e.g. .../Crabapple_Evening_Images/Crabapple_Tree_crop_out.png."""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(cutout_dir(image_path), f"{stem}{suffix}{CUTOUT_SUFFIX}{ext}")
+
+
+def find_cutout(image_path):
+    """
+    The segmented cutout of a photo, or None. A *_crop_out file is its own
+    cutout. Otherwise the PNG cutout is preferred, which also has the photo's
+    colors.
+
+    Cutouts saved before they were kept per folder lie directly in
+    "Segmented photos" under the photo's base name. Such a cutout is only
+    used when no other photo in the same survey has that name; otherwise
+    AmbiguousCutoutError is raised rather than analyzing the wrong photo.
+    """
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    if stem.endswith(CUTOUT_SUFFIX):
+        return image_path
+
+    for ext in CUTOUT_EXTENSIONS:
+        path = cutout_path(image_path, ext=ext)
+        if os.path.exists(path):
+            return path
+
+    for ext in CUTOUT_EXTENSIONS:
+        legacy_path = os.path.join(SEGMENTED_DIR, f"{stem}{CUTOUT_SUFFIX}{ext}")
+        if not os.path.exists(legacy_path):
+            continue
+        data_root = _data_root(image_path)
+        same_name = _photo_index(data_root).get(os.path.basename(image_path).lower(), [])
+        if len(same_name) > 1:
+            raise AmbiguousCutoutError(
+                f"{os.path.basename(legacy_path)} could be the cutout of any of {len(same_name)} photos named "
+                f"{os.path.basename(image_path)} in {data_root}; segment {image_path} again so its cutout is "
+                f"saved as {cutout_path(image_path)}"
+            )
+        return legacy_path
+    return None
+
+
+def clear_photo_index():
+    """Forget the photos scanned by find_cutout, after new ones were added."""
+    _photo_index.cache_clear()
+
+
+def _is_inside(path, folder):
+    try:
+        return os.path.commonpath([os.path.normcase(path), os.path.normcase(folder)]) == os.path.normcase(folder)
+    except ValueError:
+        # Different drives on Windows
+        return False
+
+
+def _data_root(image_path):
+    """
+    The folder whose photos might share a base name with this one: the
+    top-level folder of the repo it is in (2025-26_Data_Images), or for
+    photos outside the repo the folder above its own (the survey date).
+    """
+    folder = os.path.dirname(os.path.abspath(image_path))
+    if _is_inside(folder, VITALARBOR_DIR) and folder != VITALARBOR_DIR:
+        top = os.path.relpath(folder, VITALARBOR_DIR).split(os.sep)[0]
+        return os.path.join(VITALARBOR_DIR, top)
+    return os.path.dirname(folder)
+
+
+@functools.lru_cache(maxsize=None)
+def _photo_index(data_root):
+    """Lower-cased photo file name -> paths of every photo with that name under data_root."""
+    index = {}
+    for folder, _, files in os.walk(data_root):
+        if _is_inside(folder, SEGMENTED_DIR):
+            continue
+        for name in files:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in PHOTO_EXTENSIONS and not stem.endswith(CUTOUT_SUFFIX):
+                index.setdefault(name.lower(), []).append(os.path.join(folder, name))
+    return index
@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+
+
+def get_analysis_scale(height, width, analysis_long_side):
+    """
+    Factor that brings the long side of an image down to analysis_long_side.
+    Never upsamples: returns 1.0 when the image is already small enough or
+    no analysis resolution is set.
+    """
+    if not analysis_long_side or max(height, width) <= analysis_long_side:
+        return 1.0
+    return analysis_long_side / max(height, width)
+
+
+def downsample_mask(mask_bin, analysis_long_side):
+    """
+    Area-preserving downsample of a 0/255 mask to the analysis resolution.
+
+    INTER_AREA averages the pixels that fall in each output pixel, and
+    re-thresholding at 127 keeps the pixels that were mostly foreground.
+    Returns (small_mask, scale) with scale = small size / original size.
+    """
+    height, width = mask_bin.shape[:2]
+    scale = get_analysis_scale(height, width, analysis_long_side)
+    if scale == 1.0:
+        return mask_bin, 1.0
+
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    small = cv2.resize(mask_bin, size, interpolation=cv2.INTER_AREA)
+    small = (small > 127).astype(np.uint8) * 255
+    return small, scale
+
+
+def scale_length(length, scale, minimum=1):
+    """A pixel length (line length, gap, kernel size) at the analysis resolution."""
+    return max(minimum, int(round(length * scale)))
+
+
+def scale_area(area, scale, minimum=1):
+    """A pixel area (hole or speckle size) at the analysis resolution."""
+    return max(minimum, int(round(area * scale * scale)))
+
+
+def scale_window(window, scale, length, polyorder=3):
+    """
+    A savgol_filter window at the analysis resolution: odd, longer than
+    polyorder, and no longer than the signal it smooths.
+    """
+    window = scale_length(window, scale)
+    window = min(window, length if length % 2 == 1 else length - 1)
+    window = max(window, polyorder + 2)
+    if window % 2 == 0:
+        window += 1
+    return window
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Size-bounded on-disk LRU cache of SAM2 image embeddings.
+
+    Each entry is one uncompressed .npz file named after its key. The file's
+    modification time is the LRU clock: hits touch the file, and when the
+    directory grows past max_bytes the least recently used entries are
+    deleted. Features are stored as float32 by default, exactly as the
+    encoder returned them, so a cached run predicts the same masks as an
+    uncached one. dtype=np.float16 halves the footprint, at the cost of
+    masks that can differ slightly from uncached ones. Entries stored with
+    another dtype count as misses.
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3, dtype=np.float32):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_np, model_cfg, checkpoint_path):
+        """Hash of the decoded pixels plus the model config and checkpoint."""
+        digest = hashlib.sha256()
+        digest.update(str(image_np.shape).encode("utf-8"))
+        digest.update(np.ascontiguousarray(image_np).tobytes())
+        digest.update(model_cfg.encode("utf-8"))
+        digest.update(os.path.abspath(checkpoint_path).encode("utf-8"))
+        # Re-downloading or fine-tuning the checkpoint invalidates its entries
+        if os.path.exists(checkpoint_path):
+            stat = os.stat(checkpoint_path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Return (image_embed, [high_res_feats...], orig_hw) as float32 arrays,
+        or None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as data:
+                if data["image_embed"].dtype != self.dtype:
+                    raise ValueError(f"entry stored as {data['image_embed'].dtype}")
+                image_embed = data["image_embed"].astype(np.float32)
+                count = int(data["high_res_count"])
+                high_res_feats = [data[f"high_res_{i}"].astype(np.float32) for i in range(count)]
+                orig_hw = tuple(int(v) for v in data["orig_hw"])
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # mark as most recently used
+        except FileNotFoundError:
+            # Evicted by another worker since it was read; the features
+            # are already in memory, so it is still a hit
+            pass
+        with self._lock:
+            self.hits += 1
+        return image_embed, high_res_feats, orig_hw
+
+    def put(self, key, image_embed, high_res_feats, orig_hw):
+        arrays = {
+            "image_embed": np.asarray(image_embed, dtype=self.dtype),
+            "high_res_count": np.array(len(high_res_feats)),
+            "orig_hw": np.array(orig_hw, dtype=np.int64),
+        }
+        for i, feat in enumerate(high_res_feats):
+            arrays[f"high_res_{i}"] = np.asarray(feat, dtype=self.dtype)
+
+        # Write to a temp file first so readers never see a partial entry
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+        }
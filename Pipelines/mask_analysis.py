@@ -0,0 +1,369 @@
+import cv2
+import numpy as np
+
+import width_of_trunk
+import tilt_detection
+import mask_strips
+import mask_format
+import risk_score
+import result_store
+import sweep
+import profiling
+from downsample import get_analysis_scale
+
+
+def _silent(*args, **kwargs):
+    pass
+
+
+@profiling.profiled("mask.load")
+def load_cutout(mask_path):
+    """
+    Decode a segmented cutout once into (mask, rgb).
+
+    mask is a 0/255 uint8 array taken from the alpha channel when there is
+    one, else from a 127 threshold of the grayscale. rgb is the HxWx3 RGB
+    image, or None for single-channel masks and .vmask files.
+    """
+    if mask_path.lower().endswith(mask_format.MASK_EXTENSION):
+        return mask_format.read_mask(mask_path), None
+
+    img = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image from {mask_path}")
+
+    if img.ndim == 2:
+        return (img > 127).astype(np.uint8) * 255, None
+    if img.shape[2] == 4:
+        mask = (img[:, :, 3] > 127).astype(np.uint8) * 255
+        return mask, cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return (gray > 127).astype(np.uint8) * 255, cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def analyze_mask(mask, rgb=None, use_cutout=False, analysis_long_side=None,
+                 visualize=False, quiet=True, refine_tilt=False):
+    """
+    Run trunk width -> tilt -> risk score on a mask held in memory, without
+    writing anything to disk.
+
+    mask: HxW boolean or 0/255 mask (e.g. from sam2_segmentation.segment_with_prompts
+        or load_cutout)
+    rgb: optional photo aligned with the mask, cropped along with the trunk
+    use_cutout: detect tilt on the trunk crop instead of the whole mask
+    visualize: also render the width and tilt visualizations
+    refine_tilt: find the tilt coarse-to-fine (tilt_detection.refine_tilt)
+
+    The result has "sweep", the sweep.classify_sweep of the trunk band,
+    whose type adds to the risk score (risk_score.SWEEP_RISK_POINTS).
+
+    Raises ValueError when no trunk can be found.
+    """
+    log = _silent if quiet else print
+
+    width = width_of_trunk.analyze_trunk_width(
+        mask, rgb, analysis_long_side=analysis_long_side, visualize=visualize, log=log)
+
+    tilt, tilt_visualization, trunk_lines_count = _detect_tilt(
+        width["trunk_mask"] if use_cutout else mask, analysis_long_side, visualize, quiet, refine_tilt)
+    trunk_sweep = sweep.classify_sweep(width["centerline"], width["half_widths"])
+    score, category = _score(tilt, trunk_lines_count, trunk_sweep["sweep"])
+
+    return {
+        "tilt": float(tilt),
+        "trunk_lines_count": int(trunk_lines_count),
+        "sweep": trunk_sweep,
+        "risk_score": score,
+        "category": category,
+        "trunk_start": width["trunk_start"],
+        "trunk_end": width["trunk_end"],
+        "width": width,
+        "tilt_visualization": tilt_visualization,
+        "tilt_long_side": _tilt_long_side((width["trunk_mask"] if use_cutout else mask).shape, analysis_long_side),
+    }
+
+
+def _tilt_long_side(shape, analysis_long_side):
+    """
+    Long side of the mask the tilt was detected on, after any downsampling
+    (with refine_tilt the finest level, where it stops when no coarser fits).
+    """
+    scale = get_analysis_scale(shape[0], shape[1], analysis_long_side)
+    return int(round(max(shape[:2]) * scale))
+
+
+def _detect_tilt(mask, analysis_long_side, visualize, quiet, refine=False):
+    result = tilt_detection.detect_tree_tilt(
+        mask, quiet=quiet, analysis_long_side=analysis_long_side, visualize=visualize, refine=refine)
+    if result is None:
+        raise ValueError("Could not detect tree trunk")
+    tilt, tilt_visualization, _, trunk_lines_count = result
+    return tilt, tilt_visualization, trunk_lines_count
+
+
+def _score(tilt, trunk_lines_count, sweep_type=None):
+    score = risk_score.give_risk_score(tilt, trunk_lines_count, sweep=sweep_type)
+    category, _ = risk_score.get_risk_category(score)
+    return score, category
+
+
+def analyze_stored(store, image_hash, mask_params, load_mask, use_cutout=False,
+                   analysis_long_side=None, quiet=True, refine_tilt=False):
+    """
+    analyze_mask with every stage's output kept in a result_store.ResultStore,
+    so a rerun only recomputes the stages whose inputs or parameters changed.
+
+    image_hash: result_store.hash_file of the photo
+    mask_params: what the mask comes from (e.g. the cutout's hash, or the SAM2
+        settings); load_mask() is only called when no mask is stored for it
+    The fingerprints include the tunable constants of each stage, so changing
+    e.g. tilt_detection.HOUGH_THRESHOLD reruns tilt and risk only. Changes
+    to a stage's code rather than its constants need a bump of
+    result_store.STAGE_VERSIONS.
+
+    Returns the analyze_mask fields (no visualizations, "width" without the
+    crops) plus "recomputed", the stages that weren't in the store.
+    """
+    recomputed = []
+    mask_fp = result_store.stage_fingerprint("mask", mask_params)
+    mask_holder = []
+
+    def compute_mask():
+        mask = np.asarray(load_mask())
+        return {"mask": mask if mask.dtype == bool else mask > 127}
+
+    def get_mask():
+        # Only fetched when a downstream stage actually needs the pixels
+        if not mask_holder:
+            value, hit = store.cached(image_hash, "mask", mask_fp, compute_mask)
+            if not hit:
+                recomputed.append("mask")
+            mask_holder.append(value["mask"])
+        return mask_holder[0]
+
+    def stage(name, params, upstream, compute):
+        fingerprint = result_store.stage_fingerprint(name, params, upstream)
+        value, hit = store.cached(image_hash, name, fingerprint, compute)
+        if not hit:
+            recomputed.append(name)
+        return value, fingerprint
+
+    log = _silent if quiet else print
+
+    def compute_width():
+        width = width_of_trunk.analyze_trunk_width(get_mask(), analysis_long_side=analysis_long_side, log=log)
+        return {key: width[key] for key in
+                ("widths", "trunk_start", "trunk_end", "x_min", "x_max", "centerline", "half_widths")}
+
+    width, width_fp = stage("width", {
+        "analysis_long_side": analysis_long_side,
+        "savgol": [width_of_trunk.SAVGOL_WINDOW, width_of_trunk.SAVGOL_POLYORDER],
+        "stable_slope": width_of_trunk.STABLE_SLOPE_THRESHOLD,
+        "max_width_percentile": width_of_trunk.MAX_TRUNK_WIDTH_PERCENTILE,
+    }, mask_fp, compute_width)
+
+    def compute_tilt():
+        mask = get_mask()
+        if use_cutout:
+            mask = mask[width["trunk_start"]:width["trunk_end"], width["x_min"]:width["x_max"]]
+        tilt, _, trunk_lines_count = _detect_tilt(mask, analysis_long_side, False, quiet, refine_tilt)
+        return {"tilt": float(tilt), "trunk_lines_count": int(trunk_lines_count)}
+
+    tilt_params = {
+        "use_cutout": use_cutout,
+        "analysis_long_side": analysis_long_side,
+        "hough": [tilt_detection.HOUGH_THRESHOLD, tilt_detection.MIN_LINE_LENGTH, tilt_detection.MAX_LINE_GAP],
+        "trunk_lines": [tilt_detection.TRUNK_FRACTION, tilt_detection.MIN_LINE_ANGLE,
+                        tilt_detection.MIN_LINE_FRACTION],
+    }
+    if refine_tilt:
+        # Only part of the key when on, so stores written before refinement
+        # existed stay valid
+        tilt_params["refine"] = [list(tilt_detection.REFINE_LONG_SIDES), tilt_detection.MIN_TILT_FIT]
+
+    # The trunk crop only matters to tilt when use_cutout is set
+    tilt, tilt_fp = stage("tilt", tilt_params, width_fp if use_cutout else mask_fp, compute_tilt)
+
+    def compute_sweep():
+        return sweep.classify_sweep(width["centerline"], width["half_widths"])
+
+    trunk_sweep, sweep_fp = stage("sweep", {
+        "straight_degrees": sweep.STRAIGHT_DEGREES,
+        "max_fit_residual": sweep.MAX_FIT_RESIDUAL,
+        "min_rows": sweep.MIN_SWEEP_ROWS,
+    }, width_fp, compute_sweep)
+
+    def compute_risk():
+        score, category = _score(tilt["tilt"], tilt["trunk_lines_count"], trunk_sweep["sweep"])
+        return {"risk_score": score, "category": category}
+
+    risk, _ = stage("risk", {
+        "bands": risk_score.RISK_BANDS,
+        "low_confidence": [risk_score.LOW_CONFIDENCE_LINES, risk_score.LOW_CONFIDENCE_PENALTY],
+        "sweep_points": risk_score.SWEEP_RISK_POINTS,
+    }, [tilt_fp, sweep_fp], compute_risk)
+
+    return {
+        "tilt": tilt["tilt"],
+        "trunk_lines_count": tilt["trunk_lines_count"],
+        "sweep": trunk_sweep,
+        "risk_score": risk["risk_score"],
+        "category": risk["category"],
+        "trunk_start": width["trunk_start"],
+        "trunk_end": width["trunk_end"],
+        "width": width,
+        "tilt_visualization": None,
+        "recomputed": recomputed,
+    }
+
+
+def analyze_streamed(mask_path, use_cutout=False, analysis_long_side=None, tilt_long_side=None,
+                     strip_rows=mask_strips.STRIP_ROWS, quiet=True, refine_tilt=False):
+    """
+    analyze_mask for masks too big to hold several full-size copies of: the
+    mask is read in strips of strip_rows rows (memory-mapped for .npy, see
+    mask_strips.to_npy, decoded run by run for .vmask), which give the row
+    extents and a downsampled copy in one pass. Only the trunk crop is read
+    at full resolution.
+
+    Without analysis_long_side the width profile is at full resolution and
+    the whole-mask tilt runs at the same resolution as analyze_mask's (full
+    resolution), or at tilt_long_side to keep only a smaller copy of the
+    mask in memory; "tilt_long_side" in the result is the one used.
+    refine_tilt starts the tilt coarser and stops early like analyze_mask's,
+    with the downsampled copy as the finest level. Returns the analyze_mask
+    fields, without visualizations or "trunk_rgb".
+    """
+    log = _silent if quiet else print
+    source = mask_strips.open_mask(mask_path)
+    h, w = source.shape[:2]
+
+    if not analysis_long_side and use_cutout and hasattr(source, "row_extents"):
+        # A .vmask has the extents in its header and the tilt only needs the
+        # trunk crop, so no pixels outside the crop are decoded
+        scan = None
+    else:
+        scan = mask_strips.scan_mask(source, analysis_long_side or tilt_long_side, strip_rows)
+
+    if scan is None:
+        left, right, has_pixels = source.row_extents()
+        scale = 1.0
+    elif analysis_long_side:
+        left, right, has_pixels = width_of_trunk.get_row_extents(scan["small"])
+        scale = scan["scale"]
+    else:
+        left, right, has_pixels = scan["left"], scan["right"], scan["has_pixels"]
+        scale = 1.0
+    widths = np.where(has_pixels, right - left, 0).astype(float)
+
+    band = width_of_trunk.find_trunk_band(widths, scale)
+    trunk_start, trunk_end, x_min, x_max = width_of_trunk.band_bounds(band, left, right, has_pixels, scale, h, w)
+    centerline, half_widths = width_of_trunk.band_centerline(left, right, has_pixels, band)
+    trunk_sweep = sweep.classify_sweep(centerline, half_widths)
+    log(f"Detected trunk band: rows {trunk_start} to {trunk_end}")
+    with profiling.span("stream.crop"):
+        # 0/255 like the crop analyze_mask returns
+        trunk_mask = mask_strips.binarize_strip(source[trunk_start:trunk_end, x_min:x_max]).astype(np.uint8) * 255
+
+    if use_cutout:
+        tilt, _, trunk_lines_count = _detect_tilt(trunk_mask, analysis_long_side, False, quiet, refine_tilt)
+        used_long_side = _tilt_long_side(trunk_mask.shape, analysis_long_side)
+    else:
+        used_long_side = max(scan["small"].shape[:2])
+        if refine_tilt:
+            refined = tilt_detection.refine_tilt(scan["small"], log=log, scale=scan["scale"], original_shape=(h, w))
+            result = refined[0] if refined is not None else None
+        else:
+            result = tilt_detection.tilt_from_lines(scan["small"], scan["scale"], h, w, log)
+        if result is None:
+            raise ValueError("Could not detect tree trunk")
+        tilt, trunk_lines, _, _, _ = result
+        trunk_lines_count = len(trunk_lines)
+    score, category = _score(tilt, trunk_lines_count, trunk_sweep["sweep"])
+
+    width = {
+        "widths": widths,
+        "trunk_start": trunk_start,
+        "trunk_end": trunk_end,
+        "x_min": x_min,
+        "x_max": x_max,
+        "centerline": centerline,
+        "half_widths": half_widths,
+        "trunk_mask": trunk_mask,
+        "trunk_rgb": None,
+        "visualization": None,
+    }
+    return {
+        "tilt": float(tilt),
+        "trunk_lines_count": int(trunk_lines_count),
+        "sweep": trunk_sweep,
+        "risk_score": score,
+        "category": category,
+        "trunk_start": trunk_start,
+        "trunk_end": trunk_end,
+        "width": width,
+        "tilt_visualization": None,
+        "tilt_long_side": used_long_side,
+    }
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Trunk width -> tilt -> risk score for already segmented masks/cutouts, without loading SAM2."
+    )
+    parser.add_argument("masks", nargs="+", help="Segmented cutouts (*_crop_out.png) or binary masks")
+    parser.add_argument("--use-cutout", action="store_true", help="Detect tilt on the trunk crop instead of the full mask")
+    parser.add_argument("--analysis-long-side", type=int, default=None,
+                        help="Downsample masks to this long side (pixels) before the width and tilt stages")
+    parser.add_argument("--refine-tilt", action="store_true",
+                        help="Find the tilt coarse-to-fine, stopping at a low resolution when it fits the trunk")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read masks in row strips (memory-mapped for .npy) for very large photos")
+    parser.add_argument("--tilt-long-side", type=int, default=None,
+                        help="With --stream and no --analysis-long-side, detect the whole-mask tilt on a copy "
+                             f"downsampled to this long side, e.g. {mask_strips.STREAM_LONG_SIDE}, instead of at "
+                             "full resolution")
+    parser.add_argument("--strip-rows", type=int, default=mask_strips.STRIP_ROWS)
+    parser.add_argument("--json", action="store_true", help="Print one JSON line per mask")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for mask_path in args.masks:
+        try:
+            if args.stream:
+                result = analyze_streamed(mask_path, args.use_cutout, args.analysis_long_side, args.tilt_long_side,
+                                          strip_rows=args.strip_rows, refine_tilt=args.refine_tilt)
+            else:
+                mask, rgb = load_cutout(mask_path)
+                result = analyze_mask(mask, rgb, args.use_cutout, args.analysis_long_side,
+                                      refine_tilt=args.refine_tilt)
+        except (FileNotFoundError, ValueError) as e:
+            failures += 1
+            if args.json:
+                print(json.dumps({"mask": mask_path, "error": str(e)}))
+            else:
+                print(f"FAIL {mask_path}: {e}")
+            continue
+
+        fields = {key: result[key] for key in
+                  ("tilt", "trunk_lines_count", "risk_score", "category", "trunk_start", "trunk_end",
+                   "tilt_long_side")}
+        fields["sweep"] = result["sweep"]["sweep"]
+        fields["sweep_bend"] = result["sweep"]["bend"]
+        if args.json:
+            print(json.dumps({"mask": mask_path, **fields}))
+        else:
+            print(f"{mask_path}: tilt {fields['tilt']:.2f}° (at {fields['tilt_long_side']} px), {fields['sweep']} sweep, "
+                  f"risk {fields['risk_score']} {fields['category']}, "
+                  f"trunk rows {fields['trunk_start']}-{fields['trunk_end']}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+# .vmask: a binary mask stored as per-row runs of foreground pixels.
+#
+#   header       magic, version, height, width, bounding box, run count
+#   row_left     int32[height]  first foreground column of each row, -1 if empty
+#   row_right    int32[height]  last foreground column of each row, -1 if empty
+#   row_offsets  uint32[height + 1]  runs of row y are runs[row_offsets[y]:row_offsets[y + 1]]
+#   runs         uint32[run_count, 2]  (start, end) columns, end exclusive
+#
+# The bounding box and row extents are all the width stage needs, so they
+# are read without decoding any runs. Everything is little-endian.
+MAGIC = b"VMSK"
+VERSION = 1
+MASK_EXTENSION = ".vmask"
+
+# magic, version, flags, height, width, top, bottom, left, right, run_count
+HEADER = struct.Struct("<4sHHIIiiiiQ")
+
+# Rows encoded at a time, bounding the memory of the run search
+ENCODE_ROWS = 512
+
+
+def encode_runs(mask):
+    """
+    Foreground runs of a boolean mask, row by row.
+    Returns (counts per row, (N, 2) uint32 array of (start, end) columns).
+    """
+    # +1 where a run starts, -1 one past where it ends
+    edges = np.diff(mask.astype(np.int8), axis=1, prepend=0, append=0)
+    start_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    counts = np.bincount(start_rows, minlength=mask.shape[0])
+    return counts, np.column_stack((starts, ends)).astype(np.uint32)
+
+
+def write_mask(path, mask):
+    """Save a boolean or 0/255 mask as a .vmask file."""
+    mask = np.asarray(mask)
+    strips = ((row, mask[row:row + ENCODE_ROWS]) for row in range(0, mask.shape[0], ENCODE_ROWS))
+    write_strips(path, mask.shape[:2], ((row, strip if strip.dtype == bool else strip > 127)
+                                         for row, strip in strips))
+
+
+def write_strips(path, shape, strips):
+    """Save a mask given as (first_row, boolean strip) pairs in row order, e.g. mask_strips.iter_strips."""
+    height, width = shape
+
+    counts, runs = [], []
+    for _, strip in strips:
+        strip_counts, strip_runs = encode_runs(strip)
+        counts.append(strip_counts)
+        runs.append(strip_runs)
+    counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.intp)
+    runs = np.concatenate(runs) if runs else np.zeros((0, 2), dtype=np.uint32)
+
+    row_offsets = np.zeros(height + 1, dtype=np.uint32)
+    np.cumsum(counts, out=row_offsets[1:])
+    has_pixels = counts > 0
+    row_left = np.full(height, -1, dtype=np.int32)
+    row_right = np.full(height, -1, dtype=np.int32)
+    row_left[has_pixels] = runs[row_offsets[:-1][has_pixels], 0]
+    row_right[has_pixels] = runs[row_offsets[1:][has_pixels] - 1, 1].astype(np.int64) - 1
+
+    if has_pixels.any():
+        rows = np.flatnonzero(has_pixels)
+        box = (rows[0], rows[-1] + 1, row_left[has_pixels].min(), row_right[has_pixels].max() + 1)
+    else:
+        box = (0, 0, 0, 0)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, height, width, *map(int, box), len(runs)))
+        f.write(row_left.tobytes())
+        f.write(row_right.tobytes())
+        f.write(row_offsets.tobytes())
+        f.write(runs.tobytes())
+
+
+class CompactMask:
+    """
+    A .vmask file opened for reading. The row arrays and runs are
+    memory-mapped, so opening it reads only the header.
+
+    Indexing with rows (and optionally columns) decodes just that part into
+    a 0/255 uint8 array, so it can stand in for a memory-mapped mask:
+    mask[100:200] or mask[100:200, 50:80].
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a {MASK_EXTENSION} file")
+        magic, version, _, height, width, top, bottom, left, right, run_count = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a {MASK_EXTENSION} file")
+        if version != VERSION:
+            raise ValueError(f"{path} has {MASK_EXTENSION} version {version}, expected {VERSION}")
+
+        self.shape = (height, width)
+        self.bbox = (top, bottom, left, right)
+        self.run_count = run_count
+
+        offset = HEADER.size
+        self.row_left = self._map(np.int32, (height,), offset)
+        offset += 4 * height
+        self.row_right = self._map(np.int32, (height,), offset)
+        offset += 4 * height
+        self.row_offsets = self._map(np.uint32, (height + 1,), offset)
+        offset += 4 * (height + 1)
+        self.runs = self._map(np.uint32, (run_count, 2), offset)
+
+    def _map(self, dtype, shape, offset):
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def row_extents(self):
+        """(left, right, has_pixels) exactly as width_of_trunk.get_row_extents returns them."""
+        has_pixels = self.row_left >= 0
+        left = np.where(has_pixels, self.row_left, 0).astype(np.intp)
+        right = np.where(has_pixels, self.row_right, self.shape[1] - 1).astype(np.intp)
+        return left, right, has_pixels
+
+    def decode(self, rows=slice(None), cols=slice(None)):
+        """Boolean mask of the given row and column slices (steps aren't supported)."""
+        row_start, row_stop, _ = rows.indices(self.shape[0])
+        col_start, col_stop, _ = cols.indices(self.shape[1])
+        height = max(0, row_stop - row_start)
+        width = max(0, col_stop - col_start)
+        if height == 0 or width == 0:
+            return np.zeros((height, width), dtype=bool)
+
+        offsets = np.asarray(self.row_offsets[row_start:row_stop + 1], dtype=np.int64)
+        runs = np.asarray(self.runs[offsets[0]:offsets[-1]], dtype=np.int64)
+        run_rows = np.repeat(np.arange(height), np.diff(offsets))
+        starts = np.clip(runs[:, 0], col_start, col_stop) - col_start
+        ends = np.clip(runs[:, 1], col_start, col_stop) - col_start
+        inside = starts < ends
+
+        # Runs in a row never touch, so every start and end gets its own cell
+        edges = np.zeros((height, width + 1), dtype=np.int8)
+        edges[run_rows[inside], starts[inside]] = 1
+        edges[run_rows[inside], ends[inside]] = -1
+        return np.cumsum(edges[:, :width], axis=1, dtype=np.int8) > 0
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2 or not all(isinstance(part, slice) for part in key):
+            raise TypeError("CompactMask supports [rows] and [rows, cols] slices only")
+        return self.decode(*key).astype(np.uint8) * 255
+
+
+def read_mask(path):
+    """The whole .vmask as a 0/255 uint8 mask."""
+    return CompactMask(path)[:]
+
+
+def convert(mask_path, vmask_path=None):
+    """
+    Save the mask of a cutout (alpha > 127, else grayscale > 127) as
+    <name>.vmask next to it, or at vmask_path. Returns the path.
+    """
+    # mask_strips imports this module for CompactMask
+    from mask_strips import open_mask, iter_strips
+
+    if vmask_path is None:
+        vmask_path = os.path.splitext(mask_path)[0] + MASK_EXTENSION
+    source = open_mask(mask_path)
+    write_strips(vmask_path, source.shape[:2], iter_strips(source, ENCODE_ROWS))
+    return vmask_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert cutouts to compact .vmask masks and inspect them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser("convert", help="Write <name>.vmask next to every cutout/mask")
+    convert_parser.add_argument("masks", nargs="+", help="Segmented cutouts (*_crop_out.png) or binary masks")
+
+    info_parser = commands.add_parser("info", help="Print the header of .vmask files")
+    info_parser.add_argument("masks", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        before = after = 0
+        for mask_path in args.masks:
+            vmask_path = convert(mask_path)
+            before += os.path.getsize(mask_path)
+            after += os.path.getsize(vmask_path)
+            print(f"{mask_path} -> {vmask_path} "
+                  f"({os.path.getsize(mask_path) / 1e3:.0f} KB -> {os.path.getsize(vmask_path) / 1e3:.0f} KB)")
+        print(f"\n{len(args.masks)} masks: {before / 1e6:.1f} MB -> {after / 1e6:.2f} MB")
+    else:
+        for mask_path in args.masks:
+            mask = CompactMask(mask_path)
+            top, bottom, left, right = mask.bbox
+            print(f"{mask_path}: {mask.shape[1]}x{mask.shape[0]}, bounding box rows {top}-{bottom} "
+                  f"columns {left}-{right}, {mask.run_count} runs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+import profiling
+import mask_format
+from downsample import get_analysis_scale
+from width_of_trunk import get_row_extents
+
+# Rows read and binarized at a time
+STRIP_ROWS = 256
+
+# Long side scan_mask downsamples to by default. mask_analysis --stream
+# detects tilt at full resolution like the in-memory path unless
+# --tilt-long-side asks for a smaller copy such as this one
+STREAM_LONG_SIDE = 2048
+
+
+def open_mask(mask_path):
+    """
+    The mask as an array to read in strips. .npy masks (see to_npy) are
+    memory-mapped, so only the rows being read are in memory, and .vmask
+    masks (see mask_format) decode only the rows being read. Any other
+    image is decoded once by cv2 (BGRA, BGR or grayscale) and never copied.
+    """
+    if mask_path.lower().endswith(".npy"):
+        return np.load(mask_path, mmap_mode="r")
+    if mask_path.lower().endswith(mask_format.MASK_EXTENSION):
+        return mask_format.CompactMask(mask_path)
+    img = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise FileNotFoundError(f"Could not read image from {mask_path}")
+    return img
+
+
+def binarize_strip(strip):
+    """Boolean foreground of some rows: alpha > 127 for BGRA, else grayscale > 127."""
+    strip = np.asarray(strip)
+    if strip.dtype == bool:
+        return strip
+    if strip.ndim == 2:
+        return strip > 127
+    if strip.shape[2] == 4:
+        return strip[:, :, 3] > 127
+    return cv2.cvtColor(strip, cv2.COLOR_BGR2GRAY) > 127
+
+
+def iter_strips(source, strip_rows=STRIP_ROWS):
+    """Yields (first_row, boolean strip) over the rows of source."""
+    for row in range(0, source.shape[0], strip_rows):
+        yield row, binarize_strip(source[row:row + strip_rows])
+
+
+class StripDownsampler:
+    """
+    downsample_mask built up strip by strip: every strip is area-averaged
+    across columns with cv2, then spread over the output rows it overlaps,
+    so only the strip and the small output are ever in memory.
+    """
+
+    def __init__(self, height, width, analysis_long_side):
+        self.scale = get_analysis_scale(height, width, analysis_long_side)
+        self.out_w = max(1, int(round(width * self.scale)))
+        self.out_h = max(1, int(round(height * self.scale)))
+        # Row scale of the rounded output size, as cv2.resize uses it
+        self.row_scale = self.out_h / height
+        self.sums = np.zeros((self.out_h, self.out_w), dtype=np.float64)
+
+    def add(self, first_row, strip):
+        values = strip.astype(np.float32) * 255
+        if self.out_w != strip.shape[1]:
+            values = cv2.resize(values, (self.out_w, strip.shape[0]), interpolation=cv2.INTER_AREA)
+
+        # Input row i covers output rows [i * row_scale, (i + 1) * row_scale),
+        # which is at most two rows when downsampling
+        rows = np.arange(first_row, first_row + strip.shape[0])
+        starts = rows * self.row_scale
+        ends = (rows + 1) * self.row_scale
+        first = np.minimum(np.floor(starts).astype(int), self.out_h - 1)
+        split = np.minimum(first + 1, ends)
+        weights_first = split - starts
+        weights_next = ends - split
+
+        top = first[0]
+        bottom = min(first[-1] + 2, self.out_h)
+        weights = np.zeros((bottom - top, len(rows)))
+        columns = np.arange(len(rows))
+        weights[first - top, columns] = weights_first
+        has_next = (weights_next > 0) & (first + 1 < self.out_h)
+        weights[first[has_next] + 1 - top, columns[has_next]] = weights_next[has_next]
+        self.sums[top:bottom] += weights @ values
+
+    def result(self):
+        """The 0/255 mask at the analysis resolution, thresholded like downsample_mask."""
+        # downsample_mask keeps pixels that cv2 rounds to 128 or more. Averages
+        # of exactly 127.5 land on either side of that in cv2's float32 sums,
+        # so a handful of such pixels per mask can differ
+        return (self.sums > 127.5 - 1e-3).astype(np.uint8) * 255
+
+
+@profiling.profiled("stream.scan")
+def scan_mask(source, analysis_long_side=STREAM_LONG_SIDE, strip_rows=STRIP_ROWS):
+    """
+    One pass over source in strips. Returns a dict with the full-resolution
+    row extents ("left", "right", "has_pixels", see get_row_extents), the
+    mask downsampled to analysis_long_side ("small") and its "scale".
+    """
+    height, width = source.shape[:2]
+    # A .vmask has them in its header already
+    precomputed = hasattr(source, "row_extents")
+    if precomputed:
+        left, right, has_pixels = source.row_extents()
+    else:
+        left = np.zeros(height, dtype=np.intp)
+        right = np.zeros(height, dtype=np.intp)
+        has_pixels = np.zeros(height, dtype=bool)
+
+    downsampler = StripDownsampler(height, width, analysis_long_side)
+    small = [] if downsampler.scale == 1.0 else None
+
+    for row, strip in iter_strips(source, strip_rows):
+        if not precomputed:
+            rows = slice(row, row + strip.shape[0])
+            left[rows], right[rows], has_pixels[rows] = get_row_extents(strip)
+        if small is None:
+            downsampler.add(row, strip)
+        else:
+            small.append(strip)
+
+    if small is None:
+        small = downsampler.result()
+    else:
+        small = np.concatenate(small).astype(np.uint8) * 255
+
+    return {"left": left, "right": right, "has_pixels": has_pixels, "small": small,
+            "scale": downsampler.scale}
+
+
+def to_npy(mask_path, npy_path=None):
+    """
+    Save the foreground of a cutout/mask as a 0/255 uint8 .npy next to it
+    (or at npy_path), which open_mask then memory-maps. Returns the path.
+    """
+    if npy_path is None:
+        npy_path = os.path.splitext(mask_path)[0] + ".npy"
+    source = open_mask(mask_path)
+    out = np.lib.format.open_memmap(npy_path, mode="w+", dtype=np.uint8, shape=source.shape[:2])
+    for row, strip in iter_strips(source):
+        out[row:row + strip.shape[0]] = strip.astype(np.uint8) * 255
+    out.flush()
+    del out
+    return npy_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert cutouts/masks to .npy masks that the streaming analysis memory-maps."
+    )
+    parser.add_argument("masks", nargs="+", help="Segmented cutouts (*_crop_out.png) or binary masks")
+    args = parser.parse_args(argv)
+
+    for mask_path in args.masks:
+        npy_path = to_npy(mask_path)
+        print(f"{mask_path} -> {npy_path} ({os.path.getsize(npy_path) / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
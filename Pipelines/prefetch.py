@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+
+# Loaded items allowed to wait for the consumer. Together with the one being
+# loaded and the one being used, at most this + 2 are in memory at a time
+PREFETCH_DEPTH = 2
+
+_DONE = object()
+
+
+class Prefetcher:
+    """
+    Runs load(item) for every item on a background thread while the caller
+    works on the previous results, so decoding the next photos overlaps with
+    analyzing the current one. The queue between them holds at most depth
+    results; when it is full the loader waits (backpressure).
+
+    Iterating yields (item, value, error) in the order of items, where error
+    is the exception load raised (value is None then). Stopping the loop
+    early stops the loader. depth 0 loads every item only when it is asked
+    for, on the calling thread, which is useful for comparing.
+
+    After the loop, stats() tells how much of the load time was hidden
+    behind the caller's work.
+    """
+
+    def __init__(self, items, load, depth=PREFETCH_DEPTH):
+        self.items = list(items)
+        self.load = load
+        self.depth = max(0, depth)
+        self.load_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.compute_seconds = 0.0
+
+    def _load(self, item):
+        start = time.perf_counter()
+        try:
+            result = (item, self.load(item), None)
+        except Exception as e:
+            result = (item, None, e)
+        self.load_seconds += time.perf_counter() - start
+        return result
+
+    def _produce(self, results, stop):
+        for item in self.items:
+            result = self._load(item)
+            if not _put(results, result, stop):
+                return
+        _put(results, _DONE, stop)
+
+    def __iter__(self):
+        if self.depth == 0:
+            for item in self.items:
+                start = time.perf_counter()
+                result = self._load(item)
+                self.wait_seconds += time.perf_counter() - start
+                start = time.perf_counter()
+                yield result
+                self.compute_seconds += time.perf_counter() - start
+            return
+
+        results = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(results, stop), name="prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                result = results.get()
+                self.wait_seconds += time.perf_counter() - start
+                if result is _DONE:
+                    break
+                start = time.perf_counter()
+                yield result
+                self.compute_seconds += time.perf_counter() - start
+        finally:
+            stop.set()
+            thread.join()
+
+    def stats(self):
+        """
+        load_seconds: time spent loading, on the loader thread
+        compute_seconds: time the caller spent between items
+        wait_seconds: time the caller waited for an item that wasn't loaded yet
+        overlap: fraction of the load time hidden behind the caller's work
+        """
+        hidden = max(0.0, self.load_seconds - self.wait_seconds)
+        return {
+            "load_seconds": round(self.load_seconds, 3),
+            "compute_seconds": round(self.compute_seconds, 3),
+            "wait_seconds": round(self.wait_seconds, 3),
+            "overlap": round(hidden / self.load_seconds, 3) if self.load_seconds > 0 else 0.0,
+        }
+
+
+def _put(results, result, stop):
+    """Queue a result, unless the consumer stops first. Returns whether it was queued."""
+    # A timeout, so a consumer that stopped early can't leave the loader
+    # blocked forever
+    while not stop.is_set():
+        try:
+            results.put(result, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def print_stats(stats, work="analysis"):
+    print(f"Decode: {stats['load_seconds']:.2f}s, {work}: {stats['compute_seconds']:.2f}s, "
+          f"waiting for decode: {stats['wait_seconds']:.2f}s "
+          f"({stats['overlap']:.0%} of decoding overlapped with {work})")
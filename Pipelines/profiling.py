@@ -0,0 +1,213 @@
+# Stage-level profiling spans for the pipelines:
+#
+#     with profiling.span("tilt.hough"):
+#         lines = cv2.HoughLinesP(...)
+#
+# Each span records wall time, CPU time of the calling thread and (with memory
+# tracking) the peak traced memory above what was allocated when it started.
+# Spans export as Chrome-trace JSON (chrome://tracing, ui.perfetto.dev) or a
+# per-stage summary table.
+#
+# Off unless enable() is called, or VITALARBOR_PROFILE names a trace file to
+# write at exit. While off, span() returns one shared no-op context manager.
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+_enabled = False
+_track_memory = False
+_events = []
+_events_lock = threading.Lock()
+_local = threading.local()
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable(track_memory=None):
+    """
+    Start recording spans. track_memory uses tracemalloc, which slows
+    allocation down; by default it is on unless VITALARBOR_PROFILE_MEMORY=0.
+    """
+    global _enabled, _track_memory
+    if track_memory is None:
+        track_memory = os.environ.get("VITALARBOR_PROFILE_MEMORY", "1") != "0"
+    _enabled = True
+    _track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    if _track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _enabled
+
+
+class _Span:
+    __slots__ = ("name", "args", "start_ns", "start_cpu", "start_memory", "max_peak")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = _stack()
+        if _track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The parent keeps the peak seen so far, then the counter restarts
+            # so this span sees only its own peak
+            if stack:
+                stack[-1].max_peak = max(stack[-1].max_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+            self.max_peak = current
+        stack.append(self)
+        self.start_cpu = time.thread_time_ns()
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end_ns = time.perf_counter_ns()
+        end_cpu = time.thread_time_ns()
+        stack = _stack()
+        stack.pop()
+
+        event = {
+            "name": self.name,
+            "ts_us": self.start_ns / 1000,
+            "dur_us": (end_ns - self.start_ns) / 1000,
+            "cpu_us": (end_cpu - self.start_cpu) / 1000,
+            "peak_kb": None,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args,
+        }
+        if _track_memory and tracemalloc.is_tracing():
+            peak = max(self.max_peak, tracemalloc.get_traced_memory()[1])
+            event["peak_kb"] = (peak - self.start_memory) / 1024
+            if stack:
+                stack[-1].max_peak = max(stack[-1].max_peak, peak)
+
+        with _events_lock:
+            _events.append(event)
+        return False
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def span(name, **args):
+    """Context manager timing one stage; a shared no-op while profiling is off."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def profiled(name):
+    """Decorator version of span for whole functions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def take_events():
+    """Remove and return the recorded spans, e.g. to send them from a worker process."""
+    with _events_lock:
+        events = list(_events)
+        _events.clear()
+    return events
+
+
+def add_events(events):
+    """Add spans recorded elsewhere (e.g. by worker processes)."""
+    with _events_lock:
+        _events.extend(events)
+
+
+def get_events():
+    with _events_lock:
+        return list(_events)
+
+
+def export_chrome_trace(path, events=None):
+    """Write the spans as Chrome-trace "complete" events."""
+    events = get_events() if events is None else events
+    trace = []
+    for event in events:
+        args = dict(event["args"], cpu_ms=round(event["cpu_us"] / 1000, 3))
+        if event["peak_kb"] is not None:
+            args["peak_kb"] = round(event["peak_kb"], 1)
+        trace.append({
+            "name": event["name"],
+            "cat": event["name"].split(".")[0],
+            "ph": "X",
+            "ts": event["ts_us"],
+            "dur": event["dur_us"],
+            "pid": event["pid"],
+            "tid": event["tid"],
+            "args": args,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+def summarize(events=None):
+    """Per stage: count, total/mean wall ms, total CPU ms and max peak KB, slowest total first."""
+    events = get_events() if events is None else events
+    stages = {}
+    for event in events:
+        stage = stages.setdefault(event["name"], {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "peak_kb": None})
+        stage["count"] += 1
+        stage["wall_ms"] += event["dur_us"] / 1000
+        stage["cpu_ms"] += event["cpu_us"] / 1000
+        if event["peak_kb"] is not None:
+            stage["peak_kb"] = max(stage["peak_kb"] or 0.0, event["peak_kb"])
+    for stage in stages.values():
+        stage["mean_ms"] = stage["wall_ms"] / stage["count"]
+    return dict(sorted(stages.items(), key=lambda item: -item[1]["wall_ms"]))
+
+
+def print_summary(events=None):
+    stages = summarize(events)
+    if not stages:
+        print("No profiling spans recorded")
+        return
+    print("\n=== PROFILE ===")
+    print(f"{'stage':28s} {'count':>6s} {'total ms':>10s} {'mean ms':>9s} {'cpu ms':>9s} {'peak MB':>8s}")
+    for name, stage in stages.items():
+        peak = f"{stage['peak_kb'] / 1024:8.1f}" if stage["peak_kb"] is not None else f"{'-':>8s}"
+        print(f"{name:28s} {stage['count']:6d} {stage['wall_ms']:10.1f} {stage['mean_ms']:9.2f} "
+              f"{stage['cpu_ms']:9.1f} {peak}")
+
+
+def _report_at_exit(path):
+    if _events:
+        export_chrome_trace(path)
+        print_summary()
+        print(f"Profile trace written to {os.path.abspath(path)}")
+
+
+_trace_path = os.environ.get("VITALARBOR_PROFILE")
+if _trace_path:
+    enable()
+    atexit.register(_report_at_exit, _trace_path)
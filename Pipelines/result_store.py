@@ -0,0 +1,135 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Bump a stage's version when its algorithm changes in a way its parameters
+# don't capture. Every stage after it reruns too, since fingerprints chain.
+STAGE_VERSIONS = {
+    "mask": 1,
+    "width": 2,
+    "tilt": 1,
+    "sweep": 2,
+    "risk": 1,
+}
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """sha256 of a file's bytes, so renamed or copied photos hit the same results."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_fingerprint(stage, params, upstream=None):
+    """
+    Fingerprint of one stage's output: its version, its parameters and the
+    fingerprint of the stage it reads from. Changing a parameter changes this
+    stage's fingerprint and every fingerprint downstream of it, but not the
+    ones upstream.
+    """
+    payload = json.dumps(
+        {"stage": stage, "version": STAGE_VERSIONS[stage], "params": params, "upstream": upstream},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _encode(value):
+    """dict of arrays and JSON values -> bytes (arrays in a compressed npz)."""
+    arrays = {key: item for key, item in value.items() if isinstance(item, np.ndarray)}
+    meta = {key: item for key, item in value.items() if not isinstance(item, np.ndarray)}
+    arrays["__meta__"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _decode(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        value = json.loads(data["__meta__"].tobytes().decode("utf-8"))
+        for key in data.files:
+            if key != "__meta__":
+                value[key] = data[key]
+    return value
+
+
+class ResultStore:
+    """
+    SQLite store of stage outputs keyed by (image hash, stage, fingerprint).
+
+    Values are dicts of numpy arrays and JSON-serializable values. Several
+    processes can share one database file; each should open its own store.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " image_hash TEXT NOT NULL,"
+            " stage TEXT NOT NULL,"
+            " fingerprint TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " value BLOB NOT NULL,"
+            " PRIMARY KEY (image_hash, stage, fingerprint))"
+        )
+        self.connection.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, image_hash, stage, fingerprint):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM results WHERE image_hash = ? AND stage = ? AND fingerprint = ?",
+                (image_hash, stage, fingerprint),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _decode(row[0])
+
+    def put(self, image_hash, stage, fingerprint, value):
+        blob = _encode(value)
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (image_hash, stage, fingerprint, created, value) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (image_hash, stage, fingerprint, time.time(), blob),
+            )
+            self.connection.commit()
+
+    def cached(self, image_hash, stage, fingerprint, compute):
+        """Returns (value, was_cached), calling compute() and storing its result on a miss."""
+        value = self.get(image_hash, stage, fingerprint)
+        if value is not None:
+            return value, True
+        value = compute()
+        self.put(image_hash, stage, fingerprint, value)
+        return value, False
+
+    def stats(self):
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT stage, COUNT(*), SUM(LENGTH(value)) FROM results GROUP BY stage"
+            ).fetchall()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stages": {stage: {"entries": count, "bytes": size} for stage, count, size in rows},
+        }
+
+    def close(self):
+        self.connection.close()
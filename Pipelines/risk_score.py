@@ -1,10 +1,47 @@
-def give_risk_score(tilt_angle, trunk_lines_count=None):
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+import profiling
+
+# Risk bands: (tilt_from, tilt_to, score_from, score_to, category, color).
+# A tilt inside a band maps linearly onto its scores; tilts past the last
+# band get its top score. Categories are picked by score, so the confidence
+# penalty can move a tree into the next band.
+# 0-10°: Low risk (score 1-10)
+# 10-20°: Moderate risk (score 11-20)
+# 20-30°: High risk (score 21-30)
+# 30+°: Critical risk (score 31-40)
+RISK_BANDS = (
+    (0, 10, 1, 10, "LOW RISK", "green"),
+    (10, 20, 11, 20, "MODERATE RISK", "yellow"),
+    (20, 30, 21, 30, "HIGH RISK", "orange"),
+    (30, 40, 31, 40, "CRITICAL RISK", "red"),
+)
+
+# Fewer trunk lines than this is a low-confidence tilt, which adds the penalty
+LOW_CONFIDENCE_LINES = 5
+LOW_CONFIDENCE_PENALTY = 2
+
+# Points added for the trunk's sweep (sweep.classify_sweep). A plated sweep
+# keeps leaning all the way up, as a tree whose root plate has tipped
+SWEEP_RISK_POINTS = {"plated": 3}
+
+
+@profiling.profiled("risk")
+def give_risk_score(tilt_angle, trunk_lines_count=None, bands=RISK_BANDS, sweep=None):
     """
     Calculate tree fall risk score based on tilt angle and other factors.
     
     Parameters:
     - tilt_angle: angle in degrees from vertical (0 = perfectly vertical)
     - trunk_lines_count: number of detected trunk lines (optional, for confidence)
+    - bands: the band table, see RISK_BANDS
+    - sweep: sweep type of the trunk (optional), see SWEEP_RISK_POINTS
     
     Returns:
     - risk_score: 1-40 score (1=lowest risk, 40=highest risk)
@@ -12,45 +49,101 @@ def give_risk_score(tilt_angle, trunk_lines_count=None):
     
     # Base risk calculation from tilt angle
     abs_tilt = abs(tilt_angle)
+    max_score = bands[-1][3]
     
-    # More relaxed risk thresholds:
-    # 0-10°: Low risk (score 1-10)
-    # 10-20°: Moderate risk (score 11-20)
-    # 20-30°: High risk (score 21-30)
-    # 30+°: Critical risk (score 31-40)
-    
-    if abs_tilt <= 10:
-        # Low risk: linear scale from 1 to 10
-        risk_score = 1 + (abs_tilt / 10.0) * 9
-    elif abs_tilt <= 20:
-        # Moderate risk: linear scale from 11 to 20
-        risk_score = 11 + ((abs_tilt - 10) / 10.0) * 9
-    elif abs_tilt <= 30:
-        # High risk: linear scale from 21 to 30
-        risk_score = 21 + ((abs_tilt - 20) / 10.0) * 9
+    for tilt_from, tilt_to, score_from, score_to, _, _ in bands:
+        if abs_tilt <= tilt_to:
+            # Linear scale across the band
+            risk_score = score_from + ((abs_tilt - tilt_from) / (tilt_to - tilt_from)) * (score_to - score_from)
+            break
     else:
-        # Critical risk: linear scale from 31 to 40, capped at 40
-        risk_score = 31 + min((abs_tilt - 30) / 10.0, 1.0) * 9
-        risk_score = min(risk_score, 40)
+        # Past the last band: its top score
+        risk_score = score_from + min((abs_tilt - tilt_from) / (tilt_to - tilt_from), 1.0) * (score_to - score_from)
+        risk_score = min(risk_score, max_score)
     
     # Confidence adjustment (optional)
-    if trunk_lines_count is not None and trunk_lines_count < 5:
+    if trunk_lines_count is not None and trunk_lines_count < LOW_CONFIDENCE_LINES:
         # Low confidence - add uncertainty penalty
-        risk_score = min(risk_score + 2, 40)
+        risk_score = min(risk_score + LOW_CONFIDENCE_PENALTY, max_score)
+    
+    # Sweep adjustment (optional)
+    if sweep is not None:
+        risk_score = min(risk_score + SWEEP_RISK_POINTS.get(sweep, 0), max_score)
     
     return round(risk_score, 1)
 
 
-def get_risk_category(risk_score):
+def get_risk_category(risk_score, bands=RISK_BANDS):
     """Get risk category and color based on score."""
-    if risk_score <= 10:
-        return "LOW RISK", "green"
-    elif risk_score <= 20:
-        return "MODERATE RISK", "yellow"
-    elif risk_score <= 30:
-        return "HIGH RISK", "orange"
-    else:
-        return "CRITICAL RISK", "red"
+    for band in bands:
+        if risk_score <= band[3]:
+            return band[4], band[5]
+    return bands[-1][4], bands[-1][5]
+
+
+def score_risk(tilts, trunk_lines_counts=None, adjustments=(), bands=RISK_BANDS):
+    """
+    give_risk_score and get_risk_category for whole arrays at once, e.g. to
+    rescore an archive of results after changing the bands.
+
+    tilts: degrees from vertical (sign ignored)
+    trunk_lines_counts: optional, NaN where unknown (no confidence penalty)
+    adjustments: arrays of score points added per tree before the cap, for
+        factors beyond tilt
+    Returns (scores, categories, colors) arrays; scores are rounded to one
+    decimal like give_risk_score.
+    """
+    abs_tilt = np.abs(np.asarray(tilts, dtype=float))
+    tilt_from, tilt_to, score_from, score_to = (np.array([band[i] for band in bands], dtype=float)
+                                                for i in range(4))
+
+    # First band whose upper tilt reaches the tilt; past the last band is its top
+    band = np.minimum(np.searchsorted(tilt_to, abs_tilt, side="left"), len(bands) - 1)
+    fraction = np.minimum((abs_tilt - tilt_from[band]) / (tilt_to[band] - tilt_from[band]), 1.0)
+    scores = score_from[band] + fraction * (score_to[band] - score_from[band])
+
+    if trunk_lines_counts is not None:
+        lines = np.asarray(trunk_lines_counts, dtype=float)
+        # NaN < LOW_CONFIDENCE_LINES is False, so unknown counts get no penalty
+        scores = scores + np.where(lines < LOW_CONFIDENCE_LINES, LOW_CONFIDENCE_PENALTY, 0)
+    for adjustment in adjustments:
+        scores = scores + np.asarray(adjustment, dtype=float)
+    scores = np.round(np.minimum(scores, score_to[-1]), 1)
+
+    categories, colors = categorize(scores, bands)
+    return scores, categories, colors
+
+
+def sweep_adjustment(sweeps):
+    """score_risk adjustment for an array of sweep types (None/"" where unknown)."""
+    return np.array([SWEEP_RISK_POINTS.get(sweep, 0) for sweep in sweeps], dtype=float)
+
+
+def categorize(scores, bands=RISK_BANDS):
+    """get_risk_category for an array of scores: (categories, colors) arrays."""
+    band = np.minimum(np.searchsorted([b[3] for b in bands], scores, side="left"), len(bands) - 1)
+    return np.array([b[4] for b in bands])[band], np.array([b[5] for b in bands])[band]
+
+
+def rescore_records(records, bands=RISK_BANDS):
+    """
+    Recompute risk_score and category of batch_runner records in place with
+    score_risk, including the "sweep" points. Records without a tilt
+    (errors) are left alone. Values may be strings, as read from a CSV.
+    Returns how many records were rescored.
+    """
+    scored = [record for record in records if record.get("tilt") not in (None, "")]
+    if not scored:
+        return 0
+    tilts = [float(record["tilt"]) for record in scored]
+    lines = [float(record["trunk_lines_count"]) if record.get("trunk_lines_count") not in (None, "") else np.nan
+             for record in scored]
+    adjustments = [sweep_adjustment([record.get("sweep") for record in scored])]
+    scores, categories, _ = score_risk(tilts, lines, adjustments, bands=bands)
+    for record, score, category in zip(scored, scores.tolist(), categories.tolist()):
+        record["risk_score"] = score
+        record["category"] = category
+    return len(scored)
 
 
 def display_risk_gradient(risk_score, tilt_angle):
@@ -93,29 +186,14 @@ def display_risk_gradient(risk_score, tilt_angle):
     print(f"\n{COLORS['bold']}Risk Level:{COLORS['reset']}")
     print("└─ 1" + " " * (bar_length - 6) + "40 ─┘")
     
-    bar = ""
-    for i in range(bar_length):
-        # Determine color for this segment
-        segment_score = 1 + (i / (bar_length - 1)) * 39
-        
-        if segment_score <= 10:
-            color = COLORS['green']
-            char = "█"
-        elif segment_score <= 20:
-            color = COLORS['yellow']
-            char = "█"
-        elif segment_score <= 30:
-            color = COLORS['orange']
-            char = "█"
-        else:
-            color = COLORS['red']
-            char = "█"
-        
-        # Add marker at risk score position
-        if i == marker_position:
-            bar += f"{COLORS['blue']}{COLORS['bold']}▼{COLORS['reset']}"
-        else:
-            bar += f"{color}{char}{COLORS['reset']}"
+    # Segment i stands for score 1 + 39 * i / (bar_length - 1), colored by its band
+    segment_scores = 1 + (np.arange(bar_length) / (bar_length - 1)) * 39
+    _, segment_colors = categorize(segment_scores)
+    bar = "".join(
+        f"{COLORS['blue']}{COLORS['bold']}▼{COLORS['reset']}" if i == marker_position
+        else f"{COLORS[color]}█{COLORS['reset']}"
+        for i, color in enumerate(segment_colors)
+    )
     
     print("   " + bar)
     
@@ -147,4 +225,43 @@ def display_risk_gradient(risk_score, tilt_angle):
         print("  Consult certified arborist within 1-3 months.")
         print("  Consider remediation options or removal if necessary.")
     
-    print("="*60 + "\n")
\ No newline at end of file
+    print("="*60 + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rescore batch_runner results with the current RISK_BANDS, without analyzing any photos again."
+    )
+    parser.add_argument("results", help="A .jsonl or .csv written by batch_runner.py")
+    parser.add_argument("-o", "--output", default=None, help="Default: <results>_rescored.jsonl/.csv")
+    args = parser.parse_args(argv)
+
+    import batch_runner
+
+    is_csv = args.results.lower().endswith(".csv")
+    with open(args.results, newline="", encoding="utf-8") as f:
+        if is_csv:
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    before = [record.get("category") for record in records]
+    rescored = rescore_records(records)
+    changed = sum(old != record.get("category") for old, record in zip(before, records))
+
+    stem, ext = os.path.splitext(args.results)
+    output_path = args.output or f"{stem}_rescored{ext}"
+    writer = batch_runner.RecordWriter(output_path)
+    try:
+        for record in records:
+            writer.write(record)
+    finally:
+        writer.close()
+
+    print(f"Rescored {rescored} of {len(records)} records, {changed} changed category")
+    print(f"Results written to: {os.path.abspath(output_path)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
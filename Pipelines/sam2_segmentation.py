@@ -1,53 +1,545 @@
-import torch
 import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt  # type: ignore
+import argparse
+import csv
+import json
 import os
+import sys
+import threading
+import time
+
+# torch and matplotlib are imported inside the functions that use them, so
+# the CLI helpers, encoder profiles and make_cutout don't load them
+
+import cutout_paths
+from embedding_cache import EmbeddingCache
+import prefetch
+import profiling
 
 # Get the directory paths
-def run_sam2_segmentation(image_path):
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    vitalarbor_dir = os.path.dirname(script_dir)
-    sam2_dir = os.path.join(vitalarbor_dir, "sam2")
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VITALARBOR_DIR = os.path.dirname(SCRIPT_DIR)
+SAM2_DIR = os.path.join(VITALARBOR_DIR, "sam2")
+SAM2_INNER_DIR = os.path.join(SAM2_DIR, "sam2")
+
+# Encoder profiles, fastest first: checkpoint file and model config
+ENCODER_PROFILES = {
+    "tiny": ("sam2.1_hiera_tiny.pt", "configs/sam2.1/sam2.1_hiera_t.yaml"),
+    "small": ("sam2.1_hiera_small.pt", "configs/sam2.1/sam2.1_hiera_s.yaml"),
+    "base_plus": ("sam2.1_hiera_base_plus.pt", "configs/sam2.1/sam2.1_hiera_b+.yaml"),
+    "large": ("sam2.1_hiera_large.pt", "configs/sam2.1/sam2.1_hiera_l.yaml"),
+}
+DEFAULT_PROFILE = "large"
+
+CHECKPOINT_PATH = os.path.join(SAM2_DIR, "checkpoints", ENCODER_PROFILES[DEFAULT_PROFILE][0])
+MODEL_CFG = ENCODER_PROFILES[DEFAULT_PROFILE][1]
+EMBEDDING_CACHE_DIR = os.path.join(VITALARBOR_DIR, "Embedding cache")
+
+# Cached embeddings are float32 so cached and uncached runs give the same
+# masks; VITALARBOR_EMBEDDING_FP16=1 stores half the bytes instead
+EMBEDDING_CACHE_DTYPE = np.float16 if os.environ.get("VITALARBOR_EMBEDDING_FP16", "0") == "1" else np.float32
+
+# One predictor per process, built on first use and shared by every image
+_predictor = None
+_load_lock = threading.Lock()
+
+# SAM2ImagePredictor keeps the encoded image as state, so callers sharing the
+# predictor between threads must hold this lock from set_image to predict
+predictor_lock = threading.RLock()
+
+_embedding_cache = None
+
+# Encoder settings used by get_predictor, from the environment unless
+# configure() is called before the model is loaded
+_encoder_config = {
+    "profile": os.environ.get("VITALARBOR_SAM2_PROFILE", DEFAULT_PROFILE),
+    "quantize": os.environ.get("VITALARBOR_SAM2_QUANTIZE", "0") == "1",
+    "threads": int(os.environ["VITALARBOR_SAM2_THREADS"]) if os.environ.get("VITALARBOR_SAM2_THREADS") else None,
+}
+
+# Path of the cutout saved by the last interactive session
+saved_file_path = None
+
+_timings = {
+    "load_seconds": None,
+    "images_encoded": 0,
+    "cache_hits": 0,
+    "encode_seconds": 0.0,
+    "predictions": 0,
+    "predict_seconds": 0.0,
+}
+
+
+def get_profile_paths(profile):
+    """Returns (checkpoint_path, model_cfg) of an encoder profile."""
+    if profile not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile {profile!r}, choose from {', '.join(ENCODER_PROFILES)}")
+    checkpoint_name, model_cfg = ENCODER_PROFILES[profile]
+    return os.path.join(SAM2_DIR, "checkpoints", checkpoint_name), model_cfg
+
+
+def configure(profile=None, quantize=None, threads=None):
+    """
+    Choose the encoder used by get_predictor. Must be called before the model
+    is loaded; arguments left as None keep their current value.
+
+    profile: one of ENCODER_PROFILES (env VITALARBOR_SAM2_PROFILE)
+    quantize: dynamic int8 quantization of the image encoder's linear layers
+        (env VITALARBOR_SAM2_QUANTIZE=1)
+    threads: torch intra-op threads (env VITALARBOR_SAM2_THREADS)
+    """
+    if _predictor is not None:
+        raise RuntimeError("configure() must be called before the SAM2 model is loaded")
+    if profile is not None:
+        get_profile_paths(profile)
+        _encoder_config["profile"] = profile
+    if quantize is not None:
+        _encoder_config["quantize"] = quantize
+    if threads is not None:
+        _encoder_config["threads"] = threads
 
+
+def get_encoder_config():
+    return dict(_encoder_config)
+
+
+def build_sam2(model_cfg, checkpoint_path, video=False):
+    """
+    Build a SAM2 model on CPU from the sam2 folder next to the repo, without
+    changing the working directory. With video, the SAM2VideoPredictor
+    (see sam2_sequence.py).
+    """
     # Add the inner sam2 directory to path
-    import sys
-    sam2_inner_dir = os.path.join(sam2_dir, "sam2")
-    if sam2_inner_dir not in sys.path:
-        sys.path.insert(0, sam2_inner_dir)
+    if SAM2_INNER_DIR not in sys.path:
+        sys.path.insert(0, SAM2_INNER_DIR)
+
+    # Now we can use the build_sam functions
+    from build_sam import build_sam2, build_sam2_video_predictor  # type: ignore
+    from hydra import initialize_config_dir  # type: ignore
+    from hydra.core.global_hydra import GlobalHydra  # type: ignore
+
+    build = build_sam2_video_predictor if video else build_sam2
+
+    # Point hydra at the config folder instead of chdir-ing into it. If the
+    # sam2 package already initialized hydra, its config module is used as is.
+    if GlobalHydra.instance().is_initialized():
+        return build(model_cfg, checkpoint_path, device="cpu")
+    with initialize_config_dir(config_dir=SAM2_INNER_DIR, version_base="1.2"):
+        # Force CPU by setting device to cpu
+        return build(model_cfg, checkpoint_path, device="cpu")
+
+
+def quantize_encoder(sam2_model):
+    """
+    Dynamic int8 quantization of the image encoder. The Hiera trunk is mostly
+    Linear layers, which dynamic quantization runs as int8 matmuls on CPU.
+    The mask decoder stays in float.
+    """
+    import torch
+
+    sam2_model.image_encoder = torch.ao.quantization.quantize_dynamic(
+        sam2_model.image_encoder, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def build_predictor(profile=DEFAULT_PROFILE, quantize=False):
+    """
+    Build a SAM2ImagePredictor for an encoder profile without changing the
+    working directory. Most callers want the shared get_predictor() instead.
+    """
+    checkpoint_path, model_cfg = get_profile_paths(profile)
+    sam2_model = build_sam2(model_cfg, checkpoint_path)
+    if quantize:
+        quantize_encoder(sam2_model)
 
-    # Now we can use the build_sam function
-    from build_sam import build_sam2  # type: ignore
     from sam2_image_predictor import SAM2ImagePredictor  # type: ignore
 
-    # Load checkpoint
-    checkpoint_path = os.path.join(sam2_dir, "checkpoints", "sam2.1_hiera_large.pt")
-    model_cfg = "configs/sam2.1/sam2.1_hiera_l.yaml"
+    predictor = SAM2ImagePredictor(sam2_model)
+    # Identifies the encoder output for the embedding cache
+    predictor.vitalarbor_model_id = (model_cfg + (":int8" if quantize else ""), checkpoint_path)
+    return predictor
 
-    # Build the model using the official build function
-    # Change directory temporarily so hydra can find configs
-    original_dir = os.getcwd()
-    os.chdir(sam2_inner_dir)
 
-    try:
-        # Force CPU by setting device to cpu
-        sam2_model = build_sam2(model_cfg, checkpoint_path, device="cpu")
-        predictor = SAM2ImagePredictor(sam2_model)
-    finally:
-        os.chdir(original_dir)
+def get_predictor():
+    """
+    Return the process-wide SAM2ImagePredictor, loading the model the first
+    time it is needed. Safe to call from several threads at once.
+    """
+    global _predictor
+    if _predictor is None:
+        with _load_lock:
+            if _predictor is None:
+                import torch
+
+                config = _encoder_config
+                if config["threads"]:
+                    torch.set_num_threads(config["threads"])
+                print(f"Loading SAM2 model ({config['profile']}"
+                      f"{', int8 encoder' if config['quantize'] else ''}, "
+                      f"{torch.get_num_threads()} threads)...")
+                start = time.perf_counter()
+                with profiling.span("sam2.load_model", profile=config["profile"]):
+                    _predictor = build_predictor(config["profile"], config["quantize"])
+                _timings["load_seconds"] = time.perf_counter() - start
+                print(f"SAM2 model loaded in {_timings['load_seconds']:.2f}s")
+    return _predictor
+
+
+def get_embedding_cache():
+    """Return the process-wide embedding cache stored in VitalArbor/Embedding cache."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _load_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, dtype=EMBEDDING_CACHE_DTYPE)
+    return _embedding_cache
+
+
+def _extract_features(predictor):
+    features = predictor._features
+    image_embed = features["image_embed"].float().cpu().numpy()
+    high_res_feats = [feat.float().cpu().numpy() for feat in features["high_res_feats"]]
+    return image_embed, high_res_feats, tuple(predictor._orig_hw[0])
+
+
+def _restore_features(predictor, image_embed, high_res_feats, orig_hw):
+    """Put cached encoder output back into the predictor, as set_image would."""
+    import torch
+
+    predictor.reset_predictor()
+    predictor._orig_hw = [orig_hw]
+    predictor._features = {
+        "image_embed": torch.from_numpy(image_embed).to(predictor.device),
+        "high_res_feats": [torch.from_numpy(feat).to(predictor.device) for feat in high_res_feats],
+    }
+    predictor._is_image_set = True
+
+
+def image_key(predictor, image_np):
+    """Embedding cache key of image_np for predictor's model: a hash of the decoded pixels."""
+    model_cfg, checkpoint_path = getattr(predictor, "vitalarbor_model_id", (MODEL_CFG, CHECKPOINT_PATH))
+    return EmbeddingCache.make_key(image_np, model_cfg, checkpoint_path)
+
+
+def encode_image(predictor, image_np, cache=None, key=None):
+    """
+    Run the image encoder once for image_np and record how long it took.
+    With a cache, an image that was encoded before skips the encoder entirely.
+    key is image_key(predictor, image_np) if the caller already has it.
+    """
+    import torch
+
+    start = time.perf_counter()
+    if cache is not None:
+        key = key or image_key(predictor, image_np)
+        with profiling.span("sam2.cache_lookup"):
+            cached = cache.get(key)
+        if cached is not None:
+            with profiling.span("sam2.cache_restore"):
+                _restore_features(predictor, *cached)
+            _timings["cache_hits"] += 1
+            return time.perf_counter() - start
+
+    with torch.inference_mode(), profiling.span("sam2.set_image"):
+        predictor.set_image(image_np)
+    elapsed = time.perf_counter() - start
+    _timings["images_encoded"] += 1
+    _timings["encode_seconds"] += elapsed
+
+    if cache is not None:
+        with profiling.span("sam2.cache_store"):
+            cache.put(key, *_extract_features(predictor))
+    return elapsed
+
+
+def predict_mask(predictor, **prompt_kwargs):
+    """Call predictor.predict on the encoded image and record how long it took."""
+    import torch
+
+    start = time.perf_counter()
+    with torch.inference_mode(), profiling.span("sam2.predict"):
+        masks, scores, logits = predictor.predict(**prompt_kwargs)
+    _timings["predictions"] += 1
+    _timings["predict_seconds"] += time.perf_counter() - start
+    return masks, scores, logits
+
+
+def get_timings():
+    """
+    Summarize one-off model load cost against the average per-image cost
+    (encode plus one prediction) seen so far in this process.
+    """
+    encoded = _timings["images_encoded"]
+    predicted = _timings["predictions"]
+    encode_mean = _timings["encode_seconds"] / encoded if encoded else None
+    predict_mean = _timings["predict_seconds"] / predicted if predicted else None
+
+    per_image = None
+    if encode_mean is not None:
+        per_image = encode_mean + (predict_mean or 0.0)
+
+    load_vs_image = None
+    if _timings["load_seconds"] is not None and per_image:
+        load_vs_image = _timings["load_seconds"] / per_image
+
+    return {
+        "load_seconds": _timings["load_seconds"],
+        "images_encoded": encoded,
+        "cache_hits": _timings["cache_hits"],
+        "mean_encode_seconds": encode_mean,
+        "predictions": predicted,
+        "mean_predict_seconds": predict_mean,
+        "mean_per_image_seconds": per_image,
+        "load_vs_image_ratio": load_vs_image,
+    }
+
+
+def print_timings():
+    timings = get_timings()
+    print("\n=== SAM2 TIMINGS ===")
+    if timings["load_seconds"] is None:
+        print("Model not loaded yet")
+        return
+    print(f"Model load (once): {timings['load_seconds']:.2f}s")
+    if _embedding_cache is not None:
+        cache_stats = _embedding_cache.stats()
+        print(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if timings["mean_per_image_seconds"] is None:
+        print("No images encoded yet")
+        return
+    print(f"Images encoded: {timings['images_encoded']}, "
+          f"mean encode {timings['mean_encode_seconds']:.2f}s")
+    if timings["mean_predict_seconds"] is not None:
+        print(f"Predictions: {timings['predictions']}, "
+              f"mean predict {timings['mean_predict_seconds'] * 1000:.1f}ms")
+    print(f"Per image: {timings['mean_per_image_seconds']:.2f}s "
+          f"(loading the model costs {timings['load_vs_image_ratio']:.1f} images)")
+
+
+def get_output_dir():
+    """Returns VitalArbor/Segmented photos, creating it if needed."""
+    output_dir = os.path.join(VITALARBOR_DIR, "Segmented photos")
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def get_cutout_path(image_path, suffix=""):
+    """
+    Where to save the cutout of a photo: its folder mirrored under
+    "Segmented photos" (see cutout_paths), created if needed.
+    """
+    cutout_path = cutout_paths.cutout_path(image_path, suffix)
+    os.makedirs(os.path.dirname(cutout_path), exist_ok=True)
+    return cutout_path
+
+
+def make_cutout(image_np, mask):
+    """
+    The masked part of image_np as an RGBA array (transparent background)
+    cropped to the mask's bounding box, or None if the mask is empty.
+    """
+    mask = np.asarray(mask, dtype=bool)
+
+    # Bounding box first, so only the cropped part is ever copied
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    box = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    box_mask = mask[box]
+
+    # RGB where the mask is set, alpha 255 there and 0 elsewhere
+    rgba_image = np.zeros(box_mask.shape + (4,), dtype=np.uint8)
+    rgba_image[..., :3] = image_np[box][..., :3] * box_mask[..., None]
+    rgba_image[..., 3] = box_mask * np.uint8(255)
+    return rgba_image
+
+
+def save_cutout(image_np, mask, cutout_path):
+    """
+    Save make_cutout(image_np, mask) as a transparent PNG. Returns the
+    cropped RGBA array, or None if the mask is empty.
+    """
+    rgba_cropped = make_cutout(image_np, mask)
+    if rgba_cropped is None:
+        return None
+
+    # Save as PNG with transparency
+    cutout_img = Image.fromarray(rgba_cropped, mode='RGBA')
+    cutout_img.save(cutout_path)
+
+    print(f"✓ Saved cutout image to: {cutout_path}")
+    print(f"  Cropped from {image_np.shape[:2]} to {rgba_cropped.shape[:2]}")
+    return rgba_cropped
+
+
+def load_prompt_sets(prompt_path):
+    """
+    Read point/box prompts for one image from a JSON or CSV sidecar.
+
+    JSON: a list of prompt sets (or {"prompts": [...]}), each
+          {"points": [[x, y], ...], "labels": [1, 0, ...], "box": [x0, y0, x1, y1]}
+          where labels default to 1 (include) and box is optional.
+    CSV:  columns prompt_set,type,x,y,x2,y2,label with one row per point
+          (type "point", label 1/0) or per box (type "box", x,y,x2,y2).
+    """
+    if prompt_path.lower().endswith(".csv"):
+        prompt_sets = {}
+        with open(prompt_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                prompt_set = prompt_sets.setdefault(row["prompt_set"], {"points": [], "labels": []})
+                if row["type"].strip().lower() == "box":
+                    prompt_set["box"] = [float(row[key]) for key in ("x", "y", "x2", "y2")]
+                else:
+                    prompt_set["points"].append([float(row["x"]), float(row["y"])])
+                    prompt_set["labels"].append(int(row.get("label") or 1))
+        prompt_sets = list(prompt_sets.values())
+    else:
+        with open(prompt_path, encoding="utf-8") as f:
+            data = json.load(f)
+        prompt_sets = data["prompts"] if isinstance(data, dict) else data
+
+    return validate_prompt_sets(prompt_sets, prompt_path)
+
+
+def validate_prompt_sets(prompt_sets, source="the request"):
+    """
+    Check prompt sets read from a file or a request and fill in default
+    labels, so a malformed one fails here with a ValueError naming it
+    instead of inside SAM2. Returns prompt_sets.
+    """
+    if not isinstance(prompt_sets, list) or not prompt_sets:
+        raise ValueError(f"{source} has no prompt sets")
+    for i, prompt_set in enumerate(prompt_sets):
+        if not isinstance(prompt_set, dict):
+            raise ValueError(f"Prompt set {i} in {source} is not an object")
+        points = prompt_set.get("points") or []
+        prompt_set["points"] = points
+        prompt_set["labels"] = prompt_set.get("labels") or [1] * len(points)
+        if not isinstance(points, list) or any(not isinstance(point, (list, tuple)) or len(point) != 2
+                                                for point in points):
+            raise ValueError(f"Prompt set {i} in {source} has points that aren't [x, y] pairs")
+        if len(prompt_set["labels"]) != len(points):
+            raise ValueError(f"Prompt set {i} in {source} has {len(points)} points but "
+                             f"{len(prompt_set['labels'])} labels")
+        if any(label not in (0, 1) for label in prompt_set["labels"]):
+            raise ValueError(f"Prompt set {i} in {source} has labels other than 1 (include) and 0 (exclude)")
+        box = prompt_set.get("box")
+        if box is not None and (not isinstance(box, (list, tuple)) or len(box) != 4):
+            raise ValueError(f"Prompt set {i} in {source} has a box that isn't [x0, y0, x1, y1]")
+        if not points and box is None:
+            raise ValueError(f"Prompt set {i} in {source} has no points or box")
+    return prompt_sets
+
+
+def find_prompt_sidecar(image_path):
+    """Returns <image>.prompts.json or <image>.prompts.csv next to the image, if present."""
+    stem = os.path.splitext(image_path)[0]
+    for ext in (".json", ".csv"):
+        candidate = f"{stem}.prompts{ext}"
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def predict_prompt_sets(predictor, prompt_sets, multimask_output=False):
+    """
+    Predict one mask per prompt set on the image already encoded in predictor.
+
+    Prompt sets with the same number of points and the same box/no-box shape
+    are stacked into a single batched predictor.predict call.
+    Returns [{"mask": bool HxW array, "score": float}, ...] in input order.
+    """
+    groups = {}
+    for i, prompt_set in enumerate(prompt_sets):
+        signature = (len(prompt_set["points"]), prompt_set.get("box") is not None)
+        groups.setdefault(signature, []).append(i)
+
+    results = [None] * len(prompt_sets)
+    for (num_points, has_box), indices in groups.items():
+        prompt_kwargs = {"multimask_output": multimask_output}
+        if num_points:
+            prompt_kwargs["point_coords"] = np.array(
+                [prompt_sets[i]["points"] for i in indices], dtype=np.float32)
+            prompt_kwargs["point_labels"] = np.array(
+                [prompt_sets[i]["labels"] for i in indices], dtype=np.int32)
+        if has_box:
+            prompt_kwargs["box"] = np.array([prompt_sets[i]["box"] for i in indices], dtype=np.float32)
+
+        masks, scores, _ = predict_mask(predictor, **prompt_kwargs)
+
+        # A batch of one comes back without the batch axis
+        if masks.ndim == 3:
+            masks = masks[None]
+            scores = scores[None]
+
+        for batch_index, i in enumerate(indices):
+            best = int(np.argmax(scores[batch_index]))
+            results[i] = {
+                "mask": masks[batch_index, best] > 0,
+                "score": float(scores[batch_index, best]),
+            }
+    return results
+
+
+def segment_with_prompts(image, prompt_sets, use_cache=True, multimask_output=False):
+    """
+    Segment an image path or RGB array without a GUI.
+
+    The image is encoded once (or restored from the embedding cache) and all
+    prompt sets are predicted against it. Returns the list from
+    predict_prompt_sets, with the mask arrays themselves rather than files.
+    """
+    if isinstance(image, np.ndarray):
+        image_np = image
+    else:
+        image_np = np.array(Image.open(image).convert("RGB"))
+
+    predictor = get_predictor()
+    cache = get_embedding_cache() if use_cache else None
+
+    # The predictor holds one encoded image at a time
+    with predictor_lock:
+        encode_image(predictor, image_np, cache)
+        return predict_prompt_sets(predictor, prompt_sets, multimask_output)
+
+
+def segment_auto(image, use_cache=True):
+    """
+    Segment the tree in an image path or RGB array with prompts proposed by
+    auto_prompt instead of clicks. Every proposed prompt set is predicted with
+    multimask output and the highest scoring mask is kept.
+
+    Returns (best result from predict_prompt_sets, the prompt sets used).
+    """
+    import auto_prompt
+
+    if isinstance(image, np.ndarray):
+        image_np = image
+    else:
+        image_np = np.array(Image.open(image).convert("RGB"))
+
+    prompt_sets = auto_prompt.propose_prompts(image_np)
+    results = segment_with_prompts(image_np, prompt_sets, use_cache=use_cache, multimask_output=True)
+    return max(results, key=lambda r: r["score"]), prompt_sets
+
+
+@profiling.profiled("sam2.session")
+def run_sam2_segmentation(image_path, use_cache=True):
+    global saved_file_path
+    import matplotlib.pyplot as plt  # type: ignore
+
+    predictor = get_predictor()
+    cache = get_embedding_cache() if use_cache else None
 
     # Load your image
     image = Image.open(image_path)
     image_np = np.array(image.convert("RGB"))
 
     # Create output directory and generate output filename
-    # Get the parent directory (one level up from script_dir)
-    output_dir = os.path.join(os.path.dirname(script_dir), "Segmented photos")
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Extract the base filename without extension and create new name
+    output_path = get_cutout_path(image_path)
+    output_dir, output_filename = os.path.split(output_path)
     base_filename = os.path.splitext(os.path.basename(image_path))[0]
-    output_filename = f"{base_filename}_crop_out.png"
     saved_file_path = None  # Track the actual saved file path
 
     print(f"Image loaded: {image_np.shape}")
@@ -62,9 +554,8 @@ def run_sam2_segmentation(image_path):
 
     # Set the image in the predictor (encode it once)
     print("Encoding image... (this may take a moment on CPU)")
-    with torch.inference_mode():
-        predictor.set_image(image_np)
-    print("Image encoded! Ready for segmentation.")
+    encode_seconds = encode_image(predictor, image_np, cache)
+    print(f"Image encoded in {encode_seconds:.2f}s! Ready for segmentation.")
 
     # Interactive state
     positive_points = []
@@ -78,7 +569,7 @@ def run_sam2_segmentation(image_path):
 
     def update_segmentation():
         """Run segmentation with current points and update display"""
-        global current_mask
+        nonlocal current_mask
         
         if len(positive_points) == 0 and len(negative_points) == 0:
             # No points, just show original image
@@ -106,12 +597,12 @@ def run_sam2_segmentation(image_path):
         input_labels = np.array(all_labels)
         
         # Run prediction
-        with torch.inference_mode():
-            masks, scores, logits = predictor.predict(
-                point_coords=input_points,
-                point_labels=input_labels,
-                multimask_output=False  # Single best mask
-            )
+        masks, scores, logits = predict_mask(
+            predictor,
+            point_coords=input_points,
+            point_labels=input_labels,
+            multimask_output=False  # Single best mask
+        )
         
         current_mask = masks[0]
         
@@ -166,7 +657,8 @@ def run_sam2_segmentation(image_path):
 
     def onkey(event):
         """Handle keyboard presses"""
-        global positive_points, negative_points, current_mask, saved_file_path
+        nonlocal positive_points, negative_points, current_mask
+        global saved_file_path
         
         if event.key == 'r':  # Reset
             positive_points = []
@@ -181,32 +673,8 @@ def run_sam2_segmentation(image_path):
                 cutout_path = os.path.join(output_dir, output_filename)
                 saved_file_path = cutout_path  # Store the actual path
                 
-                # Create RGBA image
-                rgba_image = np.zeros((image_np.shape[0], image_np.shape[1], 4), dtype=np.uint8)
-                
-                # Copy RGB channels ONLY where mask is True
-                for c in range(3):
-                    rgba_image[:, :, c] = image_np[:, :, c] * current_mask
-                
-                # Set alpha channel based on mask (255 where mask is True, 0 where False)
-                rgba_image[:, :, 3] = (current_mask * 255).astype(np.uint8)
-                
-                # Find bounding box of the mask to crop
-                coords = np.argwhere(current_mask)
-                if len(coords) > 0:
-                    y_min, x_min = coords.min(axis=0)
-                    y_max, x_max = coords.max(axis=0)
-                    
-                    # Crop to bounding box
-                    rgba_cropped = rgba_image[y_min:y_max+1, x_min:x_max+1]
-                    
-                    # Save as PNG with transparency
-                    cutout_img = Image.fromarray(rgba_cropped, mode='RGBA')
-                    cutout_img.save(cutout_path)
-                    
-                    print(f"✓ Saved cutout image to: {cutout_path}")
-                    print(f"  Cropped from {rgba_image.shape} to {rgba_cropped.shape}")
-                    
+                rgba_cropped = save_cutout(image_np, current_mask, cutout_path)
+                if rgba_cropped is not None:
                     # Also save visualization with similar naming
                     viz_filename = f"{base_filename}_crop_out_contrast.png"
                     viz_path = os.path.join(output_dir, viz_filename)
@@ -257,12 +725,107 @@ def run_sam2_segmentation(image_path):
     plt.tight_layout()
     plt.show()
 
+    print_timings()
+
     # Access the saved filename variable after the window is closed
     if saved_file_path:
         print(f"\nSaved file path: {saved_file_path}")
     else:
         print("\nNo file was saved during this session")
+    return saved_file_path
 
 def get_segmented_filename():
     """Returns the path to the saved segmented image, or None if not saved"""
     return saved_file_path
+
+
+def add_encoder_arguments(parser):
+    """--profile/--quantize/--threads, shared by the SAM2 command line tools."""
+    parser.add_argument("--profile", choices=list(ENCODER_PROFILES), default=None,
+                        help=f"Encoder checkpoint (default: $VITALARBOR_SAM2_PROFILE or {DEFAULT_PROFILE})")
+    parser.add_argument("--quantize", action="store_true", default=None,
+                        help="Dynamic int8 quantization of the image encoder")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+
+
+def configure_from_args(args):
+    configure(profile=args.profile, quantize=args.quantize, threads=args.threads)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Segment photos with SAM2 from point/box prompt files (or automatic prompts), "
+                    "without the interactive window."
+    )
+    parser.add_argument("images", nargs="+", help="Photos to segment")
+    parser.add_argument("--prompts", default=None,
+                        help="Prompt file for every image (default: <image>.prompts.json/.csv next to each image)")
+    parser.add_argument("--save-all", action="store_true",
+                        help="Save a cutout per prompt set instead of only the best scoring one")
+    parser.add_argument("--auto", action="store_true",
+                        help="Propose trunk prompts automatically for images without a prompt file")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the image encoder")
+    parser.add_argument("--prefetch", type=int, default=prefetch.PREFETCH_DEPTH, metavar="N",
+                        help=f"Photos decoded ahead of the one being segmented (default {prefetch.PREFETCH_DEPTH})")
+    add_encoder_arguments(parser)
+    args = parser.parse_args(argv)
+    configure_from_args(args)
+
+    failed = 0
+    to_segment = []
+    for image_path in args.images:
+        prompt_path = args.prompts or find_prompt_sidecar(image_path)
+        if prompt_path is None and not args.auto:
+            print(f"SKIP {image_path}: no prompt file found (use --auto to propose prompts)")
+            failed += 1
+            continue
+        prompt_sets = None
+        if prompt_path is not None:
+            # A broken prompt file only costs its own photo
+            try:
+                prompt_sets = load_prompt_sets(prompt_path)
+            except (ValueError, OSError, KeyError) as e:
+                print(f"ERROR {image_path}: bad prompt file {prompt_path}: {type(e).__name__}: {e}")
+                failed += 1
+                continue
+        to_segment.append((image_path, prompt_sets))
+
+    # The next photos are decoded while the current one is encoded
+    loader = prefetch.Prefetcher(to_segment, lambda job: np.array(Image.open(job[0]).convert("RGB")),
+                                 args.prefetch)
+    for (image_path, prompt_sets), image_np, error in loader:
+        if error is not None:
+            print(f"ERROR {image_path}: {error}")
+            failed += 1
+            continue
+
+        if prompt_sets is None:
+            best, _ = segment_auto(image_np, use_cache=not args.no_cache)
+            results = [best]
+        else:
+            results = segment_with_prompts(image_np, prompt_sets, use_cache=not args.no_cache)
+
+        base_filename = os.path.splitext(os.path.basename(image_path))[0]
+        for i, result in enumerate(results):
+            print(f"{base_filename} prompt set {i}: score {result['score']:.3f}, "
+                  f"{int(result['mask'].sum())} mask pixels")
+
+        if args.save_all:
+            to_save = [(get_cutout_path(image_path, f"_set{i}"), r) for i, r in enumerate(results)]
+        else:
+            best = max(results, key=lambda r: r["score"])
+            to_save = [(get_cutout_path(image_path), best)]
+
+        for output_path, result in to_save:
+            if save_cutout(image_np, result["mask"], output_path) is None:
+                print(f"ERROR: Empty mask for {os.path.basename(output_path)}")
+                failed += 1
+
+    print_timings()
+    if to_segment:
+        prefetch.print_stats(loader.stats(), work="segmentation")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
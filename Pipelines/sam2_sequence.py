@@ -0,0 +1,294 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import auto_prompt
+import batch_runner
+import profiling
+import sam2_segmentation
+
+# torch is imported inside the functions that use it, like sam2_segmentation
+
+# The video predictor reads a folder of JPEG frames named by their index
+FRAME_QUALITY = 95
+
+# Object id of the tree in the video predictor's state
+TREE_OBJ_ID = 1
+
+# One video predictor per process, built on first use
+_video_predictor = None
+_load_lock = threading.Lock()
+
+_timings = {
+    "load_seconds": None,
+    "sequences": 0,
+    "frames": 0,
+    "prompt_seconds": 0.0,
+    "propagate_seconds": 0.0,
+}
+
+
+def get_video_predictor():
+    """
+    Return the process-wide SAM2VideoPredictor, loading it the first time it
+    is needed with the encoder chosen by sam2_segmentation.configure.
+    """
+    global _video_predictor
+    if _video_predictor is None:
+        with _load_lock:
+            if _video_predictor is None:
+                import torch
+
+                config = sam2_segmentation.get_encoder_config()
+                if config["threads"]:
+                    torch.set_num_threads(config["threads"])
+                print(f"Loading SAM2 video predictor ({config['profile']}"
+                      f"{', int8 encoder' if config['quantize'] else ''}, "
+                      f"{torch.get_num_threads()} threads)...")
+                start = time.perf_counter()
+                with profiling.span("sam2.load_video_model", profile=config["profile"]):
+                    checkpoint_path, model_cfg = sam2_segmentation.get_profile_paths(config["profile"])
+                    predictor = sam2_segmentation.build_sam2(model_cfg, checkpoint_path, video=True)
+                    if config["quantize"]:
+                        sam2_segmentation.quantize_encoder(predictor)
+                    _video_predictor = predictor
+                _timings["load_seconds"] = time.perf_counter() - start
+                print(f"SAM2 video predictor loaded in {_timings['load_seconds']:.2f}s")
+    return _video_predictor
+
+
+def load_rgb(image):
+    """An image path or RGB array as an RGB array."""
+    if isinstance(image, np.ndarray):
+        return image
+    return np.array(Image.open(image).convert("RGB"))
+
+
+def write_frames(images, frames_dir):
+    """
+    Save RGB images as the JPEG frames 00000.jpg, 00001.jpg, ... that the
+    video predictor reads. Returns the (height, width) of every frame.
+    """
+    sizes = []
+    for i, image_np in enumerate(images):
+        Image.fromarray(image_np).save(os.path.join(frames_dir, f"{i:05d}.jpg"), quality=FRAME_QUALITY)
+        sizes.append(image_np.shape[:2])
+    return sizes
+
+
+def segment_sequence(images, prompt_set):
+    """
+    Segment several photos of one tree (views, or the same view at another
+    time) as one video: prompt_set is applied to the first photo only and
+    SAM2's memory bank carries the tree's mask to the others, so no photo
+    after the first needs prompts or a choice between prompt sets.
+
+    images: paths or RGB arrays, the prompted photo first
+    prompt_set: {"points": [[x, y], ...], "labels": [...], "box": [...]}
+        in the first photo's pixels (see sam2_segmentation.load_prompt_sets)
+
+    Returns one boolean mask per image, each at its own image's size.
+    """
+    import torch
+
+    predictor = get_video_predictor()
+    frames = [load_rgb(image) for image in images]
+
+    with tempfile.TemporaryDirectory(prefix="vitalarbor_frames_") as frames_dir:
+        sizes = write_frames(frames, frames_dir)
+
+        with torch.inference_mode():
+            start = time.perf_counter()
+            with profiling.span("sam2.sequence_prompt", frames=len(frames)):
+                state = predictor.init_state(video_path=frames_dir, offload_video_to_cpu=True)
+                prompt_kwargs = {}
+                if prompt_set.get("points"):
+                    prompt_kwargs["points"] = np.array(prompt_set["points"], dtype=np.float32)
+                    prompt_kwargs["labels"] = np.array(prompt_set["labels"], dtype=np.int32)
+                if prompt_set.get("box") is not None:
+                    prompt_kwargs["box"] = np.array(prompt_set["box"], dtype=np.float32)
+                predictor.add_new_points_or_box(inference_state=state, frame_idx=0, obj_id=TREE_OBJ_ID,
+                                                **prompt_kwargs)
+            _timings["prompt_seconds"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            masks = [None] * len(frames)
+            with profiling.span("sam2.sequence_propagate", frames=len(frames)):
+                for frame_idx, obj_ids, mask_logits in predictor.propagate_in_video(state):
+                    logits = mask_logits[list(obj_ids).index(TREE_OBJ_ID)][None]
+                    # Logits come at the first frame's size; photos of
+                    # another size were stretched the same way into the model
+                    height, width = sizes[frame_idx]
+                    if logits.shape[-2:] != (height, width):
+                        logits = torch.nn.functional.interpolate(
+                            logits.float(), size=(height, width), mode="bilinear", align_corners=False)
+                    masks[frame_idx] = (logits[0, 0] > 0).cpu().numpy()
+            _timings["propagate_seconds"] += time.perf_counter() - start
+            predictor.reset_state(state)
+
+    _timings["sequences"] += 1
+    _timings["frames"] += len(frames)
+    return masks
+
+
+def mask_iou(mask_a, mask_b):
+    """Intersection over union of two boolean masks (1.0 when both are empty)."""
+    union = np.logical_or(mask_a, mask_b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(mask_a, mask_b).sum() / union)
+
+
+def segment_each(image_np, image_path, auto):
+    """
+    The per-image result to compare a propagated mask with: the photo's own
+    prompt file, else automatic prompts when auto is set, else None.
+    """
+    prompt_path = sam2_segmentation.find_prompt_sidecar(image_path)
+    if prompt_path is not None:
+        results = sam2_segmentation.segment_with_prompts(image_np, sam2_segmentation.load_prompt_sets(prompt_path))
+        return max(results, key=lambda r: r["score"])["mask"]
+    if auto:
+        best, _ = sam2_segmentation.segment_auto(image_np)
+        return best["mask"]
+    return None
+
+
+def compare_with_images(image_paths, frames, masks, auto):
+    """
+    Segment every photo on its own as well and report how well the
+    propagated masks agree (IoU) and what each way cost per photo.
+    Returns a list of row dicts.
+    """
+    rows = []
+    for image_path, image_np, mask in zip(image_paths, frames, masks):
+        start = time.perf_counter()
+        reference = segment_each(image_np, image_path, auto)
+        seconds = time.perf_counter() - start
+        rows.append({
+            "image": image_path,
+            "propagated_pixels": int(mask.sum()),
+            "image_pixels": None if reference is None else int(reference.sum()),
+            "iou": None if reference is None else mask_iou(mask, reference),
+            "image_seconds": seconds if reference is not None else None,
+        })
+    return rows
+
+
+def print_comparison(rows, propagated_seconds):
+    print("\n=== PROPAGATED vs PER-IMAGE MASKS ===")
+    print(f"{'photo':40s} {'propagated px':>14s} {'per-image px':>13s} {'IoU':>6s} {'per-image s':>12s}")
+    for row in rows:
+        name = os.path.relpath(row["image"])[-40:]
+        if row["iou"] is None:
+            print(f"{name:40s} {row['propagated_pixels']:14d} {'-':>13s} {'-':>6s} {'-':>12s}")
+        else:
+            print(f"{name:40s} {row['propagated_pixels']:14d} {row['image_pixels']:13d} "
+                  f"{row['iou']:6.3f} {row['image_seconds']:12.2f}")
+    ious = [row["iou"] for row in rows if row["iou"] is not None]
+    if ious:
+        print(f"\nIoU: mean {np.mean(ious):.3f}, min {np.min(ious):.3f} over {len(ious)} photos")
+    image_seconds = [row["image_seconds"] for row in rows if row["image_seconds"] is not None]
+    if image_seconds:
+        print(f"Per photo: {propagated_seconds:.2f}s propagated, {np.mean(image_seconds):.2f}s segmented on its own")
+
+
+def print_timings():
+    print("\n=== SAM2 SEQUENCE TIMINGS ===")
+    if _timings["load_seconds"] is None:
+        print("Video predictor not loaded yet")
+        return
+    print(f"Model load (once): {_timings['load_seconds']:.2f}s")
+    if _timings["frames"]:
+        print(f"Sequences: {_timings['sequences']}, frames: {_timings['frames']}")
+        print(f"Prompting: {_timings['prompt_seconds']:.2f}s total, "
+              f"{_timings['prompt_seconds'] / _timings['sequences']:.2f}s per sequence")
+        print(f"Propagation: {_timings['propagate_seconds'] / _timings['frames']:.2f}s per frame")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Segment several photos of one tree as a sequence: prompt the first photo once and "
+                    "SAM2's video predictor carries the mask to the others."
+    )
+    parser.add_argument("images", nargs="+",
+                        help="Photos of one tree, folders or glob patterns, in order; "
+                             "the first photo is the one prompted")
+    parser.add_argument("--prompts", default=None,
+                        help="Prompt file for the first photo (default: its .prompts.json/.csv sidecar)")
+    parser.add_argument("--prompt-set", type=int, default=0, help="Which prompt set of the file to use")
+    parser.add_argument("--auto", action="store_true",
+                        help="Propose the first photo's prompts automatically when it has no prompt file "
+                             "(and segment photos without prompt files with --compare)")
+    parser.add_argument("--compare", action="store_true",
+                        help="Also segment every photo on its own and report the IoU with the propagated mask")
+    parser.add_argument("--no-save", action="store_true", help="Don't save the cutouts")
+    sam2_segmentation.add_encoder_arguments(parser)
+    args = parser.parse_args(argv)
+    sam2_segmentation.configure_from_args(args)
+
+    # A folder given after the first photo may hold it again; every photo
+    # is one frame, in the order it was first given
+    image_paths = []
+    seen = set()
+    for source in args.images:
+        for image_path in batch_runner.collect_images(source):
+            key = os.path.normcase(os.path.abspath(image_path))
+            if key not in seen:
+                seen.add(key)
+                image_paths.append(image_path)
+    if not image_paths:
+        print("No photos found")
+        return 1
+
+    first = image_paths[0]
+    prompt_path = args.prompts or sam2_segmentation.find_prompt_sidecar(first)
+    frames = [load_rgb(image_path) for image_path in image_paths]
+    if prompt_path is not None:
+        prompt_sets = sam2_segmentation.load_prompt_sets(prompt_path)
+        if not 0 <= args.prompt_set < len(prompt_sets):
+            print(f"{prompt_path} has {len(prompt_sets)} prompt sets, --prompt-set must be 0 to {len(prompt_sets) - 1}")
+            return 1
+        prompt_set = prompt_sets[args.prompt_set]
+    elif args.auto:
+        # The proposal with the trunk box; the video predictor has no scores
+        # to pick between prompt sets with
+        prompt_set = auto_prompt.propose_prompts(frames[0])[-1]
+    else:
+        print(f"No prompt file for {first} (use --prompts, or --auto to propose prompts)")
+        return 1
+
+    print(f"Segmenting {len(image_paths)} photos, prompted on {first}")
+    start = time.perf_counter()
+    masks = segment_sequence(frames, prompt_set)
+    propagated_seconds = (time.perf_counter() - start) / len(frames)
+
+    failed = 0
+    for image_path, image_np, mask in zip(image_paths, frames, masks):
+        print(f"{image_path}: {int(mask.sum())} mask pixels")
+        if args.no_save:
+            continue
+        # Photos with the same name in other folders keep their own cutouts
+        cutout_path = sam2_segmentation.get_cutout_path(image_path)
+        if sam2_segmentation.save_cutout(image_np, mask, cutout_path) is None:
+            print(f"ERROR: Empty mask for {image_path}")
+            failed += 1
+
+    if args.compare:
+        rows = compare_with_images(image_paths, frames, masks, args.auto)
+        print_comparison(rows, propagated_seconds)
+
+    print_timings()
+    if args.compare:
+        sam2_segmentation.print_timings()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
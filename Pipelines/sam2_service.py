@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+import sam2_segmentation
+
+# Embedding cache key (a hash of the pixels) of the image currently held by
+# the predictor, so repeated requests for the same photo (e.g. refining
+# prompts) skip the encoder, and a photo rewritten at the same path doesn't
+_encoded_image_key = None
+
+
+def segment_request(request):
+    """
+    Segment one image with the shared predictor.
+
+    request: {"image_path": str, "points": [[x, y], ...], "labels": [1, 0, ...],
+              "box": [x0, y0, x1, y1] (optional), "save": bool (optional)}
+    or several prompt sets at once as {"image_path": str, "prompts": [...]}
+    in the format of sam2_segmentation.load_prompt_sets. The best scoring
+    mask is the one saved and described in the response.
+    """
+    global _encoded_image_key
+
+    image_path = request["image_path"]
+    prompt_sets = request.get("prompts") or [{
+        "points": request.get("points") or [],
+        "labels": request.get("labels"),
+        "box": request.get("box"),
+    }]
+    # Same checks as prompt files, so a bad request is a 400 and not a SAM2 error
+    sam2_segmentation.validate_prompt_sets(prompt_sets)
+
+    predictor = sam2_segmentation.get_predictor()
+    image_np = np.array(Image.open(image_path).convert("RGB"))
+
+    # The predictor holds one encoded image at a time
+    with sam2_segmentation.predictor_lock:
+        encode_seconds = 0.0
+        key = sam2_segmentation.image_key(predictor, image_np)
+        if _encoded_image_key != key:
+            encode_seconds = sam2_segmentation.encode_image(
+                predictor, image_np, sam2_segmentation.get_embedding_cache(), key
+            )
+            _encoded_image_key = key
+
+        start = time.perf_counter()
+        results = sam2_segmentation.predict_prompt_sets(predictor, prompt_sets)
+        predict_seconds = time.perf_counter() - start
+
+    best = max(results, key=lambda r: r["score"])
+    mask = best["mask"]
+    response = {
+        "image_path": image_path,
+        "score": best["score"],
+        "scores": [r["score"] for r in results],
+        "mask_area": int(mask.sum()),
+        "cutout_path": None,
+        "encode_seconds": round(encode_seconds, 4),
+        "predict_seconds": round(predict_seconds, 4),
+    }
+
+    if request.get("save", True):
+        cutout_path = sam2_segmentation.get_cutout_path(image_path)
+        if sam2_segmentation.save_cutout(image_np, mask, cutout_path) is not None:
+            response["cutout_path"] = cutout_path
+
+    return response
+
+
+class SegmentationHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health   -> whether the model is loaded
+    GET  /timings  -> model load cost vs. per-image cost so far
+    POST /segment  -> see segment_request
+    """
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"loaded": sam2_segmentation.get_timings()["load_seconds"] is not None})
+        elif self.path == "/timings":
+            timings = sam2_segmentation.get_timings()
+            timings["embedding_cache"] = sam2_segmentation.get_embedding_cache().stats()
+            timings["encoder"] = sam2_segmentation.get_encoder_config()
+            self._send_json(200, timings)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/segment":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            self._send_json(200, segment_request(request))
+        except (KeyError, ValueError, FileNotFoundError) as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        # Unix-socket clients have no address, so don't rely on client_address
+        print(f"[sam2_service] {format % args}")
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(host="127.0.0.1", port=8765, unix_socket=None, preload=True):
+    if preload:
+        sam2_segmentation.get_predictor()
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = ThreadingUnixHTTPServer(unix_socket, SegmentationHandler)
+        print(f"SAM2 service listening on unix socket {unix_socket}")
+    else:
+        server = ThreadingHTTPServer((host, port), SegmentationHandler)
+        print(f"SAM2 service listening on http://{host}:{port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        sam2_segmentation.print_timings()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one long-lived SAM2 predictor over HTTP or a Unix socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", default=None, help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--lazy", action="store_true", help="Load the model on the first request instead of at startup")
+    sam2_segmentation.add_encoder_arguments(parser)
+    args = parser.parse_args(argv)
+    sam2_segmentation.configure_from_args(args)
+
+    serve(args.host, args.port, args.unix_socket, preload=not args.lazy)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+
+import profiling
+
+# Sweep types. A plated sweep leans at the base and keeps or increases that
+# lean all the way up, as a tree whose root plate has tipped does. Any other
+# bend is natural: leaning at the base and growing back toward (or past)
+# vertical, or upright at the base and bending only higher up, which says
+# nothing about the roots
+STRAIGHT = "straight"
+NATURAL = "natural"
+PLATED = "plated"
+UNKNOWN = "unknown"
+
+# From least to most concerning, to combine the views of one tree
+SWEEP_ORDER = (UNKNOWN, STRAIGHT, NATURAL, PLATED)
+
+# A trunk whose centerline stays within this many degrees of vertical at
+# both ends of the band is straight
+STRAIGHT_DEGREES = 5.0
+
+# The quadratic has to follow the centerline to within this fraction of the
+# trunk's half width (RMS), otherwise the sweep is unknown
+MAX_FIT_RESIDUAL = 0.5
+
+# Fewer centerline rows than this is too short to fit
+MIN_SWEEP_ROWS = 10
+
+
+@profiling.profiled("sweep")
+def classify_sweep(centerline, half_widths=None):
+    """
+    Fit x = a + b t + c t^2 to a trunk centerline (t = 0 at the bottom row of
+    the band, 1 at the top) and classify the sweep from the lean at both ends.
+
+    centerline: center column per band row, top row first, NaN where empty
+        (width_of_trunk.band_centerline)
+    half_widths: optional half width per row, to judge the fit against
+
+    Returns a dict:
+        sweep        STRAIGHT, NATURAL, PLATED or UNKNOWN
+        base_angle   lean at the bottom of the band, degrees (positive = right)
+        top_angle    lean at the top of the band, degrees
+        bend         top_angle - base_angle, how far the trunk curves
+        residual     RMS distance of the centerline from the fit, in its pixels
+    """
+    centerline = np.asarray(centerline, dtype=float)
+    height = len(centerline)
+    rows = np.flatnonzero(~np.isnan(centerline))
+    result = {"sweep": UNKNOWN, "base_angle": None, "top_angle": None, "bend": None, "residual": None}
+    if len(rows) < MIN_SWEEP_ROWS:
+        return result
+
+    t = (height - 1 - rows) / height
+    x = centerline[rows]
+    c, b, a = np.polyfit(t, x, 2)
+    residual = float(np.sqrt(np.mean((x - (a + b * t + c * t * t)) ** 2)))
+
+    # dx/dy at t = 0 and t = 1, with y measured in rows up the trunk
+    base_angle = math.degrees(math.atan(b / height))
+    top_angle = math.degrees(math.atan((b + 2 * c) / height))
+    result.update(base_angle=round(base_angle, 2), top_angle=round(top_angle, 2),
+                  bend=round(top_angle - base_angle, 2), residual=round(residual, 2))
+
+    if half_widths is not None:
+        half_width = np.median(np.asarray(half_widths, dtype=float)[rows])
+        if half_width > 0 and residual > MAX_FIT_RESIDUAL * half_width:
+            return result
+
+    if max(abs(base_angle), abs(top_angle)) < STRAIGHT_DEGREES:
+        result["sweep"] = STRAIGHT
+    elif abs(base_angle) >= STRAIGHT_DEGREES and abs(top_angle) >= abs(base_angle) and base_angle * top_angle > 0:
+        result["sweep"] = PLATED
+    else:
+        result["sweep"] = NATURAL
+    return result
+
+
+def worst_sweep(sweeps):
+    """The most concerning of several sweep types (e.g. one per photo of a tree); None counts as UNKNOWN."""
+    return max((sweep or UNKNOWN for sweep in sweeps), key=SWEEP_ORDER.index, default=UNKNOWN)
@@ -2,99 +2,131 @@ import cv2
 import numpy as np
 import math
 import os
-import sam2_segmentation
+import profiling
+from downsample import downsample_mask, scale_length
+from width_of_trunk import band_centerline, find_trunk_band, get_row_extents
 
-def detect_tree_tilt(image_path):
-    # Check if file exists
-    if not os.path.exists(image_path):
-        print(f"ERROR: File does not exist: {image_path}")
-        return None
-    
-    # Read the image with alpha channel
-    img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+# Hough parameters at full resolution, scaled with the analysis resolution
+HOUGH_THRESHOLD = 30
+MIN_LINE_LENGTH = 30
+MAX_LINE_GAP = 20
+
+# Only the lower TRUNK_FRACTION of the mask is searched for the trunk, and
+# only segments more than MIN_LINE_ANGLE degrees from horizontal and at least
+# MIN_LINE_FRACTION of the mask's height long count as trunk lines
+TRUNK_FRACTION = 0.5
+MIN_LINE_ANGLE = 30
+MIN_LINE_FRACTION = 0.15
+
+# refine_tilt: long sides tried from coarse to fine before the full (or
+# analysis) resolution, stopping at the first tilt that fits the trunk
+REFINE_LONG_SIDES = (256, 512)
+
+# tilt_fit a coarse level's tilt needs to be accepted without refining it
+# further: its tilt line has to run within 3% of the trunk band's half width
+# of the band's centerline on average. The Hough tilt moves by degrees
+# between resolutions on the sample cutouts, so anything looser keeps coarse
+# tilts that disagree with the full-resolution one
+MIN_TILT_FIT = 0.97
+
+
+def _silent(*args, **kwargs):
+    pass
+
+
+def filter_trunk_lines(lines, height):
+    """
+    Keep the somewhat vertical Hough segments (more than MIN_LINE_ANGLE
+    degrees from horizontal) and extend each one to the bottom row of the image.
+
+    lines: HoughLinesP output, any shape that reshapes to (N, 4)
+    Returns (trunk_lines (M, 4) int array, x_at_bottom (M,), line_lengths (M,)).
+    """
+    lines = lines.reshape(-1, 4)
+    x1, y1, x2, y2 = lines.astype(np.float64).T
+    dx = x2 - x1
+    dy = y2 - y1
     
-    if img is None:
-        print(f"ERROR: Could not read image from {image_path}")
-        return None
+    # Angle from horizontal; vertical segments (dx == 0) come out as 90
+    angle_from_horizontal = np.abs(np.degrees(np.arctan2(dy, dx)))
+    keep = (angle_from_horizontal > MIN_LINE_ANGLE) & (dy != 0)
     
-    print(f"Image shape: {img.shape}")
+    # Line equation: y - y1 = m(x - x1), solve for x when y = bottom_y
+    bottom_y = height - 1
+    x_at_bottom = x1[keep] + dx[keep] / dy[keep] * (bottom_y - y1[keep])
+    line_lengths = np.hypot(dx[keep], dy[keep])
     
-    # Step 1: Convert to binary image
+    return lines[keep], x_at_bottom, line_lengths
+
+
+def binarize_mask(img):
+    """
+    0/255 mask from a cutout as read by cv2.imread(..., IMREAD_UNCHANGED):
+    the alpha channel of BGRA, otherwise a 127 threshold of the grayscale.
+    Returns (binary, description of the source channel).
+    """
     if len(img.shape) == 3 and img.shape[2] == 4:
         # Use alpha channel as mask
-        binary = (img[:, :, 3] > 127).astype(np.uint8) * 255
-        print("Created binary from alpha channel")
+        return (img[:, :, 3] > 127).astype(np.uint8) * 255, "alpha channel"
+    if len(img.shape) == 2:
+        # Already grayscale (e.g. a 0/255 mask or the trunk crop from width_of_trunk)
+        gray = img.astype(np.uint8) * 255 if img.dtype == bool else img
     else:
         # Convert to grayscale and threshold
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-        print("Created binary from grayscale")
-    
-    # Step 2: Find lines in binary image using Hough Transform
-    height, width = binary.shape
-    
-    # Focus on lower 50% for trunk
-    trunk_start = int(height * 0.5)
-    trunk_binary = binary.copy()
-    trunk_binary[:trunk_start, :] = 0  # Zero out upper portion
-    
-    # Detect lines
-    lines = cv2.HoughLinesP(trunk_binary, 1, np.pi/180, threshold=30, 
-                            minLineLength=max(30, int(height * 0.15)), maxLineGap=20)
+    _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+    return binary, "grayscale"
+
+
+def tilt_from_lines(analysis_binary, scale, height, width, log=_silent):
+    """
+    Hough stage of detect_tree_tilt on a 0/255 mask that is already at the
+    analysis resolution (scale = analysis size / original size) of an
+    height x width original.
+
+    Returns (tilt_angle, trunk_lines, x_at_bottom, line_lengths,
+    weighted_bottom_x) in original pixel coordinates, or None.
+    """
+    analysis_height = analysis_binary.shape[0]
+
+    with profiling.span("tilt.hough"):
+        trunk_binary = analysis_binary.copy()
+        trunk_binary[:int(analysis_height * (1 - TRUNK_FRACTION)), :] = 0  # Zero out upper portion
+        
+        # Detect lines
+        lines = cv2.HoughLinesP(trunk_binary, 1, np.pi/180,
+                                threshold=scale_length(HOUGH_THRESHOLD, scale),
+                                minLineLength=max(scale_length(MIN_LINE_LENGTH, scale), int(analysis_height * MIN_LINE_FRACTION)),
+                                maxLineGap=scale_length(MAX_LINE_GAP, scale))
     
     if lines is None:
-        print("No lines detected in binary image")
+        log("No lines detected in binary image")
         return None
     
-    print(f"Detected {len(lines)} lines")
+    log(f"Detected {len(lines)} lines")
     
     # Step 3: Find where each line intersects the bottom of the image
-    bottom_y = height - 1
     center_x = width / 2
     
-    intersections = []
-    trunk_lines = []
-    
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        
-        # Calculate angle from horizontal
-        dx = x2 - x1
-        dy = y2 - y1
+    with profiling.span("tilt.filter"):
+        trunk_lines, x_at_bottom, line_lengths = filter_trunk_lines(lines, analysis_height)
         
-        if dx == 0:
-            angle_from_horizontal = 90
-        else:
-            angle_from_horizontal = abs(math.degrees(math.atan2(dy, dx)))
-        
-        # Only process somewhat vertical lines
-        if angle_from_horizontal > 30:
-            # Extend line to bottom of image
-            # Line equation: y - y1 = m(x - x1), solve for x when y = bottom_y
-            if dy != 0:
-                slope = dx / dy
-                x_at_bottom = x1 + slope * (bottom_y - y1)
-                
-                # Calculate distance from center
-                distance_from_center = x_at_bottom - center_x
-                
-                line_length = math.sqrt(dx**2 + dy**2)
-                actual_angle = math.degrees(math.atan2(dy, dx))
-                
-                intersections.append((x_at_bottom, distance_from_center, line_length))
-                trunk_lines.append((x1, y1, x2, y2, actual_angle, line_length, x_at_bottom))
-                
-                print(f"  Line intersects bottom at x={x_at_bottom:.1f}, distance from center: {distance_from_center:.1f}")
-    
-    if not intersections:
-        print("No valid trunk lines found")
+        # Back to original pixel coordinates
+        if scale != 1.0:
+            trunk_lines = np.round(trunk_lines / scale).astype(trunk_lines.dtype)
+            x_at_bottom = x_at_bottom / scale
+            line_lengths = line_lengths / scale
+    
+    if len(trunk_lines) == 0:
+        log("No valid trunk lines found")
         return None
     
-    print(f"Found {len(trunk_lines)} trunk lines")
+    for x_bottom in x_at_bottom:
+        log(f"  Line intersects bottom at x={x_bottom:.1f}, distance from center: {x_bottom - center_x:.1f}")
+    log(f"Found {len(trunk_lines)} trunk lines")
     
     # Calculate weighted average bottom intersection point (weighted by line length)
-    total_weight = sum(intersection[2] for intersection in intersections)
-    weighted_bottom_x = sum(intersection[0] * intersection[2] for intersection in intersections) / total_weight
+    weighted_bottom_x = float(np.dot(x_at_bottom, line_lengths) / line_lengths.sum())
     
     # Calculate tilt angle based on where trunk hits bottom vs center
     # Positive angle = tilted right, negative = tilted left
@@ -104,16 +136,169 @@ def detect_tree_tilt(image_path):
     # Using full height as vertical distance for the angle calculation
     tilt_angle = math.degrees(math.atan(offset_from_center / height))
     
-    print(f"Weighted bottom intersection: x={weighted_bottom_x:.1f}")
-    print(f"Center x: {center_x:.1f}")
-    print(f"Offset from center: {offset_from_center:.1f} pixels")
-    print(f"Tilt angle: {tilt_angle:.2f}°")
+    log(f"Weighted bottom intersection: x={weighted_bottom_x:.1f}")
+    log(f"Center x: {center_x:.1f}")
+    log(f"Offset from center: {offset_from_center:.1f} pixels")
+    log(f"Tilt angle: {tilt_angle:.2f}°")
+    return tilt_angle, trunk_lines, x_at_bottom, line_lengths, weighted_bottom_x
+
+
+def tilt_fit(analysis_binary, weighted_bottom_x, scale):
+    """
+    How well a tilt follows the trunk, from 0 to 1: over the rows of the
+    trunk band (width_of_trunk.find_trunk_band), how far the tilt line is
+    from the band's centerline relative to the band's half width, as the
+    mean of 1 - distance / half width (0 once the line leaves the band).
+    The tilt line runs from the top center of the image to the weighted
+    bottom intersection, which is the line whose angle tilt_from_lines
+    reports. Only the row extents of the mask are needed, so scoring costs
+    a fraction of a Hough pass. 0 when the mask has no trunk band.
+
+    weighted_bottom_x is in original pixels; scale is that of analysis_binary.
+    """
+    height, width = analysis_binary.shape
+    left, right, has_pixels = get_row_extents(analysis_binary > 0)
+    widths = np.where(has_pixels, right - left, 0).astype(float)
+    try:
+        band = find_trunk_band(widths, scale)
+    except ValueError:
+        return 0.0
+    centerline, half_widths = band_centerline(left, right, has_pixels, band)
+    rows = np.arange(band.start, band.stop)[has_pixels[band]]
+    centerline = centerline[has_pixels[band]]
+    half_widths = half_widths[has_pixels[band]]
+    line_x = width / 2 + (weighted_bottom_x * scale - width / 2) * (rows + 0.5) / height
+    distance = np.abs(line_x - centerline) / half_widths
+    return float(np.clip(1 - distance, 0, 1).mean())
+
+
+@profiling.profiled("tilt.refine")
+def refine_tilt(binary, analysis_long_side=None, levels=REFINE_LONG_SIDES, min_fit=MIN_TILT_FIT, log=_silent,
+                scale=1.0, original_shape=None):
+    """
+    Coarse-to-fine tilt_from_lines: the Hough stage runs on the mask
+    downsampled to each long side in levels, then at analysis_long_side
+    (full resolution when None), and stops at the first level whose tilt
+    fits the trunk (tilt_fit >= min_fit). When no level fits, the finest
+    level's tilt is used, as detect_tree_tilt finds it without refinement.
+
+    binary may itself be a downsampled copy (e.g. from mask_strips.scan_mask)
+    at scale of an original_shape (h, w) mask; the levels are then taken
+    below its size and the tilt is still in original pixels.
+
+    Returns (result of tilt_from_lines, fit, scale of the level used), or
+    None when the finest level finds no trunk lines. fit is None at the
+    finest level, whose tilt is used whatever it is, so it isn't scored.
+    """
+    height, width = original_shape or binary.shape
+    finest = analysis_long_side or max(binary.shape)
+    long_sides = [side for side in levels if side < finest] + [analysis_long_side]
+
+    for i, long_side in enumerate(long_sides):
+        with profiling.span("tilt.level", long_side=long_side or max(binary.shape)):
+            analysis_binary, level_scale = downsample_mask(binary, long_side)
+            level_scale *= scale
+            result = tilt_from_lines(analysis_binary, level_scale, height, width)
+            if i == len(long_sides) - 1:
+                break
+            fit = tilt_fit(analysis_binary, result[4], level_scale) if result is not None else 0.0
+        log(f"Level {analysis_binary.shape[1]}x{analysis_binary.shape[0]}: "
+            + (f"tilt {result[0]:.2f}°, fit {fit:.2f}" if result is not None else "no trunk lines"))
+        if fit >= min_fit:
+            return result, fit, level_scale
+
+    if result is None:
+        return None
+    log(f"Level {analysis_binary.shape[1]}x{analysis_binary.shape[0]}: tilt {result[0]:.2f}°")
+    return result, None, level_scale
+
+
+@profiling.profiled("tilt")
+def detect_tree_tilt(image_path, quiet=False, analysis_long_side=None, visualize=True, refine=False):
+    """
+    Estimate the tilt of the tree in a segmented mask from the Hough lines of
+    its lower half.
+
+    image_path: a cutout/mask file, or the same image already in memory as
+    an array (BGRA, BGR, grayscale or a 0/255 / boolean mask).
+
+    analysis_long_side: if set, the Hough stage runs on a copy of the mask
+    downsampled so its long side is this many pixels, with the Hough
+    parameters scaled to match. Lines, the visualization and the returned
+    binary are in original pixel coordinates either way.
+    visualize: draw result_img; when False result_img is None.
+    refine: find the tilt coarse-to-fine with refine_tilt, which stops at
+    a low resolution when its tilt already fits the trunk.
+
+    Returns (tilt_angle, result_img, binary, trunk_lines_count) or None.
+    """
+    log = _silent if quiet else print
+    
+    if isinstance(image_path, np.ndarray):
+        img = image_path
+    else:
+        # Check if file exists
+        if not os.path.exists(image_path):
+            print(f"ERROR: File does not exist: {image_path}")
+            return None
+        
+        # Read the image with alpha channel
+        with profiling.span("tilt.load"):
+            img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        
+        if img is None:
+            print(f"ERROR: Could not read image from {image_path}")
+            return None
     
+    log(f"Image shape: {img.shape}")
+    
+    # Step 1: Convert to binary image
+    with profiling.span("tilt.binarize"):
+        binary, source = binarize_mask(img)
+    log(f"Created binary from {source}")
+    
+    # Step 2: Find lines in binary image using Hough Transform
+    height, width = binary.shape
+    
+    # Focus on the lower part for the trunk
+    trunk_start = int(height * (1 - TRUNK_FRACTION))
+    if refine:
+        refined = refine_tilt(binary, analysis_long_side, log=log)
+        if refined is None:
+            log("No valid trunk lines found")
+            return None
+        result, _, _ = refined
+    else:
+        analysis_binary, scale = downsample_mask(binary, analysis_long_side)
+        if scale != 1.0:
+            log(f"Analyzing at {analysis_binary.shape[1]}x{analysis_binary.shape[0]} (scale {scale:.3f})")
+
+        result = tilt_from_lines(analysis_binary, scale, height, width, log)
+        if result is None:
+            return None
+    tilt_angle, trunk_lines, x_at_bottom, line_lengths, weighted_bottom_x = result
+
+    trunk_lines_count = len(trunk_lines)
+    if not visualize:
+        return tilt_angle, None, binary, trunk_lines_count
+    
+    with profiling.span("tilt.draw"):
+        result_img = draw_tilt(binary, trunk_lines, x_at_bottom, line_lengths, trunk_start,
+                               weighted_bottom_x, tilt_angle)
+    return tilt_angle, result_img, binary, trunk_lines_count
+
+
+def draw_tilt(binary, trunk_lines, x_at_bottom, line_lengths, trunk_start, weighted_bottom_x, tilt_angle):
+    """The trunk lines, their extensions and the tilt drawn over the binary mask (BGR)."""
+    height, width = binary.shape
+    bottom_y = height - 1
+    center_x = width / 2
+
     # Visualize
     result_img = cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
     
     # Draw all detected trunk lines
-    for x1, y1, x2, y2, _, length, x_bottom in trunk_lines:
+    for (x1, y1, x2, y2), length, x_bottom in zip(trunk_lines.tolist(), line_lengths, x_at_bottom):
         # Color by length - longer lines are brighter
         intensity = min(255, int(100 + (length / height) * 155))
         cv2.line(result_img, (x1, y1), (x2, y2), (0, intensity, 0), 2)
@@ -141,5 +326,4 @@ def detect_tree_tilt(image_path):
                 (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
     cv2.putText(result_img, f'{len(trunk_lines)} lines', 
                 (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-    trunk_lines_count = len(trunk_lines)
-    return tilt_angle, result_img, binary, trunk_lines_count
\ No newline at end of file
+    return result_img
\ No newline at end of file
@@ -0,0 +1,391 @@
+import argparse
+import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+
+import cutout_paths
+import tree_session
+
+# Survey folders are named after the survey date, e.g. 10-21-2025
+SURVEY_DATE_PATTERN = re.compile(r"^(\d{1,2})-(\d{1,2})-(\d{4})$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    tree_id TEXT NOT NULL,
+    survey_date TEXT NOT NULL,
+    session TEXT NOT NULL,
+    tilt REAL NOT NULL,
+    trunk_start INTEGER,
+    trunk_end INTEGER,
+    risk_score REAL NOT NULL,
+    category TEXT NOT NULL,
+    views_used INTEGER NOT NULL,
+    PRIMARY KEY (tree_id, session)
+);
+CREATE INDEX IF NOT EXISTS history_tree_date ON history (tree_id, survey_date);
+CREATE INDEX IF NOT EXISTS history_date ON history (survey_date);
+
+CREATE TABLE IF NOT EXISTS ingested_images (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    session TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ingested_masks (
+    mask TEXT PRIMARY KEY,
+    survey_date TEXT NOT NULL,
+    session TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS skipped_sessions (
+    session TEXT PRIMARY KEY,
+    survey_date TEXT NOT NULL,
+    tree_id TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    inputs TEXT NOT NULL
+);
+"""
+
+
+def normalize_tree_id(tree):
+    """Cherry_Tree, cherry tree and Cherry are one tree; Norway_Spruce_Tree is Norway_Spruce."""
+    tree_id = re.sub(r"[\s\-]+", "_", tree.strip().lower())
+    if tree_id.endswith("_tree") and len(tree_id) > len("_tree"):
+        tree_id = tree_id[:-len("_tree")]
+    return tree_id
+
+
+def parse_survey_date(path):
+    """ISO date of the closest M-D-YYYY folder above path, or None."""
+    for part in reversed(os.path.normpath(os.path.abspath(path)).split(os.sep)):
+        match = SURVEY_DATE_PATTERN.match(part)
+        if match:
+            month, day, year = map(int, match.groups())
+            return datetime.date(year, month, day).isoformat()
+    return None
+
+
+class TreeHistory:
+    """Per-tree tilt history across survey dates, in one SQLite file."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    # ------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------
+    def is_ingested(self, session):
+        """True when every photo of the session was ingested before and hasn't changed since."""
+        for _, image_path in session.views:
+            stat = os.stat(image_path)
+            row = self.connection.execute(
+                "SELECT size, mtime FROM ingested_images WHERE path = ?", (os.path.abspath(image_path),)
+            ).fetchone()
+            if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime:
+                return False
+        return True
+
+    def session_inputs(self, session):
+        """
+        Fingerprint of what a session's analysis depends on: every photo's
+        size and mtime and the cutout find_cutout resolves it to. A skipped
+        session is analyzed again once this changes, e.g. after its photos
+        were segmented.
+        """
+        digest = hashlib.sha1()
+        for _, image_path in sorted(session.views, key=lambda view: view[1]):
+            stat = os.stat(image_path)
+            try:
+                mask_path = cutout_paths.find_cutout(image_path)
+                mask = "none" if mask_path is None else f"{os.path.abspath(mask_path)}|{os.stat(mask_path).st_mtime}"
+            except cutout_paths.AmbiguousCutoutError:
+                mask = "ambiguous"
+            digest.update(f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime}|{mask}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def skipped_reason(self, session, inputs):
+        """Why the session was skipped last time, or None if it wasn't or its inputs changed since."""
+        row = self.connection.execute(
+            "SELECT reason, inputs FROM skipped_sessions WHERE session = ?", (os.path.abspath(session.folder),)
+        ).fetchone()
+        if row is None or row[1] != inputs:
+            return None
+        return row[0]
+
+    def record_skipped(self, session, survey_date, reason, inputs):
+        """Remember a session that couldn't be added, so later ingests don't analyze it again for nothing."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO skipped_sessions (session, survey_date, tree_id, reason, inputs) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (os.path.abspath(session.folder), survey_date, normalize_tree_id(session.tree), reason, inputs),
+        )
+        self.connection.commit()
+
+    def mask_conflicts(self, session, survey_date, views):
+        """
+        Views whose cutout was already ingested for another session, or is
+        shared with another view of this one. Two dates analyzed on one
+        cutout would show the tree not moving at all.
+        Returns [(image_path, mask_path, survey_date it was used for), ...].
+        """
+        conflicts = []
+        session_key = os.path.abspath(session.folder)
+        masks = {}
+        for view in views:
+            if view["mask"] is None:
+                continue
+            mask_path = os.path.abspath(view["mask"])
+            if mask_path in masks:
+                conflicts.append((view["image"], mask_path, survey_date))
+                continue
+            masks[mask_path] = view["image"]
+            row = self.connection.execute(
+                "SELECT survey_date, session FROM ingested_masks WHERE mask = ?", (mask_path,)
+            ).fetchone()
+            if row is not None and row[1] != session_key:
+                conflicts.append((view["image"], mask_path, row[0]))
+        return conflicts
+
+    def record(self, session, survey_date, combined, views):
+        """Store the combined result of one session and mark its photos ingested."""
+        session_key = os.path.abspath(session.folder)
+        # Band of the best supported view, the main one unless it failed
+        band_view = max(
+            (view for view in views if view["error"] is None),
+            key=lambda view: (view["view"] == "main", view["trunk_lines_count"]),
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO history (tree_id, survey_date, session, tilt, trunk_start, trunk_end, "
+            "risk_score, category, views_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (normalize_tree_id(session.tree), survey_date, session_key, combined["tilt"],
+             band_view["trunk_start"], band_view["trunk_end"], combined["risk_score"],
+             combined["category"], combined["views_used"]),
+        )
+        for _, image_path in session.views:
+            stat = os.stat(image_path)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ingested_images (path, size, mtime, session) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(image_path), stat.st_size, stat.st_mtime, session_key),
+            )
+        for view in views:
+            if view["mask"] is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO ingested_masks (mask, survey_date, session) VALUES (?, ?, ?)",
+                    (os.path.abspath(view["mask"]), survey_date, session_key),
+                )
+        self.connection.execute("DELETE FROM skipped_sessions WHERE session = ?", (session_key,))
+        self.connection.commit()
+
+    def ingest(self, source, workers=None, executor_kind="thread", method="weighted", use_cutout=False,
+               analysis_long_side=None, auto=False, store_path=None):
+        """
+        Analyze the tree sessions under source that aren't in the history yet
+        (or whose photos changed) and add them. Sessions outside a dated
+        survey folder, without any usable view, or with a view analyzed on a
+        cutout already ingested for another session (see mask_conflicts) are
+        skipped. Skipped sessions are recorded with their reason and only
+        analyzed again once their photos or cutouts change.
+        Returns (sessions added, sessions already ingested, sessions skipped).
+        """
+        added = unchanged = skipped = 0
+        with tree_session.make_executor(workers, executor_kind) as executor:
+            for session in tree_session.discover_sessions(source):
+                survey_date = parse_survey_date(session.folder)
+                if survey_date is None:
+                    print(f"SKIP {session.folder}: not inside a M-D-YYYY survey folder")
+                    skipped += 1
+                    continue
+                if self.is_ingested(session):
+                    unchanged += 1
+                    continue
+                inputs = self.session_inputs(session)
+                reason = self.skipped_reason(session, inputs)
+                if reason is not None:
+                    print(f"SKIP {session.tree} {survey_date} (unchanged since the last ingest): {reason}")
+                    skipped += 1
+                    continue
+
+                result = tree_session.analyze_session(session, executor, method, use_cutout,
+                                                      analysis_long_side, auto, store_path)
+                if result["combined"] is None:
+                    reason = "; ".join(sorted({view["error"] for view in result["views"] if view["error"]}))
+                    print(f"SKIP {session.tree} {survey_date}: {reason}")
+                    self.record_skipped(session, survey_date, reason, inputs)
+                    skipped += 1
+                    continue
+
+                conflicts = self.mask_conflicts(session, survey_date, result["views"])
+                if conflicts:
+                    reasons = [f"{image_path} resolved to {mask_path}, already used for {other_date}; "
+                               f"segment it again" for image_path, mask_path, other_date in conflicts]
+                    for reason in reasons:
+                        print(f"SKIP {session.tree} {survey_date}: {reason}")
+                    self.record_skipped(session, survey_date, "; ".join(reasons), inputs)
+                    skipped += 1
+                    continue
+
+                self.record(session, survey_date, result["combined"], result["views"])
+                print(f"{normalize_tree_id(session.tree)} {survey_date}: tilt {result['combined']['tilt']:.2f}°")
+                added += 1
+        return added, unchanged, skipped
+
+    # ------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------
+    def history(self, tree_id):
+        """[(survey_date, tilt, trunk_start, trunk_end, risk_score, category), ...] oldest first."""
+        return self.connection.execute(
+            "SELECT survey_date, tilt, trunk_start, trunk_end, risk_score, category FROM history "
+            "WHERE tree_id = ? ORDER BY survey_date, session",
+            (normalize_tree_id(tree_id),),
+        ).fetchall()
+
+    def skipped(self):
+        """[(tree_id, survey_date, session, reason), ...] of the sessions the last ingests couldn't add."""
+        return self.connection.execute(
+            "SELECT tree_id, survey_date, session, reason FROM skipped_sessions ORDER BY tree_id, survey_date"
+        ).fetchall()
+
+    def lean_rates(self, min_surveys=2, tree_id=None):
+        """
+        Least-squares change of tilt per year for every tree (or only
+        tree_id) with at least min_surveys survey dates, fastest leaning first.
+        Returns [(tree_id, degrees_per_year, observations, first_date, last_date), ...].
+        """
+        # Days since the first survey keeps the sums small enough to stay exact
+        rows = self.connection.execute(
+            """
+            WITH points AS (
+                SELECT tree_id, survey_date, tilt,
+                       julianday(survey_date) - julianday(MIN(survey_date) OVER (PARTITION BY tree_id)) AS x
+                FROM history
+                WHERE ? IS NULL OR tree_id = ?
+            )
+            SELECT tree_id,
+                   (COUNT(*) * SUM(x * tilt) - SUM(x) * SUM(tilt)) /
+                   NULLIF(COUNT(*) * SUM(x * x) - SUM(x) * SUM(x), 0) AS slope,
+                   COUNT(*), MIN(survey_date), MAX(survey_date)
+            FROM points
+            GROUP BY tree_id
+            HAVING COUNT(DISTINCT survey_date) >= ?
+            ORDER BY slope DESC
+            """,
+            (tree_id, tree_id, min_surveys),
+        ).fetchall()
+        return [(tree_id, slope * 365.25, count, first, last) for tree_id, slope, count, first, last in rows]
+
+    def lean_rate(self, tree_id):
+        """Degrees per year for one tree, or None with fewer than two survey dates."""
+        rates = self.lean_rates(tree_id=normalize_tree_id(tree_id))
+        return rates[0][1] if rates else None
+
+    def changed_trees(self, min_change, since=None, until=None):
+        """
+        Trees whose tilt changed by more than min_change degrees between their
+        first and last survey in [since, until] (ISO dates, both optional).
+        Returns [(tree_id, first_date, first_tilt, last_date, last_tilt, change), ...].
+        """
+        return self.connection.execute(
+            """
+            WITH window AS (
+                SELECT tree_id, survey_date, tilt,
+                       ROW_NUMBER() OVER (PARTITION BY tree_id ORDER BY survey_date, session) AS first_rank,
+                       ROW_NUMBER() OVER (PARTITION BY tree_id ORDER BY survey_date DESC, session DESC) AS last_rank
+                FROM history
+                WHERE survey_date >= COALESCE(?, '0000-00-00') AND survey_date <= COALESCE(?, '9999-99-99')
+            )
+            SELECT first.tree_id, first.survey_date, first.tilt, last.survey_date, last.tilt,
+                   last.tilt - first.tilt AS change
+            FROM window AS first JOIN window AS last ON first.tree_id = last.tree_id
+            WHERE first.first_rank = 1 AND last.last_rank = 1
+              AND first.survey_date < last.survey_date
+              AND ABS(last.tilt - first.tilt) > ?
+            ORDER BY ABS(change) DESC
+            """,
+            (since, until, min_change),
+        ).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track tree tilt across survey dates.")
+    parser.add_argument("--db", default="tree_history.db", help="History database (default: tree_history.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Add the survey folders under a directory that aren't in the history yet")
+    ingest.add_argument("source", help="Directory with M-D-YYYY survey folders, or one survey folder")
+    ingest.add_argument("-j", "--workers", type=int, default=None)
+    ingest.add_argument("--executor", choices=("thread", "process"), default="thread")
+    ingest.add_argument("--method", choices=tree_session.COMBINE_METHODS, default="weighted")
+    ingest.add_argument("--use-cutout", action="store_true")
+    ingest.add_argument("--analysis-long-side", type=int, default=None)
+    ingest.add_argument("--auto-segment", action="store_true",
+                        help="Segment photos without a cutout with SAM2 and automatic prompts")
+    ingest.add_argument("--store", default=None, help="Result store shared with batch_runner --store")
+
+    show = commands.add_parser("show", help="Tilt history of one tree")
+    show.add_argument("tree")
+
+    commands.add_parser("rates", help="Lean rate of every tree surveyed more than once")
+
+    commands.add_parser("skipped", help="Sessions ingest couldn't add, and why")
+
+    changed = commands.add_parser("changed", help="Trees whose tilt changed by more than --degrees")
+    changed.add_argument("--degrees", type=float, default=2.0)
+    changed.add_argument("--since", default=None, help="ISO date, e.g. 2025-11-01")
+    changed.add_argument("--until", default=None, help="ISO date")
+
+    args = parser.parse_args(argv)
+    history = TreeHistory(args.db)
+    try:
+        if args.command == "ingest":
+            added, unchanged, skipped = history.ingest(
+                args.source, args.workers, args.executor, args.method, args.use_cutout,
+                args.analysis_long_side, args.auto_segment, args.store)
+            print(f"\n{added} sessions added, {unchanged} already in the history, {skipped} skipped")
+
+        elif args.command == "show":
+            rows = history.history(args.tree)
+            if not rows:
+                print(f"No history for {args.tree}")
+                return 1
+            print(f"{'date':10s} {'tilt':>7s} {'band':>13s} {'risk':>5s}  category")
+            for survey_date, tilt, start, end, score, category in rows:
+                print(f"{survey_date:10s} {tilt:6.2f}° {start:>6}-{end:<6} {score:5.1f}  {category}")
+            rate = history.lean_rate(args.tree)
+            if rate is not None:
+                print(f"\nLean rate: {rate:+.2f}°/year")
+
+        elif args.command == "rates":
+            print(f"{'tree':20s} {'deg/year':>9s} {'surveys':>8s}  period")
+            for tree_id, rate, count, first, last in history.lean_rates():
+                print(f"{tree_id:20s} {rate:+9.2f} {count:8d}  {first} to {last}")
+
+        elif args.command == "skipped":
+            rows = history.skipped()
+            print(f"{len(rows)} sessions skipped")
+            for tree_id, survey_date, session, reason in rows:
+                print(f"{tree_id:20s} {survey_date}  {session}\n    {reason}")
+
+        elif args.command == "changed":
+            rows = history.changed_trees(args.degrees, args.since, args.until)
+            print(f"{len(rows)} trees changed by more than {args.degrees}°")
+            for tree_id, first_date, first_tilt, last_date, last_tilt, change in rows:
+                print(f"{tree_id:20s} {first_tilt:6.2f}° ({first_date}) -> {last_tilt:6.2f}° ({last_date})  "
+                      f"{change:+.2f}°")
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import batch_runner
+import risk_score
+import sweep
+
+# Maple_Tree.png, Maple_Tree_1.png, Maple_Tree_Trunk.png, Sweetgum-leaves.png
+# and their cutouts (Maple_Tree_crop_out.png) all belong to one tree
+VIEW_PATTERN = re.compile(r"^(?P<tree>.+?)(?:[_-](?P<view>\d+|trunk|leaves))?$", re.IGNORECASE)
+
+# Views whose tilt says something about the tree. Leaves shots are close-ups
+# of the canopy, so their "tilt" is whatever the branches do.
+TILT_VIEWS = ("main", "angle", "trunk")
+
+COMBINE_METHODS = ("weighted", "median", "trimmed_mean")
+
+# Fraction cut from each end for the trimmed mean
+TRIM_PROPORTION = 0.2
+
+
+def parse_view(image_path):
+    """Returns (tree_name, view) for a photo or cutout, view being main/angle/trunk/leaves."""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    if stem.endswith("_crop_out"):
+        stem = stem[:-len("_crop_out")].rstrip("_")
+
+    match = VIEW_PATTERN.match(stem)
+    view = (match.group("view") or "").lower()
+    if not view:
+        view = "main"
+    elif view.isdigit():
+        view = "angle"
+    return match.group("tree").replace(" ", "_"), view
+
+
+class TreeSession:
+    """All the photos of one tree taken on one visit (one folder)."""
+
+    def __init__(self, tree, folder, views):
+        self.tree = tree
+        self.folder = folder
+        # [(view, image_path), ...]
+        self.views = sorted(views, key=lambda view: (view[0] != "main", view[1]))
+
+    def __repr__(self):
+        return f"TreeSession({self.tree!r}, {self.folder!r}, {len(self.views)} views)"
+
+
+def discover_sessions(source):
+    """Group the photos found by batch_runner.collect_images into one TreeSession per folder and tree."""
+    groups = {}
+    for image_path in batch_runner.collect_images(source):
+        tree, view = parse_view(image_path)
+        folder = os.path.dirname(image_path)
+        groups.setdefault((folder, tree), []).append((view, image_path))
+    return [TreeSession(tree, folder, views) for (folder, tree), views in sorted(groups.items())]
+
+
+def trimmed_mean(values, proportion=TRIM_PROPORTION):
+    values = np.sort(values)
+    cut = int(len(values) * proportion)
+    if len(values) - 2 * cut <= 0:
+        return float(np.median(values))
+    return float(values[cut:len(values) - cut].mean())
+
+
+def combine_tilts(records, method="weighted"):
+    """
+    Combine the per-view records of one tree into one tilt and risk score.
+
+    Only successful TILT_VIEWS records are used. Directions aren't comparable
+    between photos taken from different sides, so magnitudes are combined.
+    method picks which estimate feeds the risk score:
+        weighted     - mean weighted by trunk_lines_count (more lines, more trust)
+        median       - median over views
+        trimmed_mean - mean without the TRIM_PROPORTION highest and lowest
+
+    Returns a dict with all three estimates, the chosen tilt, the most
+    concerning sweep of the views, the risk score and category, or None
+    when no view produced a tilt.
+    """
+    if method not in COMBINE_METHODS:
+        raise ValueError(f"Unknown combine method {method!r}, choose from {', '.join(COMBINE_METHODS)}")
+
+    used = [record for record in records
+            if record["error"] is None and parse_view(record["image"])[1] in TILT_VIEWS]
+    if not used:
+        return None
+
+    tilts = np.abs([record["tilt"] for record in used])
+    lines = np.array([record["trunk_lines_count"] for record in used], dtype=float)
+
+    estimates = {
+        "weighted": float(np.average(tilts, weights=lines)) if lines.sum() > 0 else float(tilts.mean()),
+        "median": float(np.median(tilts)),
+        "trimmed_mean": trimmed_mean(tilts),
+    }
+    tilt = estimates[method]
+
+    # A lean one side shows may not show from another, so the most
+    # concerning sweep of any view counts
+    trunk_sweep = sweep.worst_sweep(record.get("sweep") for record in used)
+
+    # The low-confidence penalty applies when all views together found few lines
+    score = risk_score.give_risk_score(tilt, int(lines.sum()), sweep=trunk_sweep)
+    category, _ = risk_score.get_risk_category(score)
+
+    return {
+        "views_used": len(used),
+        "tilts": [round(float(t), 3) for t in tilts],
+        **{name: round(value, 3) for name, value in estimates.items()},
+        "method": method,
+        "tilt": round(tilt, 3),
+        "trunk_lines_count": int(lines.sum()),
+        "sweep": trunk_sweep,
+        "risk_score": score,
+        "category": category,
+    }
+
+
+def make_executor(workers=None, kind="thread"):
+    """
+    Pool shared by every session of a run. Threads share one SAM2 model (the
+    predictor lock serializes encoding); processes load one model each but
+    don't share the GIL.
+    """
+    workers = workers or os.cpu_count() or 1
+    if kind == "process":
+        return concurrent.futures.ProcessPoolExecutor(workers, initializer=batch_runner._init_worker)
+    return concurrent.futures.ThreadPoolExecutor(workers)
+
+
+def analyze_session(session, executor, method="weighted", use_cutout=False, analysis_long_side=None,
+                    auto=False, store_path=None):
+    """
+    Analyze every view of a session concurrently on executor and combine them.
+    store_path reuses stage results from a result_store database.
+    Returns a dict with the tree, the per-view records and the combined result.
+    """
+    threaded = isinstance(executor, concurrent.futures.ThreadPoolExecutor)
+    start = time.perf_counter()
+
+    futures = [
+        executor.submit(batch_runner.process_image, image_path, use_cutout, False, analysis_long_side,
+                        False, auto, not threaded, store_path)
+        for _, image_path in session.views
+    ]
+    records = [future.result() for future in futures]
+
+    return {
+        "tree": session.tree,
+        "folder": session.folder,
+        "views": [dict(record, view=view) for (view, _), record in zip(session.views, records)],
+        "combined": combine_tilts(records, method),
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Group photos by tree, analyze every view of a tree concurrently and combine them into one risk score."
+    )
+    parser.add_argument("source", help="Directory (searched recursively) or glob pattern of photos / *_crop_out.png masks")
+    parser.add_argument("-o", "--output", default="tree_sessions.jsonl", help="One JSON line per tree")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Pool size (default: all cores)")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--method", choices=COMBINE_METHODS, default="weighted",
+                        help="Which combined tilt feeds the risk score")
+    parser.add_argument("--use-cutout", action="store_true", help="Detect tilt on the trunk crop instead of the full mask")
+    parser.add_argument("--analysis-long-side", type=int, default=None,
+                        help="Downsample masks to this long side (pixels) before the width and tilt stages")
+    parser.add_argument("--auto-segment", action="store_true",
+                        help="Segment photos without a cutout with SAM2 and automatic prompts")
+    args = parser.parse_args(argv)
+
+    sessions = discover_sessions(args.source)
+    if not sessions:
+        print(f"No images found in {args.source}")
+        return 1
+    print(f"{len(sessions)} trees, {sum(len(s.views) for s in sessions)} photos")
+
+    start = time.perf_counter()
+    with make_executor(args.workers, args.executor) as executor, \
+            open(args.output, "w", encoding="utf-8") as f:
+        for session in sessions:
+            result = analyze_session(session, executor, args.method, args.use_cutout,
+                                     args.analysis_long_side, args.auto_segment)
+            f.write(json.dumps(result) + "\n")
+
+            combined = result["combined"]
+            views = ", ".join(view for view, _ in session.views)
+            if combined is None:
+                print(f"{session.tree} ({views}): no usable views")
+            else:
+                print(f"{session.tree} ({views}): tilt {combined['tilt']:.2f}° from {combined['views_used']} views "
+                      f"(median {combined['median']:.2f}°), {combined['sweep']} sweep, "
+                      f"risk {combined['risk_score']} {combined['category']} "
+                      f"in {result['seconds']:.2f}s")
+
+    print(f"\nDone in {time.perf_counter() - start:.2f}s, results written to {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
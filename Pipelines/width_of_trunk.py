@@ -1,57 +1,78 @@
 import os
-from PIL import Image, ImageDraw
+import math
+from PIL import Image
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.signal import savgol_filter
+import cv2
+from downsample import downsample_mask, scale_window
+import profiling
 
-def get_trunk_width_analysis(mask_path):
-    # ---------------------------------------------------
-    # 1. Determine Paths Based on Your Structure
-    # ---------------------------------------------------
-    # Get the folder where this script is running (VitalArbor/Pipelines)
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # Go up one level to the root (VitalArbor)
-    root_dir = os.path.dirname(script_dir)
-    
-    # Define the target folder (VitalArbor/Segmented photos)
-    target_dir = os.path.join(root_dir, "Segmented photos")
-    
-    # Ensure the directory exists (just in case)
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
+# Smoothing window in rows at full resolution, and the polynomial order
+SAVGOL_WINDOW = 301
+SAVGOL_POLYORDER = 3
 
-    # ---------------------------------------------------
-    # 2. Load binary mask
-    # ---------------------------------------------------
-    img = Image.open(mask_path).convert("L")
-    mask = np.array(img)
+# Trunk rows: the smoothed width changes by less than this many pixels per
+# row and is narrower than this percentile of the whole profile
+STABLE_SLOPE_THRESHOLD = 0.5
+MAX_TRUNK_WIDTH_PERCENTILE = 50
 
-    mask_bin = (mask > 127).astype(np.uint8) * 255
-    h, w = mask_bin.shape
+_savgol_coeffs = {}
 
-    # ---------------------------------------------------
-    # 3. Compute width profile
-    # ---------------------------------------------------
-    widths = np.zeros(h)
-    for row in range(h):
-        cols = np.where(mask_bin[row] > 0)[0]
-        if len(cols) > 0:
-            widths[row] = cols.max() - cols.min()
-        else:
-            widths[row] = 0
 
-    # ---------------------------------------------------
-    # 4. Smooth & Detect Trunk
-    # ---------------------------------------------------
-    smoothed = savgol_filter(widths, window_length=301, polyorder=3, mode="interp")
-    slope = np.abs(np.gradient(smoothed))
+def savgol_smooth(values, window, polyorder=3):
+    """
+    Same result as scipy.signal.savgol_filter(values, window, polyorder,
+    mode="interp"), in numpy only: importing scipy.signal takes longer than
+    analyzing a mask. The ends, where the window doesn't fit, come from a
+    polynomial fit to the first/last window of values.
+    """
+    values = np.asarray(values, dtype=float)
+    if window % 2 == 0 or window <= polyorder or window > len(values):
+        raise ValueError(f"window must be odd, longer than polyorder and at most {len(values)}, got {window}")
 
-    stable_slope_thresh = 0.5
-    max_trunk_width = np.percentile(smoothed, 50)
+    coeffs = _savgol_coeffs.get((window, polyorder))
+    if coeffs is None:
+        # Least-squares value at the window center of a polynomial fit
+        offsets = np.arange(window) - window // 2
+        coeffs = np.linalg.pinv(np.vander(offsets, polyorder + 1, increasing=True))[0]
+        _savgol_coeffs[(window, polyorder)] = coeffs
+
+    half = window // 2
+    smoothed = np.convolve(values, coeffs[::-1], mode="same")
+    positions = np.arange(window)
+    smoothed[:half] = np.polyval(np.polyfit(positions, values[:window], polyorder), positions[:half])
+    smoothed[-half:] = np.polyval(np.polyfit(positions, values[-window:], polyorder), positions[-half:])
+    return smoothed
+
+
+def get_row_extents(mask_bin):
+    """
+    First and last foreground column of every row, without a per-row loop.
+
+    Returns (left, right, has_pixels) arrays of length h. left/right are only
+    meaningful where has_pixels is True.
+    """
+    foreground = mask_bin > 0
+    has_pixels = foreground.any(axis=1)
+    left = np.argmax(foreground, axis=1)
+    right = foreground.shape[1] - 1 - np.argmax(foreground[:, ::-1], axis=1)
+    return left, right, has_pixels
+
+
+def find_trunk_band(widths, scale=1.0):
+    """
+    Rows of the trunk in a width profile: from the first to the last row
+    where the smoothed width is steady, nonzero and narrower than the median
+    (STABLE_SLOPE_THRESHOLD, MAX_TRUNK_WIDTH_PERCENTILE).
+    scale is the profile's resolution relative to the original, which sets
+    the smoothing window. Raises ValueError when there are no such rows.
+    """
+    window = scale_window(SAVGOL_WINDOW, scale, len(widths))
+    smoothed = savgol_smooth(widths, window, polyorder=SAVGOL_POLYORDER)
+    slope = np.abs(np.gradient(smoothed))
+    max_trunk_width = np.percentile(smoothed, MAX_TRUNK_WIDTH_PERCENTILE)
 
     stable_rows = np.where(
-        (slope < stable_slope_thresh) &
+        (slope < STABLE_SLOPE_THRESHOLD) &
         (smoothed < max_trunk_width) &
         (smoothed > 0)
     )[0]
@@ -59,62 +80,181 @@ def get_trunk_width_analysis(mask_path):
     if len(stable_rows) == 0:
         raise ValueError("No stable trunk region detected.")
 
-    trunk_start = stable_rows.min()
-    trunk_end = stable_rows.max()
-    print(f"Detected trunk band: rows {trunk_start} to {trunk_end}")
+    return slice(stable_rows.min(), stable_rows.max() + 1)
+
+
+def band_bounds(band, left, right, has_pixels, scale, h, w):
+    """
+    (trunk_start, trunk_end, x_min, x_max) in original pixels of an h x w
+    mask, from a band and row extents found at the analysis resolution.
+    """
+    band_has_pixels = has_pixels[band]
+
+    if not band_has_pixels.any():
+        raise ValueError("No trunk pixels found in detected band.")
+
+    # Map the band and columns back to original pixels, covering every
+    # original pixel that fed into the analysis pixels at the edges
+    trunk_start = int(band.start / scale)
+    trunk_end = min(math.ceil(band.stop / scale) - 1, h - 1)
+    x_min = max(int(left[band][band_has_pixels].min() / scale), 0)
+    x_max = min(math.ceil((right[band][band_has_pixels].max() + 1) / scale) - 1, w - 1)
+    return trunk_start, trunk_end, x_min, x_max
+
+
+def band_centerline(left, right, has_pixels, band):
+    """
+    (centerline, half_widths) of the rows in band, from row extents: the
+    center column of every row (NaN where it has no pixels) and its half
+    width (0 there).
+    """
+    centerline = (left[band] + right[band]) / 2.0
+    centerline[~has_pixels[band]] = np.nan
+    half_widths = np.where(has_pixels[band], (right[band] - left[band] + 1) / 2.0, 0.0)
+    return centerline, half_widths
+
+
+@profiling.profiled("width")
+def analyze_trunk_width(mask, rgb=None, analysis_long_side=None, visualize=False, log=print):
+    """
+    Find the trunk band of a mask held in memory.
+
+    mask: HxW boolean mask, or uint8 with foreground > 127 (a 0/255 mask,
+        or a grayscale cutout)
+    rgb: optional HxWx3 photo/cutout aligned with mask, cropped like the mask
+    analysis_long_side: if set, the width profile is computed on a copy of
+        the mask downsampled so its long side is this many pixels, with the
+        smoothing window scaled to match. The band and crop are mapped back
+        to original pixel coordinates.
+    visualize: also render the red/green row-extent visualization
+
+    Returns a dict with the width profile ("widths", at the analysis
+    resolution), the band ("trunk_start", "trunk_end", "x_min", "x_max"),
+    the "centerline" and "half_widths" of the band rows (analysis
+    resolution, for sweep.classify_sweep), the cropped "trunk_mask" /
+    "trunk_rgb" and "visualization" (or None).
+    """
+    foreground = mask if mask.dtype == bool else mask > 127
+    mask_bin = foreground.astype(np.uint8) * 255
+    h, w = mask_bin.shape
 
     # ---------------------------------------------------
-    # 5. Crop Logic
+    # 1. Compute width profile (at the analysis resolution)
     # ---------------------------------------------------
-    trunk_cols = []
-    for row in range(trunk_start, trunk_end + 1):
-        cols = np.where(mask_bin[row] > 0)[0]
-        if len(cols) > 0:
-            trunk_cols.extend([cols.min(), cols.max()])
+    with profiling.span("width.profile"):
+        analysis_mask, scale = downsample_mask(mask_bin, analysis_long_side)
 
-    if not trunk_cols:
-        raise ValueError("No trunk pixels found in detected band.")
+        # Computed once and reused by the crop and the visualization
+        left, right, has_pixels = get_row_extents(analysis_mask)
+        widths = np.where(has_pixels, right - left, 0).astype(float)
 
-    x_min = max(min(trunk_cols), 0)
-    x_max = min(max(trunk_cols), w - 1)
+    # ---------------------------------------------------
+    # 2. Smooth & Detect Trunk
+    # ---------------------------------------------------
+    # Width/row slopes don't change with scale, only the window length does
+    with profiling.span("width.savgol"):
+        band = find_trunk_band(widths, scale)
+
+    # ---------------------------------------------------
+    # 3. Crop Logic
+    # ---------------------------------------------------
+    with profiling.span("width.crop"):
+        trunk_start, trunk_end, x_min, x_max = band_bounds(band, left, right, has_pixels, scale, h, w)
+        log(f"Detected trunk band: rows {trunk_start} to {trunk_end}")
+
+        # Same box as PIL's crop((x_min, trunk_start, x_max, trunk_end))
+        crop = (slice(trunk_start, trunk_end), slice(x_min, x_max))
+
+        # The row extents give the trunk centerline for the sweep for free
+        centerline, half_widths = band_centerline(left, right, has_pixels, band)
+
+    # ---------------------------------------------------
+    # 4. Visualization Logic
+    # ---------------------------------------------------
+    visualization = None
+    if visualize:
+        with profiling.span("width.visualize"):
+            # Each row's extent is painted red, or green inside the trunk band.
+            # Everything outside a row's extent is background, so a 3-color palette
+            # image (0 = black, 1 = red, 2 = green) is the whole visualization.
+            columns = np.arange(analysis_mask.shape[1])
+            span = has_pixels[:, None] & (columns >= left[:, None]) & (columns <= right[:, None])
+            labels = span.astype(np.uint8)
+            labels[band] *= 2
+            if scale != 1.0:
+                labels = cv2.resize(labels, (w, h), interpolation=cv2.INTER_NEAREST)
 
+            vis_img = Image.fromarray(labels)
+            vis_img.putpalette([0, 0, 0, 255, 0, 0, 0, 255, 0])
+            visualization = np.asarray(vis_img.convert("RGB"))
+
+    return {
+        "widths": widths,
+        "trunk_start": trunk_start,
+        "trunk_end": trunk_end,
+        "x_min": x_min,
+        "x_max": x_max,
+        "centerline": centerline,
+        "half_widths": half_widths,
+        "trunk_mask": mask[crop],
+        "trunk_rgb": None if rgb is None else rgb[crop],
+        "visualization": visualization,
+    }
+
+
+def get_trunk_width_analysis(mask_path, analysis_long_side=None):
+    """
+    Find the trunk band of a segmented mask file and save the trunk crop and a
+    visualization to "Segmented photos". Returns the path of the crop.
+    See analyze_trunk_width for the in-memory version.
+    """
     # ---------------------------------------------------
-    # 6. Save Logic (Using target_dir)
+    # 1. Determine Paths Based on Your Structure
+    # ---------------------------------------------------
+    # Get the folder where this script is running (VitalArbor/Pipelines)
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Go up one level to the root (VitalArbor)
+    root_dir = os.path.dirname(script_dir)
+
+    # Define the target folder (VitalArbor/Segmented photos)
+    target_dir = os.path.join(root_dir, "Segmented photos")
+
+    # Ensure the directory exists (just in case)
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+
+    # ---------------------------------------------------
+    # 2. Load mask & analyze
+    # ---------------------------------------------------
+    with profiling.span("width.load"):
+        img = Image.open(mask_path).convert("L")
+        mask = np.array(img)
+
+    result = analyze_trunk_width(mask, analysis_long_side=analysis_long_side, visualize=True)
+
+    # ---------------------------------------------------
+    # 3. Save Logic (Using target_dir)
     # ---------------------------------------------------
     # Get the original filename (e.g. "tree1") from the path provided
     base_name = os.path.splitext(os.path.basename(mask_path))[0]
-    
+
     # Construct new filenames
     crop_name = f"{base_name}_trunk_part.png"
     vis_name = f"{base_name}_vis_trunk.png"
-    
+
     # Join them with the target directory path
     crop_save_path = os.path.join(target_dir, crop_name)
     vis_save_path = os.path.join(target_dir, vis_name)
 
-    # Save cropped image
-    cropped_trunk = img.crop((x_min, trunk_start, x_max, trunk_end))
-    cropped_trunk.save(crop_save_path)
-    print(f"Saved crop to: {crop_save_path}")
+    with profiling.span("width.save"):
+        # Save cropped image
+        Image.fromarray(result["trunk_mask"]).save(crop_save_path)
+        print(f"Saved crop to: {crop_save_path}")
+
+        Image.fromarray(result["visualization"]).save(vis_save_path)
+        print(f"Saved visualization to: {vis_save_path}")
 
-    # ---------------------------------------------------
-    # 7. Visualization Logic
-    # ---------------------------------------------------
-    vis_img = Image.fromarray(mask_bin).convert("RGB")
-    draw = ImageDraw.Draw(vis_img)
-
-    for row in range(h):
-        cols = np.where(mask_bin[row] > 0)[0]
-        if len(cols) > 0:
-            x1, x2 = cols.min(), cols.max()
-            color = (255, 0, 0)
-            if trunk_start <= row <= trunk_end:
-                color = (0, 255, 0)
-            draw.line([(x1, row), (x2, row)], fill=color, width=1)
-
-    vis_img.save(vis_save_path)
-    print(f"Saved visualization to: {vis_save_path}")
-    
     # Optional: Plotting code removed for brevity, add back if needed
-    
-    return crop_save_path
\ No newline at end of file
+
+    return crop_save_path